@@ -51,13 +51,20 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Per view request metrics, first so it times the whole middleware chain
+    'LittleLemonAPI.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
+    # Site middleware, skipped by /api/ requests in LITTLE_LEMON['API_MODE']
+    'LittleLemonAPI.middleware.SiteSessionMiddleware',
     'django.middleware.common.CommonMiddleware',
-    'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
-    'django.contrib.messages.middleware.MessageMiddleware',
-    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'LittleLemonAPI.middleware.SiteCsrfViewMiddleware',
+    'LittleLemonAPI.middleware.SiteAuthenticationMiddleware',
+    'LittleLemonAPI.middleware.SiteMessageMiddleware',
+    'LittleLemonAPI.middleware.SiteXFrameOptionsMiddleware',
+    # Native async views under ASGI
+    'LittleLemonAPI.middleware.AsyncRoutingMiddleware',
+    # On demand profiling of single requests, last so it only wraps the view
+    'LittleLemonAPI.middleware.RequestProfilingMiddleware',
     # 'debug_toolbar.middleware.DebugToolbarMiddleware'
 ]
 
@@ -101,6 +108,10 @@ DATABASES = {
 }
 
 
+# Tests tagged 'benchmark' only run with --tag benchmark
+TEST_RUNNER = 'LittleLemon.test_runner.TestRunner'
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
 
@@ -150,15 +161,17 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Add Renderer from DRF
 REST_FRAMEWORK = {
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
+        'LittleLemonAPI.renderers.FastJSONRenderer',
         'rest_framework.renderers.BrowsableAPIRenderer',
         'rest_framework_xml.renderers.XMLRenderer',
         'rest_framework_yaml.renderers.YAMLRenderer'
     ],
+    # Memoized negotiation, without the browsable API for /api/ in API mode
+    'DEFAULT_CONTENT_NEGOTIATION_CLASS': 'LittleLemonAPI.negotiation.ApiContentNegotiation',
     'DEFAULT_AUTHENTICATION_CLASSES': [
         # JWT
         # 'rest_framework_simplejwt.authentication.JWTAuthentication',
-        'rest_framework.authentication.TokenAuthentication',
+        'LittleLemonAPI.authentication.CachedTokenAuthentication',
         # Use the Django admin login simultaneously with a browsable API view of Djoser
         'rest_framework.authentication.SessionAuthentication'
     ],
@@ -182,3 +195,64 @@ DJOSER = {
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(days=5),
 }
+
+# LittleLemon API tuning, see LittleLemonAPI/utils/config.py for all options
+LITTLE_LEMON = {
+    'ORDERS_PAGE_SIZE': 20,
+    'ORDERS_MAX_PAGE_SIZE': 100,
+    'ORDERS_COUNT_CACHE_TIMEOUT': 60,
+    'ORDERS_EXPORT_CHUNK_SIZE': 500,
+    'DISPATCH_BATCH_SIZE': 1000,
+    'DISPATCH_MAX_LOAD': 10,
+    'MENU_IMPORT_CHUNK_SIZE': 1000,
+    'MENU_IMPORT_MAX_ROWS': 50000,
+    'MENU_ITEMS_PAGE_SIZE': 2,
+    'MENU_ITEMS_MAX_PAGE_SIZE': 100,
+    'MENU_ITEMS_COUNT_CACHE_TIMEOUT': 60,
+    'MENU_ITEMS_BOOKMARK_TIMEOUT': 300,
+    'MENU_ITEMS_MAX_OFFSET': 1000,
+    'ROLE_CACHE_TIMEOUT': 30,
+    'SEARCH_BACKEND': 'auto',
+    'SEARCH_MAX_RESULTS': 1000,
+    'TOP_RATED_PAGE_SIZE': 10,
+    'TOP_RATED_MAX_PAGE_SIZE': 100,
+    'TOP_RATED_MIN_COUNT': 3,
+    # Throttle counters in a SQLite file shared by the workers on this host,
+    # use the alias of a shared Django cache when running on several hosts
+    'THROTTLE_STORE': {
+        'BACKEND': 'sqlite',
+        'LOCATION': BASE_DIR / '.cache' / 'throttle.sqlite3',
+    },
+    'METRICS': {
+        'ENABLED': True,
+        'SERVER_TIMING': False,
+    },
+    # Production clients send tokens and want JSON, the browsable API is at /browse/
+    'API_MODE': {
+        'ENABLED': True,
+        'PREFIX': '/api/',
+    },
+    'PROFILING': {
+        'ENABLED': True,
+        'LOCATION': BASE_DIR / '.cache' / 'profiles',
+        'MAX_CAPTURES': 50,
+        'SAMPLE_RATE': 0.01,
+        'TOKEN_MAX_AGE': 3600,
+    },
+    # Resolved tokens, shared like the menu cache so a logout in one worker
+    # reaches the others
+    'TOKEN_CACHE': {
+        'BACKEND': 'file',
+        'LOCATION': BASE_DIR / '.cache' / 'auth',
+        'MAX_ENTRIES': 10000,
+        'TIMEOUT': 300,
+    },
+    # The file backend shares the catalogue version between workers on one host,
+    # use the alias of a shared Django cache when running on several hosts
+    'MENU_CACHE': {
+        'BACKEND': 'file',
+        'LOCATION': BASE_DIR / '.cache' / 'menu',
+        'MAX_ENTRIES': 1000,
+        'TIMEOUT': 300,
+    },
+}
@@ -0,0 +1,12 @@
+from django.test.runner import DiscoverRunner
+
+
+# Test runner that leaves out the tests tagged 'benchmark'
+# They time the API and print what they measured, so they only run when
+# asked for with: manage.py test --tag benchmark
+class TestRunner(DiscoverRunner):
+    OPT_IN_TAGS = {'benchmark'}
+
+    def __init__(self, *args, tags=None, exclude_tags=None, **kwargs):
+        exclude_tags = set(exclude_tags or ()) | (self.OPT_IN_TAGS - set(tags or ()))
+        super().__init__(*args, tags=tags, exclude_tags=exclude_tags, **kwargs)
@@ -19,6 +19,9 @@ from django.urls import include, path
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('LittleLemonAPI.urls')),
+    # The API again with the full site middleware, for the browsable API and
+    # session logins while /api/ runs in API mode
+    path('browse/', include(('LittleLemonAPI.urls', 'browse'))),
     # Djoser
     # path('auth/', include('djoser.urls')),
     # path('auth/', include('djoser.urls.authtoken')),
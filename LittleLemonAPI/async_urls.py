@@ -0,0 +1,15 @@
+from django.urls import path, include
+
+from . import async_views
+
+
+# URLconf of ASGI requests, set by AsyncRoutingMiddleware
+# The async views shadow the routes of their sync views, everything else
+# resolves through the project URLconf.
+urlpatterns = [
+    path('api/menu-items', async_views.MenuItemList.as_view()),
+    path('api/menu-items/<int:pk>', async_views.SingleMenuItemView.as_view()),
+    path('api/cart/menu-items', async_views.CartView.as_view()),
+    path('api/orders', async_views.OrderListView.as_view()),
+    path('', include('LittleLemon.urls')),
+]
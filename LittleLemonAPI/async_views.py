@@ -0,0 +1,155 @@
+from asgiref.sync import sync_to_async
+from django.http import HttpRequest, HttpResponse
+from django.utils.decorators import classonlymethod
+from django.views import View
+from rest_framework import exceptions, status
+from rest_framework.request import Request
+
+from . import views
+from .models import MenuItem, Cart
+from .renderers import FastJSONRenderer
+from .utils.caching import menu_cache
+from .utils.conditional import getETag, getNotModifiedResponse, setValidators
+from .utils.functions import getMenuItemsWithJsonType, getMenuItemValues, isCustomerAsync, isDeliveryCrewAsync, isManagerAsync, isRatingIncluded, formatDecimal
+from .utils.menu import getMenuItemListAsync, getMenuItemQuery, InvalidMenuQuery
+from .utils.orders import getOrderListAsync, getOrderListScope, getOrderListValidatorsAsync
+from .utils.pagination import InvalidCursor
+
+
+# Accept headers the JSON renderer is negotiated for without parameters
+JSON_ACCEPT = ('', '*/*', FastJSONRenderer.media_type)
+
+
+# Check the sync view would answer a request with plain JSON
+def isJsonRequest(request: HttpRequest):
+    return request.headers.get('Accept', '').strip() in JSON_ACCEPT and 'format' not in request.GET
+
+
+# Native async GET of a DRF view, served under ASGI by AsyncRoutingMiddleware
+# JSON GET and HEAD requests are answered with the async ORM. Around them
+# runs the DRF request handling of sync_view_class itself: its initial()
+# (negotiation, authentication, permissions, throttles) in one thread hop,
+# its handle_exception and finalize_response, so the body, status and
+# headers match the sync view. Every other method or renderer is handed to
+# sync_view_class in a thread.
+class AsyncAPIView(View):
+    sync_view_class = None
+    sync_view = None
+
+    @classonlymethod
+    def as_view(cls, **initkwargs):
+        sync_view = cls.sync_view_class.as_view()
+        view = super().as_view(sync_view=sync_view, **initkwargs)
+        view.csrf_exempt = True
+        return view
+
+    async def dispatch(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD') or not isJsonRequest(request):
+            return await sync_to_async(self.sync_view)(request, *args, **kwargs)
+        view = self.sync_view_class()
+        view.setup(request, *args, **kwargs)
+        request = view.initialize_request(request, *args, **kwargs)
+        view.request = request
+        view.headers = view.default_response_headers
+        try:
+            await sync_to_async(view.initial)(request, *args, **kwargs)
+            response = await super().dispatch(request, *args, **kwargs)
+        except Exception as exc:
+            response = await sync_to_async(view.handle_exception)(exc)
+        return view.finalize_response(request, response, *args, **kwargs)
+
+    # Rendered here as a plain response, which Django does not render again
+    # in a thread like a DRF Response
+    def render(self, data, status_code: int = status.HTTP_200_OK):
+        return HttpResponse(FastJSONRenderer().render(data), status=status_code,
+                            content_type=FastJSONRenderer.media_type)
+
+
+class MenuItemList(AsyncAPIView):
+    sync_view_class = views.MenuItemList
+
+    async def get(self, request: Request):
+        version = await menu_cache.aget_version()
+        etag = getETag(request, version)
+        last_modified = await menu_cache.aget_modified()
+        not_modified = getNotModifiedResponse(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        cache_key = menu_cache.key('list', request.build_absolute_uri(), version)
+        response_data = await menu_cache.aget(cache_key)
+        if response_data is not None:
+            return setValidators(self.render(response_data), etag, last_modified)
+
+        try:
+            query = getMenuItemQuery(request)
+            response_data = await getMenuItemListAsync(request, query, version)
+        except InvalidMenuQuery as e:
+            return self.render({"message": str(e)}, status.HTTP_400_BAD_REQUEST)
+        except InvalidCursor:
+            return self.render({"message": "Invalid cursor"}, status.HTTP_400_BAD_REQUEST)
+        await menu_cache.aset(cache_key, response_data)
+        return setValidators(self.render(response_data), etag, last_modified)
+
+
+class SingleMenuItemView(AsyncAPIView):
+    sync_view_class = views.SingleMenuItemView
+
+    async def get(self, request: Request, pk):
+        version = await menu_cache.aget_version()
+        etag = getETag(request, version)
+        last_modified = await menu_cache.aget_modified()
+        not_modified = getNotModifiedResponse(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        include_rating = isRatingIncluded(request)
+        cache_key = menu_cache.key('item', {"pk": pk, "include_rating": include_rating}, version)
+        response_data = await menu_cache.aget(cache_key)
+        if response_data is None:
+            row = await MenuItem.objects.filter(pk=pk).values(*getMenuItemValues(include_rating)).afirst()
+            if row is None:
+                raise exceptions.NotFound('No %s matches the given query.' % MenuItem._meta.object_name)
+            response_data = {
+                "result": getMenuItemsWithJsonType([row], include_rating)[0]
+            }
+            await menu_cache.aset(cache_key, response_data)
+        return setValidators(self.render(response_data), etag, last_modified)
+
+
+class CartView(AsyncAPIView):
+    sync_view_class = views.CartView
+
+    async def get(self, request: Request):
+        if not await isCustomerAsync(request):
+            return self.render({"message": "Only for customer"}, status.HTTP_403_FORBIDDEN)
+        cart_items = [
+            {
+                "user": row['user_id'],
+                "menuitem_id": row['menuitem_id'],
+                "quantity": row['quantity'],
+                "unit_price": formatDecimal(row['unit_price']),
+                "price": formatDecimal(row['price']),
+            }
+            async for row in Cart.objects.filter(user=request.user).values(
+                'user_id', 'menuitem_id', 'quantity', 'unit_price', 'price')
+        ]
+        return self.render({"count": len(cart_items), "result": cart_items})
+
+
+class OrderListView(AsyncAPIView):
+    sync_view_class = views.OrderListView
+
+    async def get(self, request: Request):
+        orders, count_key = getOrderListScope(
+            request.user, await isManagerAsync(request), await isDeliveryCrewAsync(request))
+        etag, last_modified = await getOrderListValidatorsAsync(request, orders, count_key)
+        not_modified = getNotModifiedResponse(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        try:
+            response_data = await getOrderListAsync(request, orders, count_key)
+        except InvalidCursor:
+            return self.render({"message": "Invalid cursor"}, status.HTTP_400_BAD_REQUEST)
+        return setValidators(self.render(response_data), etag, last_modified)
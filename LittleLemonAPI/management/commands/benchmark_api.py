@@ -0,0 +1,103 @@
+import json
+import logging
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from LittleLemonAPI.utils.benchmark import SCENARIOS, runBenchmark, seedBenchmarkData
+from LittleLemonAPI.utils.config import getApiPrefix
+
+
+# Load test of the API on a throwaway database
+# A fresh database is created next to the configured one (a temporary file
+# with SQLite, test_<NAME> otherwise), seeded and dropped again, so the run
+# never touches real data. Requests go through Django's test client, in one
+# thread per client (WSGI) or on one event loop (ASGI), and the results are
+# written as JSON to compare releases.
+class Command(BaseCommand):
+    help = "Seed a throwaway database and report throughput, latency and queries of every API endpoint"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=8, help="Clients sending requests at once")
+        parser.add_argument('--requests', type=int, default=200, help="Requests per scenario")
+        parser.add_argument('--warmup', type=int, default=20, help="Untimed requests per scenario")
+        parser.add_argument('--server', choices=('wsgi', 'asgi'), default='wsgi')
+        parser.add_argument('--scenario', action='append', choices=[scenario.name for scenario in SCENARIOS],
+                            help="Scenario to run, may be repeated; all of them by default")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--menu-items', type=int, default=1000)
+        parser.add_argument('--customers', type=int, default=50)
+        parser.add_argument('--delivery-crew', type=int, default=10)
+        parser.add_argument('--orders', type=int, default=5000)
+        parser.add_argument('--output', help="JSON results file, benchmark-<time>.json by default")
+        parser.add_argument('--label', help="Stored with the results, e.g. a release name")
+        parser.add_argument('--api-mode', choices=('on', 'off'),
+                            help="Override LITTLE_LEMON['API_MODE'], to measure what it saves per request")
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1 or options['requests'] < 1:
+            raise CommandError("--concurrency and --requests must be at least 1")
+        output = options['output'] or 'benchmark-{0}.json'.format(timezone.now().strftime('%Y%m%d-%H%M%S'))
+        # Every client has a cart of its own
+        customers = max(options['customers'], options['concurrency'])
+
+        # Failed requests are counted by status, their tracebacks only shown with -v 2
+        request_logger = logging.getLogger('django.request')
+        request_log_level = request_logger.level
+        if options['verbosity'] < 2:
+            request_logger.setLevel(logging.CRITICAL)
+
+        with tempfile.TemporaryDirectory() as directory, self.isolated_settings(directory, options['api_mode']):
+            api_mode = getApiPrefix() is not None
+            test_settings = connection.settings_dict['TEST']
+            old_name, old_test_name = connection.settings_dict['NAME'], test_settings.get('NAME')
+            if connection.vendor == 'sqlite':
+                # Clients in other threads need a database file, not a private in-memory one
+                test_settings['NAME'] = os.path.join(directory, 'benchmark.sqlite3')
+            connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            try:
+                self.stdout.write("Seeding {0} menu items, {1} customers and {2} orders".format(
+                    options['menu_items'], customers, options['orders']))
+                data = seedBenchmarkData(options['menu_items'], customers, options['delivery_crew'],
+                                         options['orders'], seed=options['seed'])
+                self.stdout.write("{0:<28}{1:>10}{2:>10}{3:>10}{4:>10}{5:>10}{6:>8}".format(
+                    'scenario', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms', 'queries', 'errors'))
+                results = runBenchmark(data, options['concurrency'], options['requests'], options['server'],
+                                       options['scenario'], options['seed'], options['warmup'], self.report)
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+                test_settings['NAME'] = old_test_name
+                request_logger.setLevel(request_log_level)
+
+        results['label'] = options['label']
+        results['api_mode'] = api_mode
+        with open(output, 'w') as file:
+            json.dump(results, file, indent=2)
+        self.stdout.write("Wrote {0}".format(output))
+
+    def report(self, result):
+        latency = result['latency_ms']
+        self.stdout.write("{0:<28}{1:>10.1f}{2:>10.2f}{3:>10.2f}{4:>10.2f}{5:>10.2f}{6:>8}".format(
+            result['name'], result['throughput'], latency['p50'], latency['p95'], latency['p99'],
+            result['queries_per_request']['mean'], result['errors']))
+
+    # File based throttle, menu and token cache stores and the profile captures are
+    # moved into directory, so the run neither reads nor resets the counters
+    # of the running site nor follows its profile sampling; the test client
+    # sends requests to the host testserver
+    def isolated_settings(self, directory, api_mode=None):
+        little_lemon = dict(getattr(settings, 'LITTLE_LEMON', {}))
+        if api_mode is not None:
+            little_lemon['API_MODE'] = dict(little_lemon.get('API_MODE', {}), ENABLED=api_mode == 'on')
+        for name, backend in (('THROTTLE_STORE', 'sqlite'), ('MENU_CACHE', 'file'), ('TOKEN_CACHE', 'file')):
+            options = little_lemon.get(name)
+            if options and options.get('BACKEND') == backend:
+                little_lemon[name] = dict(options, LOCATION=os.path.join(directory, name.lower()))
+        if 'PROFILING' in little_lemon:
+            little_lemon['PROFILING'] = dict(little_lemon['PROFILING'], LOCATION=os.path.join(directory, 'profiles'))
+        return override_settings(LITTLE_LEMON=little_lemon, ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'])
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from LittleLemonAPI.utils.config import getSetting
+from LittleLemonAPI.utils.dispatch import dispatchOrders
+
+
+# Assign the open orders without a delivery person to the least loaded
+# delivery crew, e.g. from cron every minute during the dinner rush
+class Command(BaseCommand):
+    help = "Assign unassigned open orders to the delivery crew with the fewest open orders"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, help="Assign at most this many orders, oldest first")
+        parser.add_argument('--max-load', type=int,
+                            help="Open orders a delivery person may hold, DISPATCH_MAX_LOAD by default")
+        parser.add_argument('--batch-size', type=int, help="Orders per UPDATE, DISPATCH_BATCH_SIZE by default")
+
+    def handle(self, *args, **options):
+        for name in ('limit', 'max_load', 'batch_size'):
+            if options[name] is not None and options[name] < 1:
+                raise CommandError("--{0} must be at least 1".format(name.replace('_', '-')))
+        max_load = options['max_load'] if options['max_load'] is not None else getSetting('DISPATCH_MAX_LOAD')
+        result = dispatchOrders(options['limit'], max_load,
+                                options['batch_size'] or getSetting('DISPATCH_BATCH_SIZE'))
+        self.stdout.write("Assigned {0} orders to {1} delivery crew, {2} left unassigned".format(
+            result['assigned'], len(result['crew']), result['unassigned']))
+        if options['verbosity'] > 1:
+            for crew_id, count in result['crew'].items():
+                self.stdout.write("  delivery crew {0}: {1}".format(crew_id, count))
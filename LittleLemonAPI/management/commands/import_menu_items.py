@@ -0,0 +1,51 @@
+import csv
+import os
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from LittleLemonAPI.utils.config import getSetting
+from LittleLemonAPI.utils.menu_import import importMenuItems, readMenuItemRows
+
+
+# Load a menu from a JSON or CSV file, e.g. a new seasonal menu
+# Rows are title, price, stock and category_id; an item with the same title
+# is updated. Nothing is written while any row has errors unless --partial.
+class Command(BaseCommand):
+    help = "Create and update menu items from a JSON or CSV file"
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help="Menu file, - for stdin")
+        parser.add_argument('--format', choices=('json', 'csv'),
+                            help="Format of the file, from its extension by default")
+        parser.add_argument('--partial', action='store_true', help="Import the valid rows when others have errors")
+        parser.add_argument('--no-update', action='store_true',
+                            help="Reject rows whose title exists instead of updating the item")
+        parser.add_argument('--chunk-size', type=int, help="Rows per query, MENU_IMPORT_CHUNK_SIZE by default")
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] is not None and options['chunk_size'] < 1:
+            raise CommandError("--chunk-size must be at least 1")
+        format = options['format']
+        if format is None:
+            format = 'csv' if os.path.splitext(options['file'])[1].lower() == '.csv' else 'json'
+        try:
+            if options['file'] == '-':
+                text = sys.stdin.read()
+            else:
+                with open(options['file'], encoding='utf-8-sig', newline='') as file:
+                    text = file.read()
+            rows = readMenuItemRows(text, format)
+        except (OSError, ValueError, csv.Error) as error:
+            raise CommandError("Cannot read {0}: {1}".format(options['file'], error))
+
+        result = importMenuItems(rows, update_existing=not options['no_update'], partial=options['partial'],
+                                 chunk_size=options['chunk_size'] or getSetting('MENU_IMPORT_CHUNK_SIZE'))
+        for row_error in result['errors']:
+            for field, messages in row_error['errors'].items():
+                self.stderr.write("row {0}: {1}: {2}".format(row_error['row'], field, ' '.join(messages)))
+        if result['errors'] and not options['partial']:
+            raise CommandError("No menu items imported, {0} of {1} rows have errors".format(
+                len(result['errors']), len(rows)))
+        self.stdout.write("Created {0} and updated {1} menu items, skipped {2} rows with errors".format(
+            result['created'], result['updated'], len(result['errors'])))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from LittleLemonAPI.utils.caching import menu_cache
+from LittleLemonAPI.utils.ratings import rebuildRatingAggregates
+
+
+# Recompute every menu item rating aggregate from the Rating table,
+# e.g. after ratings were imported or edited with bulk queries
+class Command(BaseCommand):
+    help = "Rebuild the per menu item rating aggregates from the Rating table"
+
+    def add_arguments(self, parser):
+        parser.add_argument('menuitem_ids', nargs='*', type=int,
+                            help="Only rebuild these menu items")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        count = rebuildRatingAggregates(options['menuitem_ids'] or None, options['batch_size'])
+        menu_cache.bump_version()
+        self.stdout.write("Rebuilt rating aggregates of {0} menu items".format(count))
@@ -0,0 +1,20 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from LittleLemonAPI.utils.rollups import rebuildSalesRollups
+
+
+# Recompute the daily sales rollups from the order tables, e.g. to backfill
+# them for orders placed before the rollups existed
+class Command(BaseCommand):
+    help = "Rebuild the daily sales rollups from Order and OrderItem"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start-date', type=date.fromisoformat, help="First day to rebuild, YYYY-MM-DD")
+        parser.add_argument('--end-date', type=date.fromisoformat, help="Last day to rebuild, YYYY-MM-DD")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        count = rebuildSalesRollups(options['start_date'], options['end_date'], options['batch_size'])
+        self.stdout.write("Rebuilt sales rollups of {0} days".format(count))
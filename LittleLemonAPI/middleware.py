@@ -0,0 +1,197 @@
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.contrib.messages.middleware import MessageMiddleware
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.middleware.clickjacking import XFrameOptionsMiddleware
+from django.middleware.csrf import CsrfViewMiddleware
+
+from LittleLemonAPI.utils.config import getApiPrefix, getSetting
+from LittleLemonAPI.utils.metrics import RequestStats, addQueryTimer, getServerTiming, getViewLabel, request_metrics, request_stats
+from LittleLemonAPI.utils.profiling import PROFILE_HEADER, getProfileStore, isValidProfileToken, profileView
+
+
+ASYNC_URLCONF = 'LittleLemonAPI.async_urls'
+
+
+# Record query count, database time, serialization time and wall time of
+# every request into per view histograms, served by MetricsView, and with
+# METRICS['SERVER_TIMING'] also as a Server-Timing header of the response.
+# Placed first so the wall time covers the other middleware; when METRICS
+# is not ENABLED the middleware removes itself.
+class RequestMetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        options = getSetting('METRICS')
+        if not options.get('ENABLED', True):
+            raise MiddlewareNotUsed()
+        self.server_timing = options.get('SERVER_TIMING', False)
+        # Connections opened before the timer was connected to connection_created
+        for opened in connections.all(initialized_only=True):
+            addQueryTimer(None, opened)
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+            self.process_template_response = self.aprocess_template_response
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        token = request_stats.set(RequestStats())
+        try:
+            response = self.get_response(request)
+            return self.finish(request, response)
+        finally:
+            request_stats.reset(token)
+
+    async def __acall__(self, request):
+        token = request_stats.set(RequestStats())
+        try:
+            response = await self.get_response(request)
+            return self.finish(request, response)
+        finally:
+            request_stats.reset(token)
+
+    def finish(self, request, response):
+        stats = request_stats.get()
+        duration = time.perf_counter() - stats.started
+        request_metrics.observe(getViewLabel(request), request.method, stats, duration)
+        if self.server_timing:
+            response['Server-Timing'] = getServerTiming(stats, duration)
+        return response
+
+    # DRF responses are rendered right after this hook
+    def process_template_response(self, request, response):
+        stats = request_stats.get()
+        started = time.perf_counter()
+
+        def addRenderTime(response):
+            stats.render_time += time.perf_counter() - started
+        response.add_post_render_callback(addRenderTime)
+        return response
+
+    async def aprocess_template_response(self, request, response):
+        return RequestMetricsMiddleware.process_template_response(self, request, response)
+
+
+# Profile single requests on demand, into the capture store of PROFILING
+# A request is profiled when it carries a valid signed X-Profile header
+# (handed out to managers by /api/profiles/token) or, while a manager has
+# turned sampling on, at the sampling rate for the flagged view. Other
+# requests are only checked for the header and the cached flag; when
+# PROFILING is not ENABLED the middleware removes itself, and requests
+# served while it is turned off never read the sampling flag.
+# Placed last, so the profile covers the view and its rendering only.
+class RequestProfilingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getSetting('PROFILING').get('ENABLED', False):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+            self.process_view = self.aprocess_view
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    # 'header', 'sampling' or None when the request is not profiled
+    def get_trigger(self, request):
+        if not getSetting('PROFILING').get('ENABLED', False):
+            return None
+        token = request.META.get(PROFILE_HEADER)
+        if token is not None:
+            return 'header' if isValidProfileToken(token) else None
+        sampling = getProfileStore().get_sampling()
+        if sampling is None:
+            return None
+        if sampling['view'] is not None and sampling['view'] != getViewLabel(request):
+            return None
+        return 'sampling' if random.random() < sampling['rate'] else None
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        trigger = self.get_trigger(request)
+        if trigger is None:
+            return None
+        return self.profile(request, view_func, view_args, view_kwargs, trigger)
+
+    async def aprocess_view(self, request, view_func, view_args, view_kwargs):
+        trigger = self.get_trigger(request)
+        if trigger is None:
+            return None
+        return await sync_to_async(self.profile)(request, view_func, view_args, view_kwargs, trigger)
+
+    def profile(self, request, view_func, view_args, view_kwargs, trigger):
+        # cProfile follows one thread, so async views are profiled through the sync view they mirror
+        view = getattr(view_func, 'view_initkwargs', {}).get('sync_view', view_func)
+        response, profiler, queries, duration = profileView(view, request, *view_args, **view_kwargs)
+        user = getattr(request, 'user', None)
+        capture = getProfileStore().save({
+            "method": request.method,
+            "path": request.get_full_path(),
+            "view": getViewLabel(request),
+            "status": response.status_code,
+            "user": user.id if user is not None and user.is_authenticated else None,
+            "trigger": trigger,
+            "duration_ms": round(duration * 1000, 3),
+        }, profiler, queries)
+        response['X-Profile-Id'] = capture['id']
+        return response
+
+
+# Route requests to the native async views when served under ASGI
+# Under WSGI the middleware chain is sync and the middleware removes itself,
+# so the sync views keep serving every request without an event loop.
+class AsyncRoutingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not iscoroutinefunction(get_response):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        markcoroutinefunction(self)
+
+    async def __call__(self, request):
+        request.urlconf = ASYNC_URLCONF
+        return await self.get_response(request)
+
+
+# Subclass of a site middleware that lets requests under the API prefix
+# through untouched in API mode; the site's own paths (admin, /browse/) keep
+# the full middleware. With API mode off it behaves like middleware_class.
+def skipForApi(middleware_class):
+    class ApiModeMiddleware(middleware_class):
+        def __init__(self, get_response):
+            super().__init__(get_response)
+            self.api_prefix = getApiPrefix()
+
+        def __call__(self, request):
+            if self.api_prefix is not None and request.path_info.startswith(self.api_prefix):
+                return self.get_response(request)
+            return super().__call__(request)
+
+        if hasattr(middleware_class, 'process_view'):
+            def process_view(self, request, callback, callback_args, callback_kwargs):
+                if self.api_prefix is not None and request.path_info.startswith(self.api_prefix):
+                    return None
+                return super().process_view(request, callback, callback_args, callback_kwargs)
+
+    ApiModeMiddleware.__name__ = ApiModeMiddleware.__qualname__ = 'Site' + middleware_class.__name__
+    return ApiModeMiddleware
+
+
+SiteSessionMiddleware = skipForApi(SessionMiddleware)
+SiteCsrfViewMiddleware = skipForApi(CsrfViewMiddleware)
+SiteAuthenticationMiddleware = skipForApi(AuthenticationMiddleware)
+SiteMessageMiddleware = skipForApi(MessageMiddleware)
+SiteXFrameOptionsMiddleware = skipForApi(XFrameOptionsMiddleware)
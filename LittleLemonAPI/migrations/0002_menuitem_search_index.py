@@ -0,0 +1,70 @@
+from django.db import migrations, OperationalError
+
+
+FTS_TABLE = 'LittleLemonAPI_menuitem_fts'
+MENU_ITEM_TABLE = 'LittleLemonAPI_menuitem'
+
+
+# Triggers keeping the FTS5 table in step with MenuItem, SQLite drops them
+# whenever a migration rebuilds the MenuItem table
+def create_search_triggers(schema_editor):
+    schema_editor.execute(
+        'CREATE TRIGGER "{0}_ai" AFTER INSERT ON "{1}" BEGIN '
+        'INSERT INTO "{0}"(rowid, title) VALUES (new.id, new.title); END'.format(FTS_TABLE, MENU_ITEM_TABLE))
+    schema_editor.execute(
+        'CREATE TRIGGER "{0}_ad" AFTER DELETE ON "{1}" BEGIN '
+        'INSERT INTO "{0}"("{0}", rowid, title) VALUES (\'delete\', old.id, old.title); END'.format(
+            FTS_TABLE, MENU_ITEM_TABLE))
+    schema_editor.execute(
+        'CREATE TRIGGER "{0}_au" AFTER UPDATE OF title ON "{1}" BEGIN '
+        'INSERT INTO "{0}"("{0}", rowid, title) VALUES (\'delete\', old.id, old.title); '
+        'INSERT INTO "{0}"(rowid, title) VALUES (new.id, new.title); END'.format(FTS_TABLE, MENU_ITEM_TABLE))
+
+
+# For migrations that alter MenuItem after this one: put the triggers back
+def restore_search_triggers(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite' and FTS_TABLE in connection.introspection.table_names():
+        for suffix in ('ai', 'ad', 'au'):
+            schema_editor.execute('DROP TRIGGER IF EXISTS "{0}_{1}"'.format(FTS_TABLE, suffix))
+        create_search_triggers(schema_editor)
+
+
+# SQLite: FTS5 table over MenuItem.title kept in sync by triggers
+# MySQL: FULLTEXT index on MenuItem.title
+# Other databases, or SQLite builds without FTS5, use the in-process index
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        try:
+            schema_editor.execute(
+                'CREATE VIRTUAL TABLE "{0}" USING fts5(title, content=\'{1}\', content_rowid=\'id\', '
+                'prefix=\'2 3\')'.format(FTS_TABLE, MENU_ITEM_TABLE))
+        except OperationalError:
+            return
+        create_search_triggers(schema_editor)
+        schema_editor.execute('INSERT INTO "{0}"("{0}") VALUES (\'rebuild\')'.format(FTS_TABLE))
+    elif connection.vendor == 'mysql':
+        schema_editor.execute(
+            'ALTER TABLE `{0}` ADD FULLTEXT INDEX `menuitem_title_fulltext` (`title`)'.format(MENU_ITEM_TABLE))
+
+
+def drop_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        for suffix in ('ai', 'ad', 'au'):
+            schema_editor.execute('DROP TRIGGER IF EXISTS "{0}_{1}"'.format(FTS_TABLE, suffix))
+        schema_editor.execute('DROP TABLE IF EXISTS "{0}"'.format(FTS_TABLE))
+    elif connection.vendor == 'mysql':
+        schema_editor.execute('ALTER TABLE `{0}` DROP INDEX `menuitem_title_fulltext`'.format(MENU_ITEM_TABLE))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LittleLemonAPI', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
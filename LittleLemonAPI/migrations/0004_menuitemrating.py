@@ -0,0 +1,52 @@
+# Generated by Django 4.2.30 on 2026-10-18 03:32
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+import django.db.models.deletion
+
+
+# Aggregate the ratings given before the aggregate table existed
+def aggregate_ratings(apps, schema_editor):
+    MenuItem = apps.get_model('LittleLemonAPI', 'MenuItem')
+    MenuItemRating = apps.get_model('LittleLemonAPI', 'MenuItemRating')
+    Rating = apps.get_model('LittleLemonAPI', 'Rating')
+    histogram = {'rating_{0}'.format(value): Count('id', filter=Q(rating=value)) for value in range(0, 6)}
+    rows = (Rating.objects.values('menuitem_id')
+            .annotate(count=Count('id'), total=Sum('rating'), **histogram).order_by())
+    existing_ids = set(MenuItem.objects.values_list('id', flat=True))
+    MenuItemRating.objects.bulk_create([
+        MenuItemRating(average=(Decimal(row['total']) / row['count']).quantize(Decimal('0.01')), **row)
+        for row in rows
+        if row['menuitem_id'] in existing_ids
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LittleLemonAPI', '0003_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MenuItemRating',
+            fields=[
+                ('menuitem', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rating_summary', serialize=False, to='LittleLemonAPI.menuitem')),
+                ('count', models.IntegerField(default=0)),
+                ('total', models.IntegerField(default=0)),
+                ('average', models.DecimalField(decimal_places=2, default=0, max_digits=3)),
+                ('rating_0', models.IntegerField(default=0)),
+                ('rating_1', models.IntegerField(default=0)),
+                ('rating_2', models.IntegerField(default=0)),
+                ('rating_3', models.IntegerField(default=0)),
+                ('rating_4', models.IntegerField(default=0)),
+                ('rating_5', models.IntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['average', 'count'], name='menuitemrating_average_idx')],
+            },
+        ),
+        migrations.RunPython(aggregate_ratings, migrations.RunPython.noop),
+    ]
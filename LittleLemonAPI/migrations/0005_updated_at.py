@@ -0,0 +1,33 @@
+import importlib
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+# SQLite rebuilds the MenuItem table to add the column, dropping its search triggers
+search_index = importlib.import_module('LittleLemonAPI.migrations.0002_menuitem_search_index')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LittleLemonAPI', '0004_menuitemrating'),
+    ]
+
+    operations = [
+        # Runs last when migrating backwards
+        migrations.RunPython(migrations.RunPython.noop, search_index.restore_search_triggers),
+        migrations.AddField(
+            model_name='menuitem',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(search_index.restore_search_triggers, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='order',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 4.2.30 on 2026-10-18 03:44
+
+from collections import defaultdict
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+import django.db.models.deletion
+
+
+# Roll up the orders placed before the rollup tables existed
+# The same grouping as utils/rollups.py rebuildSalesRollups, copied on
+# purpose: a migration runs on the historical models of this state and
+# must keep filling these tables the same way however the app code and
+# models change later, so it cannot import the helper. To recompute the
+# rollups with the current code, run manage.py rebuild_sales_rollups.
+def rollup_orders(apps, schema_editor):
+    Order = apps.get_model('LittleLemonAPI', 'Order')
+    OrderItem = apps.get_model('LittleLemonAPI', 'OrderItem')
+    DailySales = apps.get_model('LittleLemonAPI', 'DailySales')
+    DailyMenuItemSales = apps.get_model('LittleLemonAPI', 'DailyMenuItemSales')
+    quantities = defaultdict(int)
+    menu_item_days = []
+    for row in (OrderItem.objects.values('order__date', 'menuitem_id')
+                .annotate(order_count=Count('id'), quantity=Sum('quantity'), revenue=Sum('price')).order_by()):
+        quantities[row['order__date']] += row['quantity']
+        menu_item_days.append(DailyMenuItemSales(
+            date=row['order__date'], menuitem_id=row['menuitem_id'], order_count=row['order_count'],
+            quantity=row['quantity'], revenue=row['revenue']))
+    DailySales.objects.bulk_create([
+        DailySales(date=row['date'], order_count=row['order_count'], quantity=quantities[row['date']],
+                   revenue=row['revenue'])
+        for row in Order.objects.values('date').annotate(order_count=Count('id'), revenue=Sum('total')).order_by()
+    ], batch_size=1000)
+    DailyMenuItemSales.objects.bulk_create(menu_item_days, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LittleLemonAPI', '0005_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('order_count', models.IntegerField(default=0)),
+                ('quantity', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailyMenuItemSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('order_count', models.IntegerField(default=0)),
+                ('quantity', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('menuitem', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='LittleLemonAPI.menuitem')),
+            ],
+            options={
+                'unique_together': {('date', 'menuitem')},
+            },
+        ),
+        migrations.RunPython(rollup_orders, migrations.RunPython.noop),
+    ]
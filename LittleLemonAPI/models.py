@@ -16,10 +16,22 @@ class MenuItem(models.Model):
     price = models.DecimalField(max_digits=6, decimal_places=2)
     inventory = models.SmallIntegerField()
     category = models.ForeignKey(Category, on_delete=models.PROTECT, default=1)
+    # Set on save(), queryset.update() calls must set it themselves
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self) -> str:
         return self.title
 
+    class Meta:
+        indexes = [
+            # Category filter with price filter / ordering
+            models.Index(fields=['category', 'price'], name='menuitem_category_price_idx'),
+            # Keyset paging for each supported ordering
+            models.Index(fields=['title', 'id'], name='menuitem_title_id_idx'),
+            models.Index(fields=['price', 'id'], name='menuitem_price_id_idx'),
+            models.Index(fields=['inventory', 'id'], name='menuitem_inventory_id_idx'),
+        ]
+
 
 class Rating(models.Model):
     menuitem_id = models.SmallIntegerField()
@@ -29,6 +41,37 @@ class Rating(models.Model):
     def __str__(self) -> str:
         return "{0} rate menu item with id: {1}".format(self.user.username, self.menuitem_id)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['menuitem_id'], name='rating_menuitem_idx'),
+        ]
+
+
+# Denormalized rating summary of one menu item
+# Kept up to date by the Rating signals and rebuilt with
+# manage.py rebuild_rating_aggregates
+class MenuItemRating(models.Model):
+    menuitem = models.OneToOneField(MenuItem, on_delete=models.CASCADE, primary_key=True, related_name='rating_summary')
+    count = models.IntegerField(default=0)
+    total = models.IntegerField(default=0)
+    average = models.DecimalField(max_digits=3, decimal_places=2, default=0)
+    # Histogram of the 0-5 ratings
+    rating_0 = models.IntegerField(default=0)
+    rating_1 = models.IntegerField(default=0)
+    rating_2 = models.IntegerField(default=0)
+    rating_3 = models.IntegerField(default=0)
+    rating_4 = models.IntegerField(default=0)
+    rating_5 = models.IntegerField(default=0)
+
+    def __str__(self) -> str:
+        return "{0} rated {1} by {2} users".format(self.menuitem_id, self.average, self.count)
+
+    class Meta:
+        indexes = [
+            # Top rated listing
+            models.Index(fields=['average', 'count'], name='menuitemrating_average_idx'),
+        ]
+
 
 class Cart(models.Model):
     menuitem = models.ForeignKey(MenuItem, on_delete=models.CASCADE)
@@ -41,6 +84,10 @@ class Cart(models.Model):
 
     class Meta:
         unique_together = ('menuitem', 'user')
+        indexes = [
+            # A user's cart, and the lines of it touched by a batch
+            models.Index(fields=['user', 'menuitem'], name='cart_user_menuitem_idx'),
+        ]
 
 
 class Order(models.Model):
@@ -49,6 +96,18 @@ class Order(models.Model):
     status = models.BooleanField(db_index=True, default=0)
     total = models.DecimalField(max_digits=6, decimal_places=2)
     date = models.DateField(db_index=True)
+    # Set on save(), queryset.update() calls must set it themselves
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            # Order listing per role, newest first with a (date, id) cursor
+            models.Index(fields=['date', 'id'], name='order_date_id_idx'),
+            models.Index(fields=['user', 'date', 'id'], name='order_user_date_idx'),
+            models.Index(fields=['delivery_crew', 'date', 'id'], name='order_crew_date_idx'),
+            # Open orders per delivery person
+            models.Index(fields=['delivery_crew', 'status'], name='order_crew_status_idx'),
+        ]
 
 
 class OrderItem(models.Model):
@@ -62,4 +121,28 @@ class OrderItem(models.Model):
         unique_together = ('order', 'menuitem')
 
 
+# Sales rollups, one row per day and one per day and menu item
+# Kept up to date by checkout and order deletion, and rebuilt with
+# manage.py rebuild_sales_rollups
+class DailySales(models.Model):
+    date = models.DateField(unique=True)
+    order_count = models.IntegerField(default=0)
+    quantity = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    def __str__(self) -> str:
+        return "{0}: {1} orders".format(self.date, self.order_count)
 
+
+class DailyMenuItemSales(models.Model):
+    date = models.DateField()
+    menuitem = models.ForeignKey(MenuItem, on_delete=models.CASCADE)
+    order_count = models.IntegerField(default=0)
+    quantity = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    def __str__(self) -> str:
+        return "{0}: {1} x {2}".format(self.date, self.quantity, self.menuitem_id)
+
+    class Meta:
+        unique_together = ('date', 'menuitem')
@@ -0,0 +1,33 @@
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.renderers import BrowsableAPIRenderer, TemplateHTMLRenderer
+
+from .utils.config import getApiPrefix
+
+
+TEMPLATE_RENDERERS = (BrowsableAPIRenderer, TemplateHTMLRenderer)
+
+
+# Content negotiation against a table of earlier outcomes
+# DRF's choice depends only on the renderers, the Accept header and the
+# format, so each combination is negotiated once per worker and later
+# requests are a dict lookup. In API mode the template based renderers are
+# left out for requests under the API prefix.
+class ApiContentNegotiation(DefaultContentNegotiation):
+    # Accept headers come from clients, so the table stops growing here
+    MAX_ENTRIES = 1000
+    table = {}
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        api_prefix = getApiPrefix()
+        if api_prefix is not None and request.path_info.startswith(api_prefix):
+            renderers = [renderer for renderer in renderers if not isinstance(renderer, TEMPLATE_RENDERERS)]
+        format = format_suffix or request.query_params.get(self.settings.URL_FORMAT_OVERRIDE)
+        key = (tuple(type(renderer) for renderer in renderers), request.META.get('HTTP_ACCEPT'), format)
+        entry = ApiContentNegotiation.table.get(key)
+        if entry is None:
+            renderer, media_type = super().select_renderer(request, renderers, format_suffix)
+            entry = (renderers.index(renderer), media_type)
+            if len(ApiContentNegotiation.table) < ApiContentNegotiation.MAX_ENTRIES:
+                ApiContentNegotiation.table[key] = entry
+        index, media_type = entry
+        return renderers[index], media_type
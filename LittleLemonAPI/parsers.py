@@ -0,0 +1,19 @@
+import csv
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+from .utils.menu_import import readCsvRows
+
+
+# text/csv request bodies, parsed to a list of dicts keyed by the header row
+class CSVParser(BaseParser):
+    media_type = 'text/csv'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        try:
+            return readCsvRows(stream.read().decode(encoding))
+        except (UnicodeDecodeError, csv.Error) as error:
+            raise ParseError('CSV parse error - {0}'.format(error))
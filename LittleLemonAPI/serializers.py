@@ -1,11 +1,21 @@
 from rest_framework import serializers
-from .models import MenuItem, Category, Rating, Cart, Order, OrderItem
+from .models import MenuItem, Category, Rating, MenuItemRating, Cart, Order, OrderItem
 from decimal import Decimal
 from rest_framework.validators import UniqueValidator, UniqueTogetherValidator
 import bleach
 from django.contrib.auth.models import User
 
 
+# Multiplier of price_after_tax, built once instead of per item
+TAX_MULTIPLIER = Decimal('1.1')
+CENTS = Decimal('0.01')
+
+
+# Price with tax, rounded to the cents of the price
+def calculatePriceAfterTax(price: Decimal):
+    return (price * TAX_MULTIPLIER).quantize(CENTS)
+
+
 class CategorySerializer(serializers.ModelSerializer):
     class Meta:
         model = Category
@@ -24,14 +34,23 @@ class MenuItemSerializer(serializers.ModelSerializer):
         max_length=255,
         validators=[UniqueValidator(queryset=MenuItem.objects.all())],
     )
+    # Only serialized with include_rating in the context, the queryset
+    # should select_related('rating_summary') to avoid a query per item
+    avg_rating = serializers.DecimalField(
+        source='rating_summary.average', max_digits=3, decimal_places=2, read_only=True)
 
     class Meta:
         model = MenuItem
         fields = ['id', 'title', 'price', 'stock',
-                  'price_after_tax', 'category', 'category_id']
+                  'price_after_tax', 'category', 'category_id', 'avg_rating']
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if not self.context.get('include_rating'):
+            self.fields.pop('avg_rating')
 
     def calculate_tax(self, product: MenuItem):
-        return product.price * Decimal(1.1)
+        return calculatePriceAfterTax(product.price)
 
     # For sanitization data
     def validate_title(self, value):
@@ -46,6 +65,28 @@ class MenuItemSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("Invalid category id")
 
 
+# One row of a bulk menu import, checked without queries; the title
+# sanitization, title uniqueness and category ids are checked for the whole
+# batch at once by importMenuItems
+class MenuItemImportSerializer(serializers.Serializer):
+    title = serializers.CharField(max_length=255)
+    price = serializers.DecimalField(max_digits=6, decimal_places=2, min_value=2)
+    stock = serializers.IntegerField(min_value=0, max_value=32767)
+    category_id = serializers.IntegerField(min_value=1)
+
+
+class MenuItemRatingSerializer(serializers.ModelSerializer):
+    menuitem = MenuItemSerializer(read_only=True)
+    histogram = serializers.SerializerMethodField()
+
+    class Meta:
+        model = MenuItemRating
+        fields = ['menuitem', 'average', 'count', 'histogram']
+
+    def get_histogram(self, aggregate: MenuItemRating):
+        return [getattr(aggregate, 'rating_{0}'.format(value)) for value in range(0, 6)]
+
+
 class RatingSerializer (serializers.ModelSerializer):
     user = serializers.PrimaryKeyRelatedField(
         queryset=User.objects.all(),
@@ -70,6 +111,12 @@ class RatingSerializer (serializers.ModelSerializer):
             }
         }
 
+    # Validate menuitem_id, ratings are aggregated per existing menu item
+    def validate_menuitem_id(self, value):
+        if not MenuItem.objects.filter(pk=value).exists():
+            raise serializers.ValidationError("Invalid menu item id")
+        return value
+
 
 class UserSerializer(serializers.ModelSerializer):
 
@@ -115,6 +162,53 @@ class CartSerializer(serializers.ModelSerializer):
         return value
     
 
+class CartLineSerializer(serializers.Serializer):
+    menuitem_id = serializers.IntegerField()
+    # 0 removes the line from the cart
+    quantity = serializers.IntegerField(min_value=0, max_value=32767)
+
+
+class CartBatchSerializer(serializers.Serializer):
+    items = CartLineSerializer(many=True, allow_empty=False)
+    # Remove every cart line that is not in items
+    replace = serializers.BooleanField(default=False)
+
+    # Validate every menuitem_id with a single IN query and price the lines
+    def validate_items(self, value):
+        menuitem_ids = [line['menuitem_id'] for line in value]
+        if len(set(menuitem_ids)) != len(menuitem_ids):
+            raise serializers.ValidationError("Duplicate menu item id")
+        prices = dict(MenuItem.objects.filter(pk__in=menuitem_ids).values_list('id', 'price'))
+        invalid_ids = [menuitem_id for menuitem_id in menuitem_ids if menuitem_id not in prices]
+        if invalid_ids:
+            raise serializers.ValidationError(
+                "Invalid menu item id: {0}".format(', '.join(str(menuitem_id) for menuitem_id in invalid_ids)))
+        for line in value:
+            line['unit_price'] = prices[line['menuitem_id']]
+        return value
+
+
+class OrderChangeSerializer(serializers.Serializer):
+    id = serializers.IntegerField(min_value=1)
+    status = serializers.BooleanField(required=False)
+    delivery_crew = serializers.IntegerField(min_value=1, required=False)
+
+    def validate(self, attrs):
+        if 'status' not in attrs and 'delivery_crew' not in attrs:
+            raise serializers.ValidationError("Give a status or a delivery_crew")
+        return attrs
+
+
+class OrderBatchSerializer(serializers.Serializer):
+    orders = OrderChangeSerializer(many=True, allow_empty=False, max_length=1000)
+
+    def validate_orders(self, value):
+        order_ids = [change['id'] for change in value]
+        if len(set(order_ids)) != len(order_ids):
+            raise serializers.ValidationError("Duplicate order id")
+        return value
+
+
 class OrderSerializer(serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
     delivery_crew = UserSerializer()
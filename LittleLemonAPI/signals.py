@@ -0,0 +1,91 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .models import MenuItem, Category, Rating, Order
+from .utils.caching import menu_cache, token_cache
+from .utils.conditional import ORDERS_VERSION_KEY
+from .utils.functions import invalidateUserGroupNames
+from .utils.ratings import applyRating, rebuildRatingAggregates
+from .utils.rollups import applyOrderToRollupsOnCommit
+from .utils.search import updateSearchIndex
+
+
+# Any change to the catalogue, from the API or the admin, bumps the menu cache version
+@receiver(post_save, sender=MenuItem)
+@receiver(post_delete, sender=MenuItem)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_menu_cache(sender, **kwargs):
+    menu_cache.invalidate()
+
+
+@receiver(post_save, sender=MenuItem)
+def index_menu_item(sender, instance, **kwargs):
+    updateSearchIndex(instance.id, instance.title)
+
+
+@receiver(post_delete, sender=MenuItem)
+def unindex_menu_item(sender, instance, **kwargs):
+    updateSearchIndex(instance.id)
+
+
+# Deleted orders leave no updated_at behind, so they move the orders version
+@receiver(post_delete, sender=Order)
+def invalidate_order_validators(sender, **kwargs):
+    transaction.on_commit(lambda: menu_cache.bump_version(ORDERS_VERSION_KEY))
+
+
+# Take deleted orders out of the sales rollups while their items still exist
+@receiver(pre_delete, sender=Order)
+def remove_order_from_rollups(sender, instance, **kwargs):
+    order_items = list(instance.orderitem_set.values('menuitem_id', 'quantity', 'price'))
+    applyOrderToRollupsOnCommit(instance.date, instance.total, order_items, -1)
+
+
+# Keep the per item rating aggregate in step with the Rating table
+# An edited rating may have changed value, so its item is recomputed.
+@receiver(post_save, sender=Rating)
+def aggregate_rating(sender, instance, created, **kwargs):
+    if created:
+        applyRating(instance.menuitem_id, instance.rating)
+    else:
+        rebuildRatingAggregates([instance.menuitem_id])
+    # avg_rating is part of the cached menu payload
+    menu_cache.invalidate()
+
+
+@receiver(post_delete, sender=Rating)
+def unaggregate_rating(sender, instance, **kwargs):
+    applyRating(instance.menuitem_id, instance.rating, -1)
+    menu_cache.invalidate()
+
+
+# Adding or removing users from groups, e.g. through ManagerListView,
+# DeliveryCrewView or the admin, drops their cached group names
+@receiver(m2m_changed, sender=User.groups.through)
+def invalidate_user_group_names(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ('post_add', 'post_remove'):
+        user_ids = list(pk_set) if reverse else [instance.pk]
+    elif action == 'pre_clear':
+        user_ids = list(instance.user_set.values_list('pk', flat=True)) if reverse else [instance.pk]
+    else:
+        return
+    transaction.on_commit(lambda: invalidateUserGroupNames(user_ids))
+
+
+# Logout (djoser deletes the token), deactivation or any other change to a
+# user drops the cached tokens of that user, whose fields they hold;
+# the last_login update of a login changes nothing authentication depends on
+@receiver(post_delete, sender=Token)
+def revoke_deleted_token(sender, instance, **kwargs):
+    token_cache.revoke(instance.user_id)
+
+
+@receiver(post_save, sender=User)
+def revoke_user_tokens(sender, instance, created, update_fields=None, **kwargs):
+    if created or (update_fields is not None and set(update_fields) == {'last_login'}):
+        return
+    token_cache.revoke(instance.pk)
@@ -1,3 +1,2131 @@
-from django.test import TestCase
+import asyncio
+import csv
+import importlib
+from datetime import date
+from decimal import Decimal
+from io import StringIO
+import json
+import os
+import pstats
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.apps import apps as django_apps
+from django.contrib.auth.models import User, Group
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.db.models import Count
+from django.test import AsyncClient, Client, TestCase, TransactionTestCase, override_settings, tag
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_xml.renderers import XMLRenderer
+
+from .async_views import AsyncAPIView
+from .authentication import CachedTokenAuthentication
+from .models import MenuItem, MenuItemRating, Category, Cart, DailyMenuItemSales, DailySales, Order, OrderItem, Rating
+from .negotiation import ApiContentNegotiation
+from .renderers import FastJSONRenderer
+from .serializers import MenuItemSerializer, OrderItemSerializer
+from .throttles import SlidingWindowRateThrottle
+from .utils.benchmark import SCENARIOS, runBenchmark, seedBenchmarkData
+from .utils.caching import LRUCache, MenuCache, TokenCache, menu_cache, token_cache
+from .utils.config import getSetting
+from .utils.constants import GroupName
+from .utils.dispatch import dispatchOrders
+from .utils.menu_import import importMenuItems
+from .utils.functions import getOrdersWithJsonType, getMenuItemValues, getMenuItemsWithJsonType, getOrderItemsWithJsonType, ORDER_ITEM_VALUES
+from .utils.metrics import PROMETHEUS_CONTENT_TYPE, request_metrics
+from .utils.profiling import ProfileStore
+from .utils.search import InvertedIndex, search_index, searchMenuItems
+from .utils.throttling import CacheThrottleStore, SQLiteThrottleStore, getThrottleStore
+from .views import OrderListView
+
+
+# Shared fixtures for the API tests
+class LittleLemonTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager_group = Group.objects.create(name=GroupName().MANAGER)
+        cls.delivery_crew_group = Group.objects.create(name=GroupName().DELIVERY_CREW)
+        cls.category = Category.objects.create(slug='main', title='Main')
+        cls.customer = User.objects.create_user(username='customer', password='secret')
+        cls.manager = User.objects.create_user(username='manager', password='secret')
+        cls.manager.groups.add(cls.manager_group)
+        cls.delivery_person = User.objects.create_user(username='crew', password='secret')
+        cls.delivery_person.groups.add(cls.delivery_crew_group)
+
+    def setUp(self):
+        cache.clear()
+        token_cache.clear()
+        getThrottleStore().clear()
+        menu_cache.bump_version()
+        menu_cache.bump_version(InvertedIndex.VERSION_KEY)
+
+    def client_for(self, user: User):
+        client = APIClient()
+        client.force_authenticate(user=user)
+        return client
+
+    def create_menu_items(self, count, price='5.00', inventory=100):
+        MenuItem.objects.bulk_create([
+            MenuItem(title='Item {0}'.format(MenuItem.objects.count() + i), price=Decimal(price),
+                     inventory=inventory, category=self.category)
+            for i in range(count)
+        ])
+        return list(MenuItem.objects.order_by('id'))
+
+    def fill_cart(self, user: User, menu_items, quantity=2):
+        Cart.objects.bulk_create([
+            Cart(user=user, menuitem=menu_item, quantity=quantity,
+                 unit_price=menu_item.price, price=menu_item.price * quantity)
+            for menu_item in menu_items
+        ])
+
+    def create_orders(self, count, user: User, items_per_order=3, delivery_crew: User = None):
+        menu_items = self.create_menu_items(items_per_order)
+        for _ in range(count):
+            order = Order.objects.create(
+                user=user, delivery_crew=delivery_crew, total=Decimal('15.00'), date=date.today())
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, menuitem=menu_item, quantity=1,
+                          unit_price=menu_item.price, price=menu_item.price)
+                for menu_item in menu_items[-items_per_order:]
+            ])
+
+
+# Base of the tests that time the API, which only run with --tag benchmark
+@tag('benchmark')
+class Benchmark:
+    # Print one line of results below the test progress
+    def report(self, line: str):
+        print("\n" + line)
+
+
+class OrderListViewTests(LittleLemonTestCase):
+    def count_list_queries(self, user: User):
+        cache.clear()
+        token_cache.clear()
+        client = self.client_for(user)
+        with CaptureQueriesContext(connection) as context:
+            response = client.get('/api/orders', {'perpage': 100})
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries), response.data
+
+    def test_order_json_shape(self):
+        self.create_orders(1, user=self.customer, delivery_crew=self.delivery_person)
+        _, data = self.count_list_queries(self.customer)
+        self.assertEqual(data['count'], 1)
+        order = data['result'][0]
+        self.assertEqual(order['user_id'], self.customer.id)
+        self.assertEqual(order['delivery_person_id'], self.delivery_person.id)
+        self.assertEqual(len(order['order_items']), 3)
+        self.assertEqual(set(order['order_items'][0].keys()),
+                         {'order_id', 'menuitem_id', 'quantity', 'unit_price', 'price'})
+
+    def test_query_count_is_constant_in_order_volume(self):
+        for user in (self.customer, self.manager, self.delivery_person):
+            with self.subTest(user=user.username):
+                Order.objects.all().delete()
+                self.create_orders(2, user=self.customer, delivery_crew=self.delivery_person)
+                small, _ = self.count_list_queries(user)
+                self.create_orders(40, user=self.customer, delivery_crew=self.delivery_person)
+                large, data = self.count_list_queries(user)
+                self.assertEqual(data['count'], 42)
+                self.assertEqual(len(data['result']), 42)
+                self.assertEqual(small, large)
+
+
+class OrderPaginationTests(LittleLemonTestCase):
+    def collect_pages(self, client, params, link='next'):
+        response = client.get('/api/orders', params)
+        self.assertEqual(response.status_code, 200)
+        pages = [response.data]
+        while pages[-1][link]:
+            response = client.get(pages[-1][link])
+            self.assertEqual(response.status_code, 200)
+            pages.append(response.data)
+        return pages
+
+    def test_cursor_walks_every_order_once_newest_first(self):
+        self.create_orders(5, user=self.customer, items_per_order=1)
+        Order.objects.filter(id__in=list(Order.objects.values_list('id', flat=True)[:2])).update(
+            date=date(2023, 1, 1))
+        client = self.client_for(self.customer)
+        pages = self.collect_pages(client, {'perpage': 2})
+        self.assertEqual([len(page['result']) for page in pages], [2, 2, 1])
+        self.assertEqual(pages[0]['count'], 5)
+        self.assertIsNone(pages[0]['previous'])
+        ids = [order['order_id'] for page in pages for order in page['result']]
+        expected = list(Order.objects.order_by('-date', '-id').values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+
+        # Walk back from the last page
+        back = client.get(pages[-1]['previous']).data
+        self.assertEqual(back['result'], pages[1]['result'])
+        back = client.get(back['previous']).data
+        self.assertEqual(back['result'], pages[0]['result'])
+        self.assertIsNone(back['previous'])
+
+    def test_deep_page_costs_the_same_queries_as_first_page(self):
+        self.create_orders(30, user=self.customer, items_per_order=1)
+        client = self.client_for(self.customer)
+        pages = self.collect_pages(client, {'perpage': 5})
+        with CaptureQueriesContext(connection) as first:
+            client.get('/api/orders', {'perpage': 5})
+        with CaptureQueriesContext(connection) as deep:
+            client.get(pages[-2]['next'])
+        self.assertEqual(len(first.captured_queries), len(deep.captured_queries))
+        self.assertNotIn('OFFSET', deep.captured_queries[-2]['sql'].upper())
+
+    def test_invalid_cursor(self):
+        response = self.client_for(self.customer).get('/api/orders', {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+
+
+class MenuItemListPaginationTests(LittleLemonTestCase):
+    def setUp(self):
+        super().setUp()
+        MenuItem.objects.bulk_create([
+            MenuItem(title='Dish {0:02d}'.format(i), price=Decimal(10 + i % 4),
+                     inventory=i, category=self.category)
+            for i in range(11)
+        ])
+        self.client = self.client_for(self.customer)
+
+    def walk(self, params, link='next'):
+        data = self.client.get('/api/menu-items', params).data
+        items = list(data['result'])
+        while data[link]:
+            data = self.client.get(data[link]).data
+            items += data['result']
+        return items
+
+    def test_page_walk_matches_ordering(self):
+        items = self.walk({'perpage': 3, 'ordering': '-price,title'})
+        expected = list(MenuItem.objects.order_by('-price', 'title', 'id').values_list('title', flat=True))
+        self.assertEqual([item['title'] for item in items], expected)
+
+    def test_cursor_walk_matches_ordering(self):
+        items = self.walk({'perpage': 4, 'ordering': 'price', 'cursor': ''})
+        expected = list(MenuItem.objects.order_by('price', 'id').values_list('title', flat=True))
+        self.assertEqual([item['title'] for item in items], expected)
+
+    def test_count_is_cached_per_filter_combination(self):
+        response = self.client.get('/api/menu-items', {'to_price': 11})
+        self.assertEqual(response.data['count'], 6)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/menu-items', {'to_price': 11, 'page': 2})
+        self.assertEqual(response.data['count'], 6)
+        self.assertFalse(any('COUNT(' in query['sql'] for query in context.captured_queries))
+        response = self.client.get('/api/menu-items', {'to_price': 10})
+        self.assertEqual(response.data['count'], 3)
+
+    def test_sequential_pages_seek_from_bookmarks(self):
+        data = self.client.get('/api/menu-items', {'perpage': 2}).data
+        while data['next']:
+            with CaptureQueriesContext(connection) as context:
+                data = self.client.get(data['next']).data
+            self.assertFalse(any('OFFSET' in query['sql'].upper() for query in context.captured_queries))
+        self.assertIsNone(data['next'])
+
+    def test_page_without_bookmark(self):
+        response = self.client.get('/api/menu-items', {'perpage': 2, 'page': 4})
+        self.assertEqual([item['title'] for item in response.data['result']], ['Dish 06', 'Dish 07'])
+        response = self.client.get('/api/menu-items', {'perpage': 2, 'page': 40})
+        self.assertEqual(response.data['result'], [])
+        self.assertIsNone(response.data['next'])
+
+    # The OFFSET left for a jump to a page without a bookmark skips primary
+    # keys only, and the jump costs the same queries however deep it goes
+    def test_deep_page_jump_offsets_over_the_pk_only(self):
+        pk_column = '{0}.{1}'.format(connection.ops.quote_name(MenuItem._meta.db_table),
+                                     connection.ops.quote_name(MenuItem._meta.pk.column))
+        query_counts = {}
+        for page in (2, 5):
+            cache.clear()
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get('/api/menu-items', {'perpage': 2, 'page': page})
+            self.assertEqual(len(response.data['result']), 2)
+            offset_queries = [query['sql'] for query in context.captured_queries if ' OFFSET ' in query['sql']]
+            self.assertEqual(len(offset_queries), 1)
+            self.assertEqual(offset_queries[0].split(' FROM ')[0], 'SELECT ' + pk_column)
+            self.assertIn(' OFFSET {0}'.format((page - 1) * 2), offset_queries[0])
+            query_counts[page] = len(context.captured_queries)
+        self.assertEqual(query_counts[5], query_counts[2])
+
+    # A jump offsets at most MENU_ITEMS_MAX_OFFSET rows, from the nearest
+    # bookmark before the page or from the first row
+    def test_deep_page_jump_is_bounded(self):
+        with override_settings(LITTLE_LEMON={'MENU_ITEMS_MAX_OFFSET': 4}):
+            response = self.client.get('/api/menu-items', {'perpage': 2, 'page': 4})
+            self.assertEqual(response.status_code, 400)
+            self.client.get('/api/menu-items', {'perpage': 2, 'page': 2})
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get('/api/menu-items', {'perpage': 2, 'page': 5})
+            self.assertEqual([item['title'] for item in response.data['result']], ['Dish 08', 'Dish 09'])
+            offset_queries = [query['sql'] for query in context.captured_queries if ' OFFSET ' in query['sql']]
+            self.assertEqual(len(offset_queries), 1)
+            self.assertIn(' WHERE ', offset_queries[0])
+            self.assertIn(' OFFSET 4', offset_queries[0])
+
+    def test_rejects_unknown_ordering(self):
+        response = self.client.get('/api/menu-items', {'ordering': 'category__slug'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_rejects_invalid_to_price(self):
+        for to_price in ('abc', 'NaN', 'Infinity'):
+            response = self.client.get('/api/menu-items', {'to_price': to_price})
+            self.assertEqual(response.status_code, 400)
+        response = self.client.get('/api/menu-items', {'to_price': '11.00', 'perpage': 20})
+        self.assertEqual([item['title'] for item in response.data['result']],
+                         ['Dish 00', 'Dish 01', 'Dish 04', 'Dish 05', 'Dish 08', 'Dish 09'])
+
+
+class MenuCacheTests(LittleLemonTestCase):
+    def setUp(self):
+        super().setUp()
+        self.item = MenuItem.objects.create(title='Soup', price=Decimal('4.00'), inventory=5, category=self.category)
+        menu_cache.bump_version()
+
+    def test_hot_reads_do_not_query_the_database(self):
+        client = self.client_for(self.customer)
+        client.get('/api/menu-items', {'perpage': 5})
+        client.get('/api/menu-items/{0}'.format(self.item.id))
+        with self.assertNumQueries(0):
+            list_response = client.get('/api/menu-items', {'perpage': 5})
+            item_response = client.get('/api/menu-items/{0}'.format(self.item.id))
+        self.assertEqual(list_response.data['result'][0]['title'], 'Soup')
+        self.assertEqual(item_response.data['result']['title'], 'Soup')
+
+    def test_manager_writes_invalidate_cached_reads(self):
+        client = self.client_for(self.manager)
+        url = '/api/menu-items/{0}'.format(self.item.id)
+        client.get('/api/menu-items')
+        client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            client.patch(url, {'title': 'Tomato soup'})
+        self.assertEqual(client.get(url).data['result']['title'], 'Tomato soup')
+        self.assertEqual(client.get('/api/menu-items').data['result'][0]['title'], 'Tomato soup')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            client.post('/api/menu-items', {'title': 'Bread', 'price': '3.00', 'stock': 9,
+                                            'category': self.category.id, 'category_id': self.category.id})
+        self.assertEqual(client.get('/api/menu-items').data['count'], 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            client.delete(url)
+        self.assertEqual(client.get(url).status_code, 404)
+
+    def test_category_change_bumps_version(self):
+        version = menu_cache.get_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.title = 'Mains'
+            self.category.save()
+        self.assertNotEqual(menu_cache.get_version(), version)
+
+    def test_file_backend_shares_the_version(self):
+        with tempfile.TemporaryDirectory() as location:
+            options = {'MENU_CACHE': {'BACKEND': 'file', 'LOCATION': location, 'MAX_ENTRIES': 10}}
+            with override_settings(LITTLE_LEMON=options):
+                version = menu_cache.get_version()
+                menu_cache.set(menu_cache.key('item', 1), {'result': 'cached'})
+                # A fresh in-process tier, as in another worker, still sees the version and entry
+                menu_cache.local.clear()
+                self.assertEqual(menu_cache.get_version(), version)
+                self.assertEqual(menu_cache.get(menu_cache.key('item', 1)), {'result': 'cached'})
+
+    def test_concurrent_bumps_are_not_lost(self):
+        with tempfile.TemporaryDirectory() as location:
+            options = {'MENU_CACHE': {'BACKEND': 'file', 'LOCATION': location}}
+            with override_settings(LITTLE_LEMON=options):
+                version = menu_cache.get_version()
+
+                # Every thread is a worker with caches of its own over the same directory
+                def run():
+                    worker = MenuCache()
+                    for _ in range(50):
+                        worker.bump_version()
+                threads = [threading.Thread(target=run) for _ in range(4)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                self.assertEqual(MenuCache().get_version(), version + 200)
+
+    def test_cache_alias_without_atomic_incr_is_refused(self):
+        with tempfile.TemporaryDirectory() as location:
+            caches_setting = {
+                'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+                'files': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location},
+            }
+            with override_settings(CACHES=caches_setting, LITTLE_LEMON={'MENU_CACHE': {'BACKEND': 'files'}}):
+                with self.assertRaises(ImproperlyConfigured):
+                    MenuCache().get_version()
+
+
+class SlidingWindowThrottleTests(TestCase):
+    class ThreePerMinute(SlidingWindowRateThrottle):
+        rate = '3/minute'
+
+        def get_cache_key(self, request, view):
+            return 'throttle:test'
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.location = '{0}/throttle.sqlite3'.format(self.directory.name)
+
+    def check(self, now):
+        throttle = self.ThreePerMinute()
+        throttle.timer = lambda: now
+        return throttle.allow_request(None, None), throttle
+
+    def run_window(self, options):
+        with override_settings(LITTLE_LEMON={'THROTTLE_STORE': options}):
+            getThrottleStore().clear()
+            start = 600.0
+            self.assertEqual([self.check(start + i)[0] for i in range(4)], [True, True, True, False])
+            # Refused requests are not counted
+            self.assertFalse(self.check(start + 30)[0])
+            # Half way into the next window half of the previous one still counts
+            allowed, throttle = self.check(start + 90)
+            self.assertTrue(allowed)
+            allowed, throttle = self.check(start + 91)
+            self.assertFalse(allowed)
+            self.assertAlmostEqual(throttle.wait(), 9.0)
+            self.assertFalse(self.check(start + 99)[0])
+            self.assertTrue(self.check(start + 101)[0])
+            self.assertTrue(self.check(start + 120)[0])
+
+    def test_sqlite_store(self):
+        self.run_window({'BACKEND': 'sqlite', 'LOCATION': self.location})
+
+    def test_cache_store(self):
+        self.run_window({'BACKEND': 'default'})
+
+    def test_sqlite_store_is_shared_between_workers(self):
+        workers = [SQLiteThrottleStore(self.location) for _ in range(2)]
+        self.assertEqual(workers[0].incr('key', 1, 60), 1)
+        self.assertEqual(workers[1].incr('key', 1, 60), 2)
+        self.assertEqual(workers[0].get('key'), 2)
+
+    def test_sqlite_store_counts_concurrent_increments(self):
+        def run():
+            store = SQLiteThrottleStore(self.location)
+            for _ in range(50):
+                store.incr('key', 1, 60)
+        threads = [threading.Thread(target=run) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(SQLiteThrottleStore(self.location).get('key'), 200)
+
+    def test_expired_counter_restarts(self):
+        store = SQLiteThrottleStore(self.location)
+        store.incr('key', 5, 60)
+        with mock.patch('LittleLemonAPI.utils.throttling.time.time', return_value=time.time() + 61):
+            self.assertEqual(store.get('key'), 0)
+            self.assertEqual(store.incr('key', 1, 60), 1)
+        self.assertEqual(CacheThrottleStore(cache).incr('throttle:new', 1, 60), 1)
+
+    def test_cache_store_clear_keeps_other_entries(self):
+        store = CacheThrottleStore(cache)
+        cache.set('menu:unrelated', 'kept')
+        store.incr('key', 3, 60)
+        store.clear()
+        self.assertEqual(store.get('key'), 0)
+        self.assertEqual(store.incr('key', 1, 60), 1)
+        self.assertEqual(cache.get('menu:unrelated'), 'kept')
+
+    def test_sqlite_store_without_returning(self):
+        # SQLite before 3.35 reads the counter back in the same transaction
+        with mock.patch('LittleLemonAPI.utils.throttling.HAS_RETURNING', False):
+            store = SQLiteThrottleStore(self.location)
+            self.assertEqual([store.incr('key', 1, 60) for _ in range(3)], [1, 2, 3])
+            self.assertEqual(store.incr('key', -1, 60), 2)
+            self.assertFalse(store.connection.in_transaction)
+
+
+class LRUCacheTests(TestCase):
+    def test_evicts_least_recently_used(self):
+        lru = LRUCache(max_entries=2)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')
+        lru.set('c', 3)
+        self.assertEqual(lru.get('a'), 1)
+        self.assertIsNone(lru.get('b'))
+        self.assertEqual(lru.get('c'), 3)
+
+    def test_entries_expire(self):
+        lru = LRUCache(max_entries=2, timeout=0)
+        lru.set('a', 1)
+        self.assertIsNone(lru.get('a'))
+
+
+class RoleResolutionTests(LittleLemonTestCase):
+    def group_queries(self, context):
+        return [query for query in context.captured_queries if 'auth_group' in query['sql']]
+
+    def test_one_group_query_per_request(self):
+        self.create_orders(1, user=self.customer)
+        order = Order.objects.get()
+        client = self.client_for(self.delivery_person)
+        with override_settings(LITTLE_LEMON={'ROLE_CACHE_TIMEOUT': 0}):
+            with CaptureQueriesContext(connection) as context:
+                response = client.patch('/api/orders/{0}'.format(order.id), {'status': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.group_queries(context)), 1)
+
+    def test_group_names_are_cached_between_requests(self):
+        client = self.client_for(self.manager)
+        client.get('/api/orders')
+        with CaptureQueriesContext(connection) as context:
+            response = client.get('/api/orders')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.group_queries(context), [])
+
+    def test_membership_change_invalidates_cached_group_names(self):
+        client = self.client_for(self.customer)
+        self.assertEqual(client.get('/api/cart/menu-items').status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client_for(self.manager).post(
+                '/api/groups/delivery-crew/users', {'username': self.customer.username})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(client.get('/api/cart/menu-items').status_code, 403)
+
+    def test_revoked_role_is_seen_by_other_workers(self):
+        other_manager = User.objects.create_user(username='manager2', password='secret')
+        other_manager.groups.add(self.manager_group)
+        with tempfile.TemporaryDirectory() as location:
+            options = {'ROLE_CACHE_TIMEOUT': 30, 'TOKEN_CACHE': {'BACKEND': 'file', 'LOCATION': location}}
+            with override_settings(LITTLE_LEMON=options):
+                client = self.client_for(self.manager)
+                self.assertEqual(client.get('/api/groups/manager/users').status_code, 200)
+                # Another worker, with a token cache of its own over the same directory
+                other_worker = TokenCache()
+                self.assertEqual(other_worker.get_roles(self.manager.id), frozenset([GroupName().MANAGER]))
+                with self.captureOnCommitCallbacks(execute=True):
+                    response = self.client_for(other_manager).delete(
+                        '/api/groups/manager/users/{0}'.format(self.manager.id))
+                self.assertEqual(response.status_code, 200)
+                self.assertIsNone(other_worker.get_roles(self.manager.id))
+                self.assertEqual(client.get('/api/groups/manager/users').status_code, 403)
+
+    def test_group_names_are_not_cached_in_one_worker_only(self):
+        options = {'ROLE_CACHE_TIMEOUT': 30, 'TOKEN_CACHE': {'BACKEND': 'locmem'}}
+        client = self.client_for(self.manager)
+        with override_settings(LITTLE_LEMON=options):
+            client.get('/api/orders')
+            with CaptureQueriesContext(connection) as context:
+                client.get('/api/orders')
+        self.assertEqual(len(self.group_queries(context)), 1)
+
+
+class CheckoutTests(LittleLemonTestCase):
+    def test_checkout_moves_cart_into_order(self):
+        menu_items = self.create_menu_items(3, price='4.50')
+        self.fill_cart(self.customer, menu_items, quantity=2)
+        response = self.client_for(self.customer).post('/api/orders')
+        self.assertEqual(response.status_code, 201)
+        order = Order.objects.get(user=self.customer)
+        self.assertEqual(order.total, Decimal('27.00'))
+        self.assertEqual(order.orderitem_set.count(), 3)
+        self.assertFalse(Cart.objects.filter(user=self.customer).exists())
+
+    def test_checkout_with_empty_cart(self):
+        response = self.client_for(self.customer).post('/api/orders')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+    def test_query_count_does_not_grow_with_the_cart(self):
+        menu_items = self.create_menu_items(100)
+        client = self.client_for(self.customer)
+        query_counts = []
+        # The first checkout also caches the customer's roles
+        for size in (1, 1, 100):
+            self.fill_cart(self.customer, menu_items[:size])
+            with CaptureQueriesContext(connection) as context:
+                self.assertEqual(client.post('/api/orders').status_code, 201)
+            query_counts.append(len(context.captured_queries))
+        self.assertEqual(query_counts[2], query_counts[1])
+
+    def test_failed_checkout_leaves_no_partial_order(self):
+        menu_items = self.create_menu_items(2)
+        self.fill_cart(self.customer, menu_items)
+        with mock.patch('LittleLemonAPI.utils.checkout.copyCartLines', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.client_for(self.customer).post('/api/orders')
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(Cart.objects.filter(user=self.customer).count(), 2)
+
+
+class InventoryReservationTests(LittleLemonTestCase):
+    def test_checkout_decrements_inventory(self):
+        menu_items = self.create_menu_items(2, inventory=5)
+        self.fill_cart(self.customer, menu_items, quantity=2)
+        self.assertEqual(self.client_for(self.customer).post('/api/orders').status_code, 201)
+        self.assertEqual([item.inventory for item in MenuItem.objects.order_by('id')], [3, 3])
+
+    def test_only_selling_out_invalidates_the_menu_cache(self):
+        plenty, scarce = self.create_menu_items(2, inventory=5)
+        client = self.client_for(self.customer)
+        version = menu_cache.get_version()
+        self.fill_cart(self.customer, [plenty], quantity=2)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(client.post('/api/orders').status_code, 201)
+        self.assertEqual(menu_cache.get_version(), version)
+        self.fill_cart(self.customer, [scarce], quantity=5)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(client.post('/api/orders').status_code, 201)
+        self.assertGreater(menu_cache.get_version(), version)
+
+    def test_short_line_fails_the_whole_checkout(self):
+        plenty, scarce = self.create_menu_items(2, inventory=5)
+        scarce.inventory = 1
+        scarce.save()
+        self.fill_cart(self.customer, [plenty, scarce], quantity=2)
+        response = self.client_for(self.customer).post('/api/orders')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['errors'], [{"menuitem_id": scarce.id, "requested": 2, "available": 1}])
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(MenuItem.objects.get(pk=plenty.id).inventory, 5)
+        self.assertEqual(Cart.objects.filter(user=self.customer).count(), 2)
+
+
+# Customers checking out the same item from several threads at once
+# Runs on the test database, or on a file copy of it when that is SQLite in
+# memory: threads share it through SQLite's shared cache, whose table locks
+# fail at once instead of waiting for the writer.
+class InventoryReservationStressTest(TransactionTestCase):
+    THREADS = 8
+    STOCK = 60
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.memory_database = None
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            cls.database_directory = tempfile.TemporaryDirectory()
+            path = os.path.join(cls.database_directory.name, 'stress.sqlite3')
+            connection.ensure_connection()
+            copy = sqlite3.connect(path)
+            connection.connection.backup(copy)
+            copy.close()
+            # Every thread connects with these settings, the in-memory
+            # connection is put back once the tests are done
+            cls.memory_database = (connection.settings_dict['NAME'], connection.connection)
+            connection.connection = None
+            connection.settings_dict['NAME'] = path
+
+    @classmethod
+    def tearDownClass(cls):
+        if cls.memory_database is not None:
+            connection.close()
+            connection.settings_dict['NAME'], connection.connection = cls.memory_database
+            cls.database_directory.cleanup()
+        super().tearDownClass()
+
+    def setUp(self):
+        # Shared caches of their own, so no group names or tokens cached for
+        # the same user ids by earlier runs are served
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        caches = override_settings(LITTLE_LEMON={
+            'ROLE_CACHE_TIMEOUT': 30,
+            'TOKEN_CACHE': {'BACKEND': 'file', 'LOCATION': os.path.join(directory.name, 'auth')},
+            'MENU_CACHE': {'BACKEND': 'file', 'LOCATION': os.path.join(directory.name, 'menu')},
+            'THROTTLE_STORE': {'BACKEND': 'sqlite', 'LOCATION': os.path.join(directory.name, 'throttle.sqlite3')},
+        })
+        caches.enable()
+        self.addCleanup(caches.disable)
+        token_cache.clear()
+        menu_cache.clear()
+        getThrottleStore().clear()
+        throttle_rates = mock.patch.dict(SlidingWindowRateThrottle.THROTTLE_RATES, {'user': '1000000/minute'})
+        throttle_rates.start()
+        self.addCleanup(throttle_rates.stop)
+        category = Category.objects.create(slug='main', title='Main')
+        self.popular = MenuItem.objects.create(title='Popular', price=Decimal('5.00'),
+                                               inventory=self.STOCK, category=category)
+        self.users = [User.objects.create_user(username='customer{0}'.format(i)) for i in range(self.THREADS)]
+
+    # SQLite allows a single writer, a checkout that finds the database
+    # locked is retried, at most this many times per customer
+    MAX_BUSY_RETRIES = 500
+
+    def is_busy(self, error):
+        return isinstance(error, OperationalError) and 'locked' in str(error)
+
+    def run_customer(self, user, results):
+        # The test client re-raises exceptions of any thread, so errors are read from the response
+        client = APIClient(raise_request_exception=False)
+        client.force_authenticate(user=user)
+        placed = retries = 0
+        error = None
+        try:
+            while retries <= self.MAX_BUSY_RETRIES:
+                try:
+                    Cart.objects.get_or_create(user=user, menuitem=self.popular, defaults={
+                        'quantity': 1, 'unit_price': self.popular.price, 'price': self.popular.price})
+                except OperationalError as e:
+                    if not self.is_busy(e):
+                        raise
+                    retries += 1
+                    continue
+                response = client.post('/api/orders')
+                if response.status_code == 409:
+                    break
+                if response.status_code == 201:
+                    placed += 1
+                elif response.exc_info is not None and self.is_busy(response.exc_info[1]):
+                    retries += 1
+                else:
+                    error = "status {0}: {1}".format(
+                        response.status_code, response.exc_info[1] if response.exc_info else response.content)
+                    break
+            else:
+                error = "database still locked after {0} retries".format(self.MAX_BUSY_RETRIES)
+        except Exception as e:
+            error = repr(e)
+        finally:
+            connection.close()
+        results.append((placed, retries, error))
+
+    def test_concurrent_checkouts_never_oversell(self):
+        results = []
+        threads = [threading.Thread(target=self.run_customer, args=(user, results)) for user in self.users]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        placed = sum(result[0] for result in results)
+        print("\ncheckout stress threads={0} checkouts={1} retries={2} time={3:.3f}s throughput={4:.0f} checkouts/s".format(
+            self.THREADS, placed, sum(result[1] for result in results), elapsed, placed / elapsed))
+        self.assertEqual(len(results), self.THREADS)
+        self.assertEqual([result[2] for result in results if result[2] is not None], [])
+        self.assertEqual(placed, self.STOCK)
+        self.assertEqual(MenuItem.objects.get(pk=self.popular.pk).inventory, 0)
+        self.assertEqual(sum(OrderItem.objects.values_list('quantity', flat=True)), self.STOCK)
+
+
+# Checkout time by cart size, the query count is checked by CheckoutTests
+class CheckoutBenchmark(Benchmark, LittleLemonTestCase):
+    CART_SIZES = (1, 10, 30, 100)
+    ROUNDS = 9
+
+    def test_checkout_time_by_cart_size(self):
+        menu_items = self.create_menu_items(max(self.CART_SIZES))
+        client = self.client_for(self.customer)
+        for size in self.CART_SIZES:
+            timings = []
+            for _ in range(self.ROUNDS):
+                self.fill_cart(self.customer, menu_items[:size])
+                started = time.perf_counter()
+                response = client.post('/api/orders')
+                timings.append(time.perf_counter() - started)
+                self.assertEqual(response.status_code, 201)
+            self.report("checkout cart_size={0:>4} median={1:.2f}ms".format(
+                size, sorted(timings)[len(timings) // 2] * 1000))
+
+
+class FlatSerializationTests(LittleLemonTestCase):
+    def setUp(self):
+        super().setUp()
+        MenuItem.objects.bulk_create([
+            MenuItem(title=title, price=Decimal(price), inventory=inventory, category=self.category)
+            for title, price, inventory in (('Soup', '2.00', 0), ('Caf\u00e9 \u2028 cr\u00e8me', '9.99', 7),
+                                            ('Steak', '1234.56', 32767), ('Tea', '3.33', 1), ('Salad', '2.15', 3))
+        ])
+        self.menu_items = list(MenuItem.objects.order_by('id'))
+        with self.captureOnCommitCallbacks(execute=True):
+            Rating.objects.create(user=self.customer, menuitem_id=self.menu_items[1].id, rating=4)
+
+    def assert_same_output(self, drf_data, flat_data):
+        for renderer in (JSONRenderer(), XMLRenderer()):
+            self.assertEqual(renderer.render(flat_data), renderer.render(drf_data))
+        self.assertEqual(FastJSONRenderer().render(flat_data), JSONRenderer().render(drf_data))
+
+    def test_menu_items_match_the_serializer(self):
+        for include_rating in (False, True):
+            queryset = MenuItem.objects.order_by('id')
+            drf_data = MenuItemSerializer(queryset.select_related('rating_summary'), many=True,
+                                          context={'include_rating': include_rating}).data
+            flat_data = getMenuItemsWithJsonType(queryset.values(*getMenuItemValues(include_rating)), include_rating)
+            self.assert_same_output(drf_data, flat_data)
+        # Rounded to cents, half to even like the sales report
+        self.assertEqual([menu_item['price_after_tax'] for menu_item in flat_data],
+                         [Decimal('2.20'), Decimal('10.99'), Decimal('1358.02'), Decimal('3.66'), Decimal('2.36')])
+        self.assertIn('<price_after_tax>1358.02</price_after_tax>', XMLRenderer().render(flat_data))
+
+    def test_order_items_match_the_serializer(self):
+        self.create_orders(2, user=self.customer)
+        self.assert_same_output(OrderItemSerializer(OrderItem.objects.all(), many=True).data,
+                                getOrderItemsWithJsonType(OrderItem.objects.values(*ORDER_ITEM_VALUES)))
+
+    def test_fast_renderer_matches_json_renderer(self):
+        data = {"when": Order.objects.none(), "date": date(2024, 1, 2), "total": Decimal('1.10'),
+                "at": timezone.now(), "text": 'a\u2029b', "nested": [{"x": None, "y": True}]}
+        for media_type in (None, 'application/json; indent=4'):
+            self.assertEqual(FastJSONRenderer().render(data, media_type), JSONRenderer().render(data, media_type))
+
+
+class MenuSerializationBenchmark(Benchmark, LittleLemonTestCase):
+    ITEMS = 10000
+    ROUNDS = 5
+
+    def best_of(self, render):
+        timings = []
+        for _ in range(self.ROUNDS):
+            started = time.perf_counter()
+            content = render()
+            timings.append(time.perf_counter() - started)
+        return min(timings), content
+
+    def test_flat_path_on_10k_items(self):
+        self.create_menu_items(self.ITEMS)
+        queryset = MenuItem.objects.order_by('id')
+        drf_time, drf_content = self.best_of(
+            lambda: JSONRenderer().render(MenuItemSerializer(queryset.all(), many=True).data))
+        flat_time, flat_content = self.best_of(
+            lambda: FastJSONRenderer().render(getMenuItemsWithJsonType(queryset.values(*getMenuItemValues()))))
+        self.assertEqual(flat_content, drf_content)
+        self.report("serialize items={0} drf={1:.1f}ms flat={2:.1f}ms speedup={3:.1f}x".format(
+            self.ITEMS, drf_time * 1000, flat_time * 1000, drf_time / flat_time))
+
+
+class CartBatchTests(LittleLemonTestCase):
+    url = '/api/cart/menu-items/batch'
+
+    def setUp(self):
+        super().setUp()
+        self.menu_items = self.create_menu_items(20, price='3.00')
+        self.client = self.client_for(self.customer)
+
+    def post_batch(self, lines, **extra):
+        return self.client.post(self.url, dict(items=lines, **extra), format='json')
+
+    def test_upserts_and_removes_lines(self):
+        first, second, third = self.menu_items[:3]
+        self.fill_cart(self.customer, [first, second], quantity=1)
+        response = self.post_batch([
+            {'menuitem_id': first.id, 'quantity': 4},
+            {'menuitem_id': second.id, 'quantity': 0},
+            {'menuitem_id': third.id, 'quantity': 2},
+        ])
+        self.assertEqual(response.status_code, 200)
+        lines = dict(Cart.objects.filter(user=self.customer).values_list('menuitem_id', 'quantity'))
+        self.assertEqual(lines, {first.id: 4, third.id: 2})
+        self.assertEqual(Cart.objects.get(user=self.customer, menuitem=first).price, Decimal('12.00'))
+        self.assertEqual(response.data['count'], 2)
+
+    def test_replace_clears_other_lines(self):
+        self.fill_cart(self.customer, self.menu_items[:5])
+        self.post_batch([{'menuitem_id': self.menu_items[7].id, 'quantity': 1}], replace=True)
+        self.assertEqual(list(Cart.objects.filter(user=self.customer).values_list('menuitem_id', flat=True)),
+                         [self.menu_items[7].id])
+
+    def test_invalid_menu_item_rejects_the_batch(self):
+        response = self.post_batch([{'menuitem_id': self.menu_items[0].id, 'quantity': 1},
+                                    {'menuitem_id': 999999, 'quantity': 1}])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Cart.objects.exists())
+
+    def test_query_count_does_not_grow_with_batch_size(self):
+        def count(lines):
+            Cart.objects.all().delete()
+            with CaptureQueriesContext(connection) as context:
+                self.assertEqual(self.post_batch(lines).status_code, 200)
+            return len(context.captured_queries)
+
+        count([{'menuitem_id': self.menu_items[0].id, 'quantity': 1}])
+        small = count([{'menuitem_id': item.id, 'quantity': 1} for item in self.menu_items[:2]])
+        large = count([{'menuitem_id': item.id, 'quantity': 1} for item in self.menu_items])
+        self.assertEqual(small, large)
+
+    def test_clear_cart_is_one_delete(self):
+        self.fill_cart(self.customer, self.menu_items)
+        with CaptureQueriesContext(connection) as context:
+            self.client.delete('/api/cart/menu-items')
+        self.assertEqual(len([query for query in context.captured_queries if query['sql'].startswith('DELETE')]), 1)
+        self.assertFalse(Cart.objects.exists())
+
+
+class MenuSearchTests(LittleLemonTestCase):
+    def setUp(self):
+        super().setUp()
+        drinks = Category.objects.create(slug='drinks', title='Drinks')
+        self.items = {
+            title: MenuItem.objects.create(title=title, price=Decimal(price), inventory=10, category=category)
+            for title, price, category in (
+                ('Greek Salad', '12.00', self.category),
+                ('Greek Lemon Chicken', '18.00', self.category),
+                ('Chicken Burger', '15.00', self.category),
+                ('Cheeseburger', '14.00', self.category),
+                ('Lemonade', '4.00', drinks),
+            )
+        }
+        menu_cache.bump_version()
+        self.client = self.client_for(self.customer)
+
+    def search(self, **params):
+        response = self.client.get('/api/menu-items', dict({'perpage': 10}, **params))
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def titles(self, **params):
+        return [item['title'] for item in self.search(**params)['result']]
+
+    def check_backend(self, options):
+        self.assertEqual(self.titles(search='greek'), ['Greek Salad', 'Greek Lemon Chicken'])
+        # Prefix matching on every word, exact words rank higher
+        self.assertEqual(self.titles(search='lemon'), ['Greek Lemon Chicken', 'Lemonade'])
+        self.assertEqual(self.titles(search='chi gre'), ['Greek Lemon Chicken'])
+        # Combined with the other filters and an explicit ordering
+        self.assertEqual(self.titles(search='lemon', category='Drinks'), ['Lemonade'])
+        self.assertEqual(self.titles(search='chicken', to_price=16), ['Chicken Burger'])
+        self.assertEqual(self.titles(search='chicken', ordering='-price'), ['Greek Lemon Chicken', 'Chicken Burger'])
+        self.assertEqual(self.titles(search='pizza'), [])
+        # Terms inside a word, as title__contains matched them, shortest title first
+        self.assertEqual(self.titles(search='urger'), ['Cheeseburger', 'Chicken Burger'])
+        self.assertEqual(self.titles(search='eese'), ['Cheeseburger'])
+        # The filters apply before SEARCH_MAX_RESULTS, which does not bound the count or the pages
+        with override_settings(LITTLE_LEMON=dict(options, SEARCH_MAX_RESULTS=1)):
+            data = self.search(search='chicken', to_price=16)
+            self.assertEqual(([item['title'] for item in data['result']], data['count']), (['Chicken Burger'], 1))
+            data = self.search(search='greek', perpage=1, page=2)
+            self.assertEqual(([item['title'] for item in data['result']], data['count']),
+                             (['Greek Lemon Chicken'], 2))
+            self.assertIsNone(data['next'])
+            self.assertEqual(self.search(search='urger', category='Drinks')['count'], 0)
+
+    def test_database_backend(self):
+        self.check_backend({})
+        # Infix matches are only looked for when no word matches
+        self.assertEqual(self.titles(search='burger'), ['Chicken Burger'])
+        # and come from the in-process index rather than a LIKE scan
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(self.search(search='urger')['count'], 2)
+        self.assertFalse([query for query in context.captured_queries if ' LIKE ' in query['sql']])
+
+    def test_memory_backend(self):
+        with override_settings(LITTLE_LEMON={'SEARCH_BACKEND': 'memory'}):
+            self.check_backend({'SEARCH_BACKEND': 'memory'})
+            # Infix matches still work, ranked after word matches
+            self.assertEqual(self.titles(search='burger'), ['Chicken Burger', 'Cheeseburger'])
+
+    def test_memory_index_is_updated_incrementally(self):
+        with override_settings(LITTLE_LEMON={'SEARCH_BACKEND': 'memory'}):
+            self.assertEqual(searchMenuItems('salad'), [self.items['Greek Salad'].id])
+            built_version = search_index.version
+            with self.captureOnCommitCallbacks(execute=True):
+                MenuItem.objects.filter(pk=self.items['Cheeseburger'].id).get().delete()
+                salad = self.items['Greek Salad']
+                salad.title = 'Greek Village Salad'
+                salad.save()
+                MenuItem.objects.create(title='Caesar Salad', price=Decimal('11.00'), inventory=3,
+                                        category=self.category)
+            with CaptureQueriesContext(connection) as context:
+                self.assertEqual(len(searchMenuItems('salad')), 2)
+                self.assertEqual(searchMenuItems('village'), [salad.id])
+                self.assertEqual(searchMenuItems('cheese'), [])
+            self.assertEqual(context.captured_queries, [])
+            self.assertNotEqual(search_index.version, built_version)
+
+
+class RatingAggregateTests(LittleLemonTestCase):
+    def setUp(self):
+        super().setUp()
+        self.menu_items = self.create_menu_items(3)
+        self.raters = [User.objects.create_user(username='rater{0}'.format(i)) for i in range(3)]
+
+    def rate(self, user, menu_item, rating):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client_for(user).post(
+                '/api/ratings', {'menuitem_id': menu_item.id, 'rating': rating}, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+
+    def test_ratings_update_the_aggregate(self):
+        for user, rating in zip(self.raters, (5, 4, 4)):
+            self.rate(user, self.menu_items[0], rating)
+        aggregate = MenuItemRating.objects.get(menuitem=self.menu_items[0])
+        self.assertEqual((aggregate.count, aggregate.total, aggregate.average), (3, 13, Decimal('4.33')))
+        self.assertEqual([aggregate.rating_4, aggregate.rating_5], [2, 1])
+
+        Rating.objects.filter(user=self.raters[0]).delete()
+        aggregate.refresh_from_db()
+        self.assertEqual((aggregate.count, aggregate.average, aggregate.rating_5), (2, Decimal('4.00'), 0))
+
+    def test_rating_unknown_menu_item(self):
+        response = self.client_for(self.customer).post('/api/ratings', {'menuitem_id': 9999, 'rating': 3})
+        self.assertEqual(response.status_code, 400)
+
+    def test_rebuild_command(self):
+        Rating.objects.bulk_create([
+            Rating(user=user, menuitem_id=menu_item.id, rating=rating)
+            for user in self.raters for menu_item, rating in zip(self.menu_items, (1, 3, 5))
+        ] + [Rating(user=self.customer, menuitem_id=9999, rating=5)])
+        call_command('rebuild_rating_aggregates', stdout=StringIO())
+        averages = dict(MenuItemRating.objects.values_list('menuitem_id', 'average'))
+        self.assertEqual(averages, {self.menu_items[0].id: Decimal('1.00'), self.menu_items[1].id: Decimal('3.00'),
+                                    self.menu_items[2].id: Decimal('5.00')})
+
+    def test_avg_rating_without_a_query_per_item(self):
+        self.rate(self.customer, self.menu_items[1], 2)
+        client = self.client_for(self.customer)
+        self.assertNotIn('avg_rating', client.get('/api/menu-items').data['result'][0])
+        with CaptureQueriesContext(connection) as context:
+            response = client.get('/api/menu-items', {'include': 'avg_rating', 'perpage': 3})
+        self.assertEqual([item['avg_rating'] for item in response.data['result']], [None, '2.00', None])
+        self.assertFalse(any('menuitemrating' in query['sql'] and 'JOIN' not in query['sql']
+                             for query in context.captured_queries))
+        response = client.get('/api/menu-items/{0}'.format(self.menu_items[1].id), {'include': 'avg_rating'})
+        self.assertEqual(response.data['result']['avg_rating'], '2.00')
+
+    def test_top_rated(self):
+        for user in self.raters:
+            self.rate(user, self.menu_items[0], 3)
+            self.rate(user, self.menu_items[2], 5)
+        self.rate(self.customer, self.menu_items[1], 5)
+        response = self.client_for(self.customer).get('/api/menu-items/top-rated', {'min_count': 2})
+        self.assertEqual([item['menuitem']['id'] for item in response.data['result']],
+                         [self.menu_items[2].id, self.menu_items[0].id])
+        self.assertEqual(response.data['result'][0]['histogram'], [0, 0, 0, 0, 0, 3])
+
+
+class ConditionalGetTests(LittleLemonTestCase):
+    def setUp(self):
+        super().setUp()
+        self.menu_items = self.create_menu_items(3)
+        self.create_orders(2, user=self.customer, delivery_crew=self.delivery_person)
+        self.order = Order.objects.order_by('id').first()
+
+    def revalidate(self, client, url, **params):
+        response = client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Last-Modified', response)
+        return client.get(url, params, HTTP_IF_NONE_MATCH=response['ETag']), response['ETag']
+
+    def test_menu_items_revalidate_without_queries(self):
+        client = self.client_for(self.customer)
+        for url in ('/api/menu-items', '/api/menu-items/{0}'.format(self.menu_items[0].id)):
+            response = client.get(url)
+            with self.assertNumQueries(0):
+                response = client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.content, b'')
+
+    def test_menu_change_changes_the_etag(self):
+        client = self.client_for(self.manager)
+        response, etag = self.revalidate(client, '/api/menu-items', perpage=5)
+        self.assertEqual(response.status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            client.patch('/api/menu-items/{0}'.format(self.menu_items[0].id), {'price': '7.00'})
+        response = client.get('/api/menu-items', {'perpage': 5}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_etag_depends_on_query_and_media_type(self):
+        client = self.client_for(self.customer)
+        etags = {client.get('/api/menu-items', params, HTTP_ACCEPT=accept)['ETag']
+                 for params, accept in (({}, 'application/json'), ({'perpage': 1}, 'application/json'),
+                                        ({}, 'application/xml'))}
+        self.assertEqual(len(etags), 3)
+
+    def test_orders_revalidate_before_loading_them(self):
+        client = self.client_for(self.customer)
+        for url in ('/api/orders', '/api/orders/{0}'.format(self.order.id)):
+            response, etag = self.revalidate(client, url)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response['ETag'], etag)
+
+        response = client.get('/api/orders/{0}'.format(self.order.id))
+        with CaptureQueriesContext(connection) as context:
+            client.get('/api/orders/{0}'.format(self.order.id), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertFalse(any('orderitem' in query['sql'] for query in context.captured_queries))
+
+    def test_order_changes_change_the_etag(self):
+        client = self.client_for(self.customer)
+        list_etag = client.get('/api/orders')['ETag']
+        order_etag = client.get('/api/orders/{0}'.format(self.order.id))['ETag']
+        self.client_for(self.delivery_person).patch('/api/orders/{0}'.format(self.order.id), {'status': 1})
+        self.assertNotEqual(client.get('/api/orders', HTTP_IF_NONE_MATCH=list_etag).status_code, 304)
+        self.assertNotEqual(client.get('/api/orders/{0}'.format(self.order.id),
+                                       HTTP_IF_NONE_MATCH=order_etag).status_code, 304)
+
+        # Deleting an older order leaves the newest updated_at as it was
+        list_etag = client.get('/api/orders')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Order.objects.exclude(pk=self.order.pk).delete()
+        self.assertEqual(client.get('/api/orders', HTTP_IF_NONE_MATCH=list_etag).status_code, 200)
+
+    def test_checkout_touches_updated_at(self):
+        updated_at = MenuItem.objects.get(pk=self.menu_items[0].pk).updated_at
+        self.fill_cart(self.customer, self.menu_items[:1])
+        self.client_for(self.customer).post('/api/orders')
+        self.assertGreater(MenuItem.objects.get(pk=self.menu_items[0].pk).updated_at, updated_at)
+
+
+class OrderExportTests(LittleLemonTestCase):
+    def setUp(self):
+        super().setUp()
+        self.create_orders(5, user=self.customer, items_per_order=2)
+        Order.objects.create(user=self.customer, total=Decimal('0.00'), date=date(2020, 1, 1))
+        self.client = self.client_for(self.manager)
+
+    def export(self, **params):
+        response = self.client.get('/api/orders/export', params, HTTP_ACCEPT='text/csv')
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_ndjson_matches_the_order_json(self):
+        lines = self.export().splitlines()
+        self.assertEqual(len(lines), 6)
+        expected = getOrdersWithJsonType(Order.objects.order_by('date', 'id'))
+        self.assertEqual([json.loads(line) for line in lines], json.loads(JSONRenderer().render(expected)))
+
+    def test_csv_has_a_row_per_order_item(self):
+        rows = list(csv.reader(StringIO(self.export(output='csv'))))
+        self.assertEqual(rows[0][:2], ['order_id', 'user_id'])
+        # 5 orders of 2 items and one order without items
+        self.assertEqual(len(rows), 1 + 5 * 2 + 1)
+        self.assertEqual(rows[1][6:], ['', '', '', ''])
+
+    def test_date_range(self):
+        self.assertEqual(len(self.export(end_date='2020-12-31').splitlines()), 1)
+        self.assertEqual(len(self.export(start_date=date.today().isoformat()).splitlines()), 5)
+        response = self.client.get('/api/orders/export', {'start_date': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_reads_bounded_chunks(self):
+        with override_settings(LITTLE_LEMON={'ORDERS_EXPORT_CHUNK_SIZE': 2}):
+            with CaptureQueriesContext(connection) as context:
+                self.assertEqual(len(self.export().splitlines()), 6)
+        order_queries = [query['sql'] for query in context.captured_queries
+                         if 'FROM "LittleLemonAPI_order"' in query['sql']]
+        self.assertEqual(len(order_queries), 3)
+        self.assertTrue(all('LIMIT 3' in sql for sql in order_queries))
+
+    def test_only_for_manager(self):
+        response = self.client_for(self.customer).get('/api/orders/export')
+        self.assertEqual(response.status_code, 403)
+
+
+class SalesRollupTests(LittleLemonTestCase):
+    def setUp(self):
+        super().setUp()
+        self.menu_items = self.create_menu_items(3, price='4.00')
+        self.client = self.client_for(self.customer)
+
+    def checkout(self, menu_items, quantity):
+        self.fill_cart(self.customer, menu_items, quantity=quantity)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.post('/api/orders').status_code, 201)
+
+    def report(self, **params):
+        response = self.client_for(self.manager).get('/api/reports/sales', params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_checkout_and_delete_update_the_rollups(self):
+        self.checkout(self.menu_items[:2], quantity=2)
+        self.checkout(self.menu_items[1:], quantity=1)
+        report = self.report()
+        self.assertEqual(report['totals'], {'order_count': 2, 'quantity': 6, 'revenue': '24.00'})
+        self.assertEqual([(item['menuitem_id'], item['order_count'], item['quantity'], item['revenue'])
+                          for item in report['menu_items']],
+                         [(self.menu_items[1].id, 2, 3, '12.00'), (self.menu_items[0].id, 1, 2, '8.00'),
+                          (self.menu_items[2].id, 1, 1, '4.00')])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client_for(self.manager).delete('/api/orders/{0}'.format(Order.objects.order_by('id').first().id))
+        report = self.report()
+        self.assertEqual(report['totals'], {'order_count': 1, 'quantity': 2, 'revenue': '8.00'})
+        self.assertEqual(len(report['menu_items']), 2)
+
+    # Every checkout of the day adds to the same DailySales row, which is only
+    # locked once the checkout has committed
+    def test_checkout_applies_the_rollups_after_commit(self):
+        self.fill_cart(self.customer, self.menu_items, quantity=1)
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.assertEqual(self.client.post('/api/orders').status_code, 201)
+            self.assertFalse(DailySales.objects.exists())
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.report()['totals'], {'order_count': 1, 'quantity': 3, 'revenue': '12.00'})
+
+    def test_backfill_command_matches_incremental_rollups(self):
+        self.checkout(self.menu_items, quantity=3)
+        self.create_orders(2, user=self.customer)
+        Order.objects.filter(pk__in=Order.objects.order_by('-id').values('pk')[:1]).update(date=date(2020, 5, 1))
+        call_command('rebuild_sales_rollups', stdout=StringIO())
+        incremental = self.report()
+        call_command('rebuild_sales_rollups', '--start-date', '2020-05-01', '--end-date', '2020-05-01',
+                     stdout=StringIO())
+        self.assertEqual(self.report(), incremental)
+        self.assertEqual(incremental['totals']['order_count'], 3)
+        self.assertEqual(self.report(end_date='2020-12-31')['totals'],
+                         {'order_count': 1, 'quantity': 3, 'revenue': '15.00'})
+
+    # The backfill of migration 0006 is a frozen copy of rebuildSalesRollups
+    def test_migration_backfill_matches_the_rebuild(self):
+        self.checkout(self.menu_items, quantity=2)
+        self.create_orders(2, user=self.customer)
+        call_command('rebuild_sales_rollups', stdout=StringIO())
+        rebuilt = self.report()
+        DailySales.objects.all().delete()
+        DailyMenuItemSales.objects.all().delete()
+        importlib.import_module('LittleLemonAPI.migrations.0006_sales_rollups').rollup_orders(django_apps, None)
+        self.assertEqual(self.report(), rebuilt)
+
+    def test_report_reads_only_the_rollups(self):
+        self.checkout(self.menu_items, quantity=1)
+        with CaptureQueriesContext(connection) as context:
+            self.report(start_date=date.today().isoformat())
+        self.assertFalse(any('"LittleLemonAPI_order' in query['sql'] for query in context.captured_queries))
+
+    def test_only_for_manager(self):
+        self.assertEqual(self.client.get('/api/reports/sales').status_code, 403)
+        response = self.client_for(self.manager).get('/api/reports/sales', {'end_date': 'soon'})
+        self.assertEqual(response.status_code, 400)
+
+
+# Run a request of the async test client to completion
+def asgiRequest(client: AsyncClient, method: str, path: str, *args, **extra):
+    async def request():
+        return await getattr(client, method)(path, *args, **extra)
+    return async_to_sync(request)()
+
+
+class AsyncViewTests(LittleLemonTestCase):
+    HEADERS = ('Content-Type', 'ETag', 'Last-Modified', 'Allow', 'Vary', 'WWW-Authenticate', 'Retry-After')
+
+    def setUp(self):
+        super().setUp()
+        self.menu_items = self.create_menu_items(5)
+        with self.captureOnCommitCallbacks(execute=True):
+            Rating.objects.create(user=self.customer, menuitem_id=self.menu_items[0].id, rating=4)
+        self.create_orders(3, user=self.customer, delivery_crew=self.delivery_person)
+        self.fill_cart(self.customer, self.menu_items[:2])
+        self.tokens = {user.username: Token.objects.create(user=user).key
+                       for user in (self.customer, self.manager, self.delivery_person)}
+
+    def auth(self, user: User):
+        return {'Authorization': 'Token ' + self.tokens[user.username]}
+
+    # Same request through the sync view under WSGI and the async view under ASGI
+    def get_both(self, path, headers):
+        # Both views build their payload from the database
+        with mock.patch.object(menu_cache, 'get', return_value=None), \
+                mock.patch.object(menu_cache, 'aget', mock.AsyncMock(return_value=None)):
+            sync_response = Client().get(path, headers=headers)
+            async_response = asgiRequest(AsyncClient(), 'get', path, headers=headers)
+        return sync_response, async_response
+
+    def assert_same_response(self, path, headers):
+        sync_response, async_response = self.get_both(path, headers)
+        self.assertEqual(async_response.status_code, sync_response.status_code, path)
+        self.assertEqual(async_response.content, sync_response.content, path)
+        for header in self.HEADERS:
+            self.assertEqual(async_response.get(header), sync_response.get(header), (path, header))
+        return async_response
+
+    def test_async_views_match_sync_views(self):
+        item_id = self.menu_items[0].id
+        paths = {
+            self.customer: ['/api/menu-items', '/api/menu-items?include=avg_rating&perpage=2&page=2',
+                            '/api/menu-items?perpage=2&page=3', '/api/menu-items?cursor=&perpage=2',
+                            '/api/menu-items?search=item&perpage=2', '/api/menu-items?ordering=-price,title',
+                            '/api/menu-items?category=Main&to_price=9', '/api/menu-items?ordering=bogus',
+                            '/api/menu-items?cursor=bogus', '/api/menu-items/{0}'.format(item_id),
+                            '/api/menu-items/{0}?include=avg_rating'.format(item_id), '/api/menu-items/999999',
+                            '/api/cart/menu-items', '/api/orders', '/api/orders?cursor=bogus'],
+            self.manager: ['/api/orders?perpage=1', '/api/cart/menu-items'],
+            self.delivery_person: ['/api/orders'],
+        }
+        for user, user_paths in paths.items():
+            for path in user_paths:
+                with self.subTest(user=user.username, path=path):
+                    self.assert_same_response(path, self.auth(user))
+
+    def test_served_by_the_async_views(self):
+        for path in ('/api/menu-items', '/api/menu-items/1', '/api/cart/menu-items', '/api/orders'):
+            response = asgiRequest(AsyncClient(), 'get', path, headers=self.auth(self.customer))
+            self.assertIn(response.resolver_match.func.view_class, AsyncAPIView.__subclasses__())
+        # WSGI requests keep the sync views
+        self.assertIs(Client().get('/api/orders', headers=self.auth(self.customer)).resolver_match.func.view_class,
+                      OrderListView)
+
+    def test_not_modified(self):
+        response = self.assert_same_response('/api/orders', self.auth(self.customer))
+        headers = dict(self.auth(self.customer), **{'If-None-Match': response['ETag']})
+        self.assertEqual(self.assert_same_response('/api/orders', headers).status_code, 304)
+
+    def test_authentication_errors(self):
+        for headers in ({}, {'Authorization': 'Token nope'}, {'Authorization': 'Token'},
+                        {'Authorization': 'Token a b'}):
+            with self.subTest(headers=headers):
+                self.assertEqual(self.assert_same_response('/api/orders', headers).status_code, 401)
+        self.customer.is_active = False
+        self.customer.save()
+        self.assertEqual(self.assert_same_response('/api/orders', self.auth(self.customer)).status_code, 401)
+
+    # Sessions only reach /api/ with API mode off
+    @override_settings(LITTLE_LEMON={'API_MODE': {'ENABLED': False}})
+    def test_session_authentication(self):
+        client = AsyncClient()
+        client.force_login(self.customer)
+        response = asgiRequest(client, 'get', '/api/cart/menu-items')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['count'], 2)
+
+    def test_throttles_are_shared_with_the_sync_views(self):
+        with mock.patch.dict(SlidingWindowRateThrottle.THROTTLE_RATES, {'user': '2/minute'}):
+            self.assertEqual(Client().get('/api/orders', headers=self.auth(self.customer)).status_code, 200)
+            client = AsyncClient()
+            self.assertEqual(asgiRequest(client, 'get', '/api/orders', headers=self.auth(self.customer)).status_code, 200)
+            response = asgiRequest(client, 'get', '/api/orders', headers=self.auth(self.customer))
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+        self.assertIn(b'Request was throttled', response.content)
+
+    def test_other_methods_and_renderers_use_the_sync_views(self):
+        client = AsyncClient()
+        response = asgiRequest(client, 'post', '/api/cart/menu-items', {
+            'menuitem_id': self.menu_items[3].id, 'quantity': 1, 'unit_price': '5.00', 'price': '5.00',
+        }, content_type='application/json', headers=self.auth(self.customer))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Cart.objects.filter(user=self.customer).count(), 3)
+        for headers in ({'Accept': 'application/xml'}, {'Accept': 'application/json; indent=4'}):
+            sync_response, async_response = self.get_both('/api/menu-items', dict(self.auth(self.customer), **headers))
+            self.assertEqual(async_response.content, sync_response.content)
+            self.assertEqual(async_response['Content-Type'], sync_response['Content-Type'])
+
+
+# Throughput and tail latency of the four async views under ASGI against
+# their sync views under WSGI, with CONCURRENCY clients at once. WSGI runs
+# one thread per client as a threaded server would; ASGI runs every client
+# on one event loop.
+class AsyncViewBenchmark(Benchmark, TransactionTestCase):
+    CONCURRENCY = 64
+    REQUESTS_PER_CLIENT = 10
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest("Needs a test database shared between threads")
+        cache.clear()
+        token_cache.clear()
+        getThrottleStore().clear()
+        category = Category.objects.create(slug='main', title='Main')
+        MenuItem.objects.bulk_create([
+            MenuItem(title='Item {0}'.format(i), price=Decimal('5.00'), inventory=100, category=category)
+            for i in range(200)
+        ])
+        self.menu_item = MenuItem.objects.first()
+        self.customer = User.objects.create_user(username='customer')
+        orders = Order.objects.bulk_create([
+            Order(user=self.customer, total=Decimal('15.00'), date=date.today()) for _ in range(50)])
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, menuitem=self.menu_item, quantity=3, unit_price=Decimal('5.00'),
+                      price=Decimal('15.00'))
+            for order in orders
+        ])
+        Cart.objects.create(user=self.customer, menuitem=self.menu_item, quantity=1,
+                            unit_price=Decimal('5.00'), price=Decimal('5.00'))
+        self.headers = {'Authorization': 'Token ' + Token.objects.create(user=self.customer).key}
+        self.paths = ['/api/menu-items?perpage=20', '/api/menu-items?cursor=&perpage=20',
+                      '/api/menu-items/{0}'.format(self.menu_item.id), '/api/cart/menu-items', '/api/orders']
+
+    def get_path(self, client_number, request_number):
+        return self.paths[(client_number + request_number) % len(self.paths)]
+
+    def run_wsgi_client(self, client_number, latencies):
+        client = Client()
+        try:
+            for request_number in range(self.REQUESTS_PER_CLIENT):
+                started = time.perf_counter()
+                response = client.get(self.get_path(client_number, request_number), headers=self.headers)
+                latencies.append(time.perf_counter() - started)
+                self.assertEqual(response.status_code, 200)
+        finally:
+            connection.close()
+
+    async def run_asgi_client(self, client_number, latencies):
+        client = AsyncClient()
+        for request_number in range(self.REQUESTS_PER_CLIENT):
+            started = time.perf_counter()
+            response = await client.get(self.get_path(client_number, request_number), headers=self.headers)
+            latencies.append(time.perf_counter() - started)
+            self.assertEqual(response.status_code, 200)
+
+    def run_wsgi(self, latencies):
+        threads = [threading.Thread(target=self.run_wsgi_client, args=(number, latencies))
+                   for number in range(self.CONCURRENCY)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    async def run_asgi(self, latencies):
+        await asyncio.gather(*[self.run_asgi_client(number, latencies) for number in range(self.CONCURRENCY)])
+
+    def measure(self, run):
+        latencies = []
+        started = time.perf_counter()
+        run(latencies)
+        elapsed = time.perf_counter() - started
+        self.assertEqual(len(latencies), self.CONCURRENCY * self.REQUESTS_PER_CLIENT)
+        latencies.sort()
+        return len(latencies) / elapsed, latencies[int(len(latencies) * 0.99) - 1] * 1000
+
+    def test_wsgi_against_asgi(self):
+        with mock.patch.dict(SlidingWindowRateThrottle.THROTTLE_RATES, {'user': '1000000/minute'}):
+            # Warm up both stacks and the menu cache first
+            self.measure(self.run_wsgi)
+            wsgi_rps, wsgi_p99 = self.measure(self.run_wsgi)
+            asgi_rps, asgi_p99 = self.measure(async_to_sync(self.run_asgi))
+        self.report("concurrency={0} requests={1} wsgi={2:.0f} req/s p99={3:.1f}ms asgi={4:.0f} req/s p99={5:.1f}ms".format(
+            self.CONCURRENCY, self.CONCURRENCY * self.REQUESTS_PER_CLIENT, wsgi_rps, wsgi_p99, asgi_rps, asgi_p99))
+
+
+class BenchmarkSuiteTests(TransactionTestCase):
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest("Needs a test database shared between threads")
+        cache.clear()
+        token_cache.clear()
+        getThrottleStore().clear()
+        self.data = seedBenchmarkData(menu_items=60, customers=3, delivery_crew=2, orders=40)
+
+    def test_every_scenario_succeeds(self):
+        results = runBenchmark(self.data, concurrency=1, requests=3)
+        self.assertEqual([result['name'] for result in results['scenarios']],
+                         [scenario.name for scenario in SCENARIOS])
+        for result in results['scenarios']:
+            with self.subTest(scenario=result['name']):
+                self.assertEqual(result['requests'], 3)
+                self.assertEqual(result['errors'], 0, result['statuses'])
+                self.assertGreater(result['queries_per_request']['mean'], 0)
+                self.assertLessEqual(result['latency_ms']['p50'], result['latency_ms']['p99'])
+        json.dumps(results)
+
+    def test_asgi_clients_on_one_event_loop(self):
+        results = runBenchmark(self.data, concurrency=3, requests=6, server='asgi',
+                               scenarios=['menu-items', 'cart', 'orders-customer', 'orders-manager'])
+        for result in results['scenarios']:
+            with self.subTest(scenario=result['name']):
+                self.assertEqual(result['statuses'], {'200': 6})
+                self.assertGreater(result['queries_per_request']['mean'], 0)
+
+    def test_command_writes_results(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = '{0}/results.json'.format(directory)
+            call_command('benchmark_api', concurrency=2, requests=2, warmup=0, menu_items=20, customers=2,
+                         orders=10, scenario=['menu-items', 'checkout'], output=output, label='test',
+                         api_mode='off', stdout=StringIO())
+            with open(output) as file:
+                results = json.load(file)
+        self.assertEqual((results['label'], results['api_mode']), ('test', False))
+        self.assertEqual([result['name'] for result in results['scenarios']], ['menu-items', 'checkout'])
+        # The command seeds a database of its own
+        self.assertEqual(MenuItem.objects.count(), 60)
+
+
+class RequestMetricsTests(LittleLemonTestCase):
+    def setUp(self):
+        super().setUp()
+        request_metrics.clear()
+        self.menu_items = self.create_menu_items(3)
+
+    def get_metrics(self):
+        response = self.client_for(self.manager).get('/api/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], PROMETHEUS_CONTENT_TYPE)
+        return response.content.decode()
+
+    def test_histograms_per_view(self):
+        client = self.client_for(self.customer)
+        for _ in range(2):
+            client.get('/api/orders')
+        client.get('/api/menu-items/{0}'.format(self.menu_items[0].id))
+        metrics = self.get_metrics()
+        self.assertIn('# TYPE littlelemon_request_duration_seconds histogram', metrics)
+        self.assertIn('littlelemon_request_duration_seconds_count{view="/api/orders",method="GET"} 2', metrics)
+        self.assertIn('littlelemon_request_queries_bucket{view="/api/menu-items/<int:pk>",method="GET",le="+Inf"} 1',
+                      metrics)
+        for name in ('db_seconds', 'serialization_seconds', 'queries'):
+            self.assertIn('littlelemon_request_{0}_count{{view="/api/orders",method="GET"}} 2'.format(name), metrics)
+
+    def test_query_count_and_server_timing(self):
+        client = self.client_for(self.customer)
+        with override_settings(LITTLE_LEMON={'METRICS': {'SERVER_TIMING': True}}):
+            with CaptureQueriesContext(connection) as context:
+                response = client.get('/api/orders')
+        timing = dict(part.strip().split(';', 1) for part in response['Server-Timing'].split(','))
+        self.assertEqual(set(timing), {'db', 'serialize', 'total'})
+        self.assertIn('desc="{0} queries"'.format(len(context.captured_queries)), timing['db'])
+        self.assertNotIn('Server-Timing', self.client_for(self.customer).get('/api/orders'))
+
+    def test_unmatched_and_disabled(self):
+        self.client_for(self.customer).get('/api/nowhere')
+        self.assertIn('view="unmatched",method="GET"', self.get_metrics())
+        request_metrics.clear()
+        with override_settings(LITTLE_LEMON={'METRICS': {'ENABLED': False}}):
+            self.client_for(self.customer).get('/api/orders')
+        self.assertEqual(request_metrics.series, {})
+
+    def test_manager_only(self):
+        self.assertEqual(self.client_for(self.customer).get('/api/metrics').status_code, 403)
+
+    def test_async_requests(self):
+        token = Token.objects.create(user=self.customer)
+        asgiRequest(AsyncClient(), 'get', '/api/orders', headers={'Authorization': 'Token ' + token.key})
+        self.assertIn('littlelemon_request_duration_seconds_count{view="/api/orders",method="GET"} 1',
+                      self.get_metrics())
+
+
+# Cost of the metrics middleware on a cheap, cached request
+class RequestMetricsBenchmark(Benchmark, LittleLemonTestCase):
+    REQUESTS = 2000
+    ROUNDS = 5
+
+    def time_requests(self, enabled: bool):
+        with override_settings(LITTLE_LEMON={'METRICS': {'ENABLED': enabled}}):
+            client = self.client_for(self.customer)
+            client.get('/api/menu-items')
+            started = time.perf_counter()
+            for _ in range(self.REQUESTS):
+                client.get('/api/menu-items')
+            return time.perf_counter() - started
+
+    def test_overhead(self):
+        self.create_menu_items(5)
+        with mock.patch.dict(SlidingWindowRateThrottle.THROTTLE_RATES, {'user': '1000000/s'}):
+            # Alternated so warm up favours neither
+            disabled = enabled = float('inf')
+            for _ in range(self.ROUNDS):
+                disabled = min(disabled, self.time_requests(False))
+                enabled = min(enabled, self.time_requests(True))
+        self.report("metrics requests={0} off={1:.3f}ms on={2:.3f}ms overhead={3:.1f}%".format(
+            self.REQUESTS, disabled / self.REQUESTS * 1000, enabled / self.REQUESTS * 1000,
+            (enabled / disabled - 1) * 100))
+
+
+class RequestProfilingTests(LittleLemonTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        profiling = override_settings(LITTLE_LEMON={
+            'PROFILING': {'ENABLED': True, 'LOCATION': directory.name, 'MAX_CAPTURES': 3}})
+        profiling.enable()
+        self.addCleanup(profiling.disable)
+        self.manager_client = self.client_for(self.manager)
+        self.create_orders(2, self.customer)
+        self.token = self.manager_client.post('/api/profiles/token').data['token']
+
+    def test_header_profiles_request(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client_for(self.customer).get('/api/orders', HTTP_X_PROFILE=self.token)
+        # The query log is reset by the next request
+        queries = [query['sql'] for query in context.captured_queries]
+        self.assertEqual(response.status_code, 200)
+        captures = self.manager_client.get('/api/profiles').data
+        self.assertEqual([capture['id'] for capture in captures], [response['X-Profile-Id']])
+        self.assertEqual(
+            {key: captures[0][key] for key in ('method', 'path', 'view', 'status', 'user', 'trigger', 'query_count')},
+            {'method': 'GET', 'path': '/api/orders', 'view': '/api/orders', 'status': 200,
+             'user': self.customer.id, 'trigger': 'header', 'query_count': len(queries)})
+
+        capture = self.manager_client.get('/api/profiles/' + response['X-Profile-Id']).data
+        self.assertEqual(len(capture['queries']), len(queries))
+        # Statements are kept without their parameters
+        self.assertEqual(capture['queries'][0]['sql'], queries[0].replace('= 1', '= %s'))
+        self.assertIn('views.py', capture['summary'])
+
+        download = self.manager_client.get('/api/profiles/{0}/download'.format(response['X-Profile-Id']))
+        self.assertEqual(download.status_code, 200)
+        self.assertIn('attachment', download['Content-Disposition'])
+        with tempfile.NamedTemporaryFile(suffix='.prof') as file:
+            file.write(b''.join(download.streaming_content))
+            file.flush()
+            self.assertGreater(pstats.Stats(file.name).total_calls, 0)
+
+    def test_unprofiled_requests(self):
+        client = self.client_for(self.customer)
+        for extra in ({}, {'HTTP_X_PROFILE': 'forged'}, {'HTTP_X_PROFILE': self.token[:-1]}):
+            self.assertNotIn('X-Profile-Id', client.get('/api/orders', **extra))
+        self.assertEqual(self.manager_client.get('/api/profiles').data, [])
+        self.assertEqual(self.manager_client.get('/api/profiles/..%2Fsampling').status_code, 404)
+
+    def test_sampling_flag(self):
+        client = self.client_for(self.customer)
+        response = self.manager_client.put('/api/profiles/sampling', {'view': '/api/orders', 'rate': 1}, format='json')
+        self.assertEqual(response.data['sampling']['view'], '/api/orders')
+        self.addCleanup(self.manager_client.delete, '/api/profiles/sampling')
+        self.assertIn('X-Profile-Id', client.get('/api/orders'))
+        self.assertNotIn('X-Profile-Id', client.get('/api/menu-items'))
+        self.assertEqual(self.manager_client.get('/api/profiles').data[0]['trigger'], 'sampling')
+
+        self.manager_client.delete('/api/profiles/sampling')
+        self.assertIsNone(self.manager_client.get('/api/profiles/sampling').data['sampling'])
+        self.assertNotIn('X-Profile-Id', client.get('/api/orders'))
+        for data in ({'rate': 0}, {'rate': 'all'}, {'minutes': 0}):
+            self.assertEqual(self.manager_client.put('/api/profiles/sampling', data, format='json').status_code, 400)
+
+    def test_captures_are_bounded(self):
+        client = self.client_for(self.customer)
+        capture_ids = [client.get('/api/orders', HTTP_X_PROFILE=self.token)['X-Profile-Id'] for _ in range(5)]
+        captures = self.manager_client.get('/api/profiles').data
+        self.assertEqual([capture['id'] for capture in captures], capture_ids[:1:-1])
+        self.assertEqual(self.manager_client.get('/api/profiles/' + capture_ids[0]).status_code, 404)
+
+    def test_async_view_is_profiled(self):
+        token = Token.objects.create(user=self.customer)
+        headers = {'Authorization': 'Token ' + token.key}
+        plain = asgiRequest(AsyncClient(), 'get', '/api/orders', headers=headers)
+        profiled = asgiRequest(AsyncClient(), 'get', '/api/orders', headers=dict(headers, X_Profile=self.token))
+        self.assertEqual(profiled.content, plain.content)
+        capture = self.manager_client.get('/api/profiles/' + profiled['X-Profile-Id']).data
+        self.assertEqual((capture['view'], capture['status'], capture['user']), ('/api/orders', 200, self.customer.id))
+
+    def test_manager_only(self):
+        client = self.client_for(self.customer)
+        self.assertEqual(client.get('/api/profiles').status_code, 403)
+        self.assertEqual(client.post('/api/profiles/token').status_code, 403)
+        self.assertEqual(client.put('/api/profiles/sampling', {'rate': 1}).status_code, 403)
+
+    def test_disabled(self):
+        # A worker started while profiling was on keeps the middleware
+        client = self.client_for(self.customer)
+        client.get('/api/orders')
+        with override_settings(LITTLE_LEMON={'PROFILING': {'ENABLED': False}}), \
+                mock.patch.object(ProfileStore, 'get_sampling') as get_sampling:
+            self.assertNotIn('X-Profile-Id', client.get('/api/orders', HTTP_X_PROFILE=self.token))
+            self.assertNotIn('X-Profile-Id', client.get('/api/orders'))
+            self.assertEqual(self.client_for(self.manager).get('/api/profiles').status_code, 404)
+        get_sampling.assert_not_called()
+
+    def test_default_location(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        with override_settings(BASE_DIR=directory.name, LITTLE_LEMON={'PROFILING': {'ENABLED': True}}):
+            response = self.client_for(self.customer).get('/api/orders', HTTP_X_PROFILE=self.token)
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(os.path.exists(os.path.join(
+                directory.name, '.cache', 'profiles', response['X-Profile-Id'] + '.json')))
+
+
+@override_settings(LITTLE_LEMON={'TOKEN_CACHE': {'BACKEND': 'default'}})
+class CachedTokenAuthenticationTests(LittleLemonTestCase):
+    def setUp(self):
+        super().setUp()
+        self.token = Token.objects.create(user=self.customer)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+    def token_queries(self, context):
+        return [query for query in context.captured_queries
+                if 'authtoken_token' in query['sql'] or 'FROM "auth_user" ' in query['sql']]
+
+    # The first request caches the token without a version, the second one
+    # with the version read before loading the user again
+    def cache_token(self, client):
+        for _ in range(2):
+            client.get('/api/orders')
+
+    def test_miss_runs_one_query(self):
+        for _ in range(2):
+            with CaptureQueriesContext(connection) as context:
+                self.assertEqual(self.client.get('/api/cart/menu-items').status_code, 200)
+            self.assertEqual(len(self.token_queries(context)), 1)
+
+    def test_hit_runs_no_query(self):
+        self.cache_token(self.client)
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(self.client.get('/api/cart/menu-items').status_code, 200)
+        self.assertEqual(self.token_queries(context), [])
+        # Another worker finds the token in the shared tier
+        token_cache.local.clear()
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(self.client.get('/api/cart/menu-items').status_code, 200)
+        self.assertEqual(self.token_queries(context), [])
+
+    def test_entry_holds_the_user_fields_views_read(self):
+        self.cache_token(self.client)
+        entry = token_cache.shared.get(token_cache.token_key(self.token.key))
+        self.assertEqual(entry['user'], {'id': self.customer.id, 'username': 'customer', 'is_active': True,
+                                         'is_staff': False, 'is_superuser': False})
+        # The cart views read the username, IsAdminUser is_staff
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(self.client.delete('/api/cart/menu-items').status_code, 204)
+        self.assertEqual(self.token_queries(context), [])
+        user, _ = CachedTokenAuthentication().authenticate_credentials(self.token.key)
+        with self.assertNumQueries(0):
+            self.assertEqual((user.username, user.is_staff, user.is_superuser), ('customer', False, False))
+        # The other fields of the user load when a view reads them
+        response = self.client.get('/api/users/users/me/')
+        self.assertEqual((response.data['username'], response.data['email']), ('customer', ''))
+
+    def test_logout_revokes_token(self):
+        self.client.get('/api/users/users/me/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.post('/api/token/logout/').status_code, 204)
+        response = self.client.get('/api/users/users/me/')
+        self.assertEqual((response.status_code, response.data['detail']), (401, 'Invalid token.'))
+
+    def test_user_changes_revoke_tokens(self):
+        self.cache_token(self.client)
+        # A login only updates last_login
+        self.customer.save(update_fields=['last_login'])
+        with CaptureQueriesContext(connection) as context:
+            self.client.get('/api/cart/menu-items')
+        self.assertEqual(self.token_queries(context), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.customer.is_active = False
+            self.customer.save()
+        response = self.client.get('/api/users/users/me/')
+        self.assertEqual((response.status_code, response.data['detail']), (401, 'User inactive or deleted.'))
+
+    def test_user_change_keeps_other_users_tokens(self):
+        other_client = APIClient()
+        other_client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=self.manager).key)
+        self.cache_token(other_client)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.customer.first_name = 'Changed'
+            self.customer.save()
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(other_client.get('/api/orders').status_code, 200)
+        self.assertEqual(self.token_queries(context), [])
+
+    def test_revocation_in_another_worker(self):
+        self.cache_token(self.client)
+        # Bumped in the shared tier, this worker's entry carries the old version
+        token_cache.bump_version(token_cache.user_version_key(self.customer.id))
+        with CaptureQueriesContext(connection) as context:
+            self.client.get('/api/cart/menu-items')
+        self.assertIn('authtoken_token', context.captured_queries[0]['sql'])
+
+    def test_invalid_token_is_not_cached(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Token nope')
+        for _ in range(2):
+            with self.assertNumQueries(1):
+                self.assertEqual(self.client.get('/api/users/users/me/').status_code, 401)
+
+    def test_async_views_share_the_cache(self):
+        self.cache_token(self.client)
+        headers = {'Authorization': 'Token ' + self.token.key}
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(asgiRequest(AsyncClient(), 'get', '/api/orders', headers=headers).status_code, 200)
+        self.assertFalse([query for query in context.captured_queries if 'authtoken_token' in query['sql']])
+
+
+API_MODE = {'API_MODE': {'ENABLED': True, 'PREFIX': '/api/'}}
+
+
+@override_settings(LITTLE_LEMON=API_MODE)
+class ApiModeTests(LittleLemonTestCase):
+    def setUp(self):
+        super().setUp()
+        self.create_menu_items(3)
+        self.token = Token.objects.create(user=self.customer)
+        self.headers = {'Authorization': 'Token ' + self.token.key}
+
+    def test_api_requests_skip_site_middleware(self):
+        response = Client().get('/api/menu-items', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Frame-Options', response)
+        self.assertNotIn('Cookie', response.get('Vary', ''))
+        self.assertEqual(Client().get('/browse/menu-items', headers=self.headers)['X-Frame-Options'], 'DENY')
+        with override_settings(LITTLE_LEMON={'API_MODE': {'ENABLED': False}}):
+            self.assertEqual(Client().get('/api/menu-items', headers=self.headers)['X-Frame-Options'], 'DENY')
+
+    def test_sessions_and_browsable_api_on_their_own_path(self):
+        client = Client()
+        client.force_login(self.customer)
+        self.assertEqual(client.get('/api/menu-items').status_code, 401)
+        response = client.get('/browse/menu-items', headers={'Accept': 'text/html'})
+        self.assertEqual((response.status_code, response['Content-Type']), (200, 'text/html; charset=utf-8'))
+        self.assertEqual(client.get('/admin/login/').status_code, 200)
+        # The site keeps its CSRF protection
+        response = Client(enforce_csrf_checks=True).post('/admin/login/', {'username': 'customer', 'password': 'secret'})
+        self.assertEqual(response.status_code, 403)
+
+    def test_negotiation_without_template_renderers(self):
+        client = Client()
+        self.assertEqual(client.get('/api/menu-items', headers=dict(self.headers, Accept='text/html')).status_code, 406)
+        self.assertEqual(client.get('/api/menu-items?format=api', headers=self.headers).status_code, 404)
+        response = client.get('/api/menu-items', headers=dict(self.headers, Accept='application/xml'))
+        self.assertEqual(response['Content-Type'], 'application/xml; charset=utf-8')
+        response = client.get('/api/menu-items', headers=dict(self.headers, Accept='text/html,*/*;q=0.8'))
+        self.assertEqual(response['Content-Type'], 'application/json')
+
+    def test_negotiation_table(self):
+        ApiContentNegotiation.table.clear()
+        headers = dict(self.headers, Accept='application/json; indent=2')
+        with mock.patch.object(DefaultContentNegotiation, 'select_renderer',
+                               side_effect=DefaultContentNegotiation.select_renderer, autospec=True) as select_renderer:
+            responses = [Client().get('/api/menu-items', headers=headers) for _ in range(3)]
+        self.assertEqual(select_renderer.call_count, 1)
+        self.assertEqual(len({response.content for response in responses}), 1)
+        self.assertIn(b'\n  ', responses[0].content)
+
+    def test_async_views(self):
+        response = asgiRequest(AsyncClient(), 'get', '/api/orders', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Frame-Options', response)
+
+
+# What API mode saves on a cheap, cached, token authenticated request
+class ApiModeBenchmark(Benchmark, LittleLemonTestCase):
+    REQUESTS = 2000
+    ROUNDS = 5
+
+    def time_requests(self, enabled: bool, headers):
+        with override_settings(LITTLE_LEMON={'API_MODE': {'ENABLED': enabled}}):
+            client = Client()
+            client.get('/api/menu-items', headers=headers)
+            started = time.perf_counter()
+            for _ in range(self.REQUESTS):
+                client.get('/api/menu-items', headers=headers)
+            return time.perf_counter() - started
+
+    def test_saved_per_request(self):
+        self.create_menu_items(5)
+        headers = {'Authorization': 'Token ' + Token.objects.create(user=self.customer).key}
+        with mock.patch.dict(SlidingWindowRateThrottle.THROTTLE_RATES, {'user': '1000000/s'}):
+            full = api_mode = float('inf')
+            for _ in range(self.ROUNDS):
+                full = min(full, self.time_requests(False, headers))
+                api_mode = min(api_mode, self.time_requests(True, headers))
+        self.report("api mode requests={0} full={1:.1f}us api={2:.1f}us saved={3:.1f}us ({4:.1f}%)".format(
+            self.REQUESTS, full / self.REQUESTS * 1e6, api_mode / self.REQUESTS * 1e6,
+            (full - api_mode) / self.REQUESTS * 1e6, (1 - api_mode / full) * 100))
+
+
+class DispatchTests(LittleLemonTestCase):
+    def setUp(self):
+        super().setUp()
+        self.other_person = User.objects.create_user(username='crew2', password='secret')
+        self.other_person.groups.add(self.delivery_crew_group)
+        inactive = User.objects.create_user(username='crew3', password='secret', is_active=False)
+        inactive.groups.add(self.delivery_crew_group)
+
+    def create_open_orders(self, count, delivery_crew: User = None, status=False):
+        return Order.objects.bulk_create([
+            Order(user=self.customer, delivery_crew=delivery_crew, status=status, total=Decimal('10.00'),
+                  date=date.today())
+            for _ in range(count)
+        ])
+
+    def test_least_loaded_crew_first(self):
+        self.create_open_orders(2, self.delivery_person)
+        self.create_open_orders(5, self.other_person, status=True)
+        orders = self.create_open_orders(4)
+        started = timezone.now()
+        result = dispatchOrders()
+        self.assertEqual(result, {"assigned": 4, "unassigned": 0,
+                                  "crew": {self.delivery_person.id: 1, self.other_person.id: 3}})
+        loads = dict(Order.objects.filter(status=False).values_list('delivery_crew_id').annotate(Count('id')))
+        self.assertEqual(loads, {self.delivery_person.id: 3, self.other_person.id: 3})
+        self.assertFalse(Order.objects.filter(id__in=[order.id for order in orders], updated_at__lt=started).exists())
+
+    def test_limit_and_max_load(self):
+        self.create_open_orders(6)
+        self.assertEqual(dispatchOrders(limit=1)['unassigned'], 5)
+        result = dispatchOrders(max_load=2)
+        self.assertEqual((result['assigned'], result['unassigned']), (3, 2))
+        self.assertEqual(Order.objects.filter(delivery_crew__isnull=False).count(), 4)
+
+    def test_queries_do_not_grow_with_orders(self):
+        self.create_open_orders(50)
+        # crew, loads, orders, one UPDATE per batch and the remaining count, in a savepoint
+        with self.assertNumQueries(9):
+            self.assertEqual(dispatchOrders(batch_size=20)['assigned'], 50)
+
+    def test_endpoint(self):
+        self.create_open_orders(3)
+        self.assertEqual(self.client_for(self.customer).post('/api/orders/dispatch').status_code, 403)
+        client = self.client_for(self.manager)
+        self.assertEqual(client.post('/api/orders/dispatch', {'limit': 'all'}, format='json').status_code, 400)
+        response = client.post('/api/orders/dispatch', {'limit': 2}, format='json')
+        self.assertEqual((response.status_code, response.data['assigned'], response.data['unassigned']), (200, 2, 1))
+
+    def test_command(self):
+        self.create_open_orders(3)
+        output = StringIO()
+        call_command('dispatch_orders', '--batch-size', '2', stdout=output)
+        self.assertEqual(output.getvalue().strip(), "Assigned 3 orders to 2 delivery crew, 0 left unassigned")
+
+
+# Dispatch of a dinner rush in one run
+class DispatchBenchmark(Benchmark, LittleLemonTestCase):
+    ORDERS = 10000
+    CREW = 50
+
+    def test_dispatch(self):
+        crew = User.objects.bulk_create([User(username='rush-crew-{0}'.format(index)) for index in range(self.CREW)])
+        self.delivery_crew_group.user_set.add(*crew)
+        Order.objects.bulk_create([
+            Order(user=self.customer, total=Decimal('10.00'), date=date.today()) for _ in range(self.ORDERS)
+        ], batch_size=1000)
+        with CaptureQueriesContext(connection) as context:
+            started = time.perf_counter()
+            result = dispatchOrders(batch_size=getSetting('DISPATCH_BATCH_SIZE'))
+            duration = time.perf_counter() - started
+        self.assertEqual(result['assigned'], self.ORDERS)
+        loads = Order.objects.values_list('delivery_crew_id').annotate(Count('id')).values_list('id__count', flat=True)
+        self.assertLessEqual(max(loads) - min(loads), 1)
+        self.report("dispatch orders={0} crew={1} time={2:.3f}s throughput={3:.0f} orders/s queries={4}".format(
+            self.ORDERS, self.CREW, duration, self.ORDERS / duration, len(context.captured_queries)))
+
+
+class OrderBatchUpdateTests(LittleLemonTestCase):
+    def setUp(self):
+        super().setUp()
+        self.other_person = User.objects.create_user(username='crew2', password='secret')
+        self.other_person.groups.add(self.delivery_crew_group)
+
+    def create_open_orders(self, count, delivery_crew: User = None):
+        return [order.id for order in Order.objects.bulk_create([
+            Order(user=self.customer, delivery_crew=delivery_crew, total=Decimal('10.00'), date=date.today())
+            for _ in range(count)
+        ])]
+
+    def test_delivery_run_is_one_update(self):
+        order_ids = self.create_open_orders(30, self.delivery_person)
+        client = self.client_for(self.delivery_person)
+        started = timezone.now()
+        # group names, savepoint, read and lock, one UPDATE, release
+        with self.assertNumQueries(5):
+            response = client.patch('/api/orders', {'orders': [{'id': order_id, 'status': True}
+                                                               for order_id in order_ids]}, format='json')
+        self.assertEqual((response.status_code, response.data['updated'], response.data['failed']), (200, 30, 0))
+        self.assertEqual(Order.objects.filter(status=True, updated_at__gte=started).count(), 30)
+
+    def test_per_order_results(self):
+        mine, theirs = self.create_open_orders(1, self.delivery_person) + self.create_open_orders(1, self.other_person)
+        response = self.client_for(self.delivery_person).patch('/api/orders', {'orders': [
+            {'id': mine, 'status': True},
+            {'id': theirs, 'status': True},
+            {'id': mine + 1000, 'status': True},
+        ]}, format='json')
+        self.assertEqual(response.data['results'], [
+            {'id': mine, 'result': 'updated'},
+            {'id': theirs, 'result': 'error', 'message': 'The order is not assigned to you'},
+            {'id': mine + 1000, 'result': 'error', 'message': 'Not found.'},
+        ])
+        self.assertEqual(list(Order.objects.order_by('id').values_list('status', flat=True)), [True, False])
+
+    def test_manager_assigns_and_updates_once(self):
+        unassigned, assigned = self.create_open_orders(2), self.create_open_orders(1, self.other_person)
+        changes = [
+            {'id': unassigned[0], 'delivery_crew': self.delivery_person.id, 'status': True},
+            {'id': unassigned[1], 'delivery_crew': self.customer.id},
+            {'id': assigned[0], 'delivery_crew': self.delivery_person.id},
+        ]
+        with CaptureQueriesContext(connection) as context:
+            response = self.client_for(self.manager).patch('/api/orders', {'orders': changes}, format='json')
+        self.assertEqual([result.get('message') for result in response.data['results']],
+                         [None, 'Must belong to Delivery crew', 'Order already assigned to another delivery person'])
+        self.assertEqual(len([query for query in context.captured_queries if query['sql'].startswith('UPDATE')]), 1)
+        order = Order.objects.get(id=unassigned[0])
+        self.assertEqual((order.delivery_crew_id, order.status), (self.delivery_person.id, True))
+
+    def test_invalid_requests(self):
+        order_ids = self.create_open_orders(1, self.delivery_person)
+        self.assertEqual(self.client_for(self.customer).patch(
+            '/api/orders', {'orders': [{'id': order_ids[0], 'status': True}]}, format='json').status_code, 403)
+        client = self.client_for(self.delivery_person)
+        for data in ({'orders': []}, {'orders': [{'id': order_ids[0]}]},
+                     {'orders': [{'id': order_ids[0], 'status': True}] * 2}):
+            self.assertEqual(client.patch('/api/orders', data, format='json').status_code, 400)
+        response = client.patch('/api/orders', {'orders': [{'id': order_ids[0], 'delivery_crew': 1}]}, format='json')
+        self.assertEqual(response.data['results'][0]['message'], 'Only a manager can assign orders')
+
+
+class MenuImportTests(LittleLemonTestCase):
+    def row(self, title, price='5.00', stock=10, category_id=None):
+        return {'title': title, 'price': price, 'stock': stock, 'category_id': category_id or self.category.id}
+
+    def test_creates_and_updates_by_title(self):
+        self.create_menu_items(1)
+        rows = [self.row('Item 0', price='7.50', stock=3), self.row('Soup <b>of</b> the day'),
+                self.row('<script>alert(1)</script>Pie')]
+        started = timezone.now()
+        with self.captureOnCommitCallbacks(execute=True):
+            result = importMenuItems(rows)
+        self.assertEqual(result, {"created": 2, "updated": 1, "errors": []})
+        item = MenuItem.objects.get(title='Item 0')
+        self.assertEqual((item.price, item.inventory), (Decimal('7.50'), 3))
+        self.assertGreaterEqual(item.updated_at, started)
+        self.assertEqual(set(MenuItem.objects.exclude(id=item.id).values_list('title', flat=True)),
+                         {'Soup <b>of</b> the day', '&lt;script&gt;alert(1)&lt;/script&gt;Pie'})
+
+    def test_queries_do_not_grow_with_rows(self):
+        self.create_menu_items(20)
+        rows = [self.row('Item {0}'.format(index)) for index in range(40)]
+        # savepoint, categories, two title chunks, an INSERT of the existing and one of the new items, release
+        with self.assertNumQueries(7):
+            self.assertEqual(importMenuItems(rows, chunk_size=20)['created'], 20)
+
+    def test_per_row_errors(self):
+        self.create_menu_items(1)
+        rows = [self.row('Fresh'), self.row('Bad price', price='1.00'), 'not a row',
+                self.row('Fresh'), self.row('Lost', category_id=999), {'title': 'Missing'}]
+        result = importMenuItems(rows)
+        self.assertEqual((result['created'], result['updated']), (0, 0))
+        self.assertEqual([row_error['row'] for row_error in result['errors']], [2, 3, 4, 5, 6])
+        errors = {row_error['row']: row_error['errors'] for row_error in result['errors']}
+        self.assertEqual(errors[4], {'title': ['Same title as row 1']})
+        self.assertEqual(errors[5], {'category_id': ['Invalid category id']})
+        self.assertEqual(set(errors[6]), {'price', 'stock', 'category_id'})
+        self.assertEqual(MenuItem.objects.count(), 1)
+
+        result = importMenuItems(rows, partial=True)
+        self.assertEqual((result['created'], len(result['errors'])), (1, 5))
+        result = importMenuItems([self.row('Fresh')], update_existing=False)
+        self.assertEqual(result['errors'], [{'row': 1, 'errors': {'title': ['menu item with this title already exists.']}}])
+
+    def test_bumps_menu_and_search_versions(self):
+        self.create_menu_items(1)
+        menu_version = menu_cache.get_version()
+        search_version = menu_cache.get_version(InvertedIndex.VERSION_KEY)
+        with self.captureOnCommitCallbacks(execute=True):
+            importMenuItems([self.row('Item 0', price='6.00')])
+        self.assertNotEqual(menu_cache.get_version(), menu_version)
+        self.assertEqual(menu_cache.get_version(InvertedIndex.VERSION_KEY), search_version)
+        with self.captureOnCommitCallbacks(execute=True):
+            importMenuItems([self.row('Lemon tart')])
+        self.assertNotEqual(menu_cache.get_version(InvertedIndex.VERSION_KEY), search_version)
+        self.assertEqual(searchMenuItems('tart'), [MenuItem.objects.get(title='Lemon tart').id])
+
+    def test_endpoint_json_and_csv(self):
+        self.assertEqual(self.client_for(self.customer).post(
+            '/api/menu-items/import', [self.row('Pie')], format='json').status_code, 403)
+        client = self.client_for(self.manager)
+        response = client.post('/api/menu-items/import', [self.row('Pie'), self.row('Cake', price='x')], format='json')
+        self.assertEqual((response.status_code, response.data['errors'][0]['row']), (400, 2))
+        response = client.post('/api/menu-items/import?partial=true', [self.row('Pie'), self.row('Cake', price='x')],
+                               format='json')
+        self.assertEqual((response.status_code, response.data['created']), (200, 1))
+
+        body = 'title,price,stock,category_id\nPie,6.50,4,{0}\n"Cake, lemon",8.00,2,{0}\n'.format(self.category.id)
+        response = client.post('/api/menu-items/import', body, content_type='text/csv')
+        self.assertEqual((response.status_code, response.data['created'], response.data['updated']), (200, 1, 1))
+        self.assertEqual(MenuItem.objects.get(title='Pie').price, Decimal('6.50'))
+        self.assertEqual(client.post('/api/menu-items/import?update=false', body,
+                                     content_type='text/csv').status_code, 400)
+        for data in ({}, []):
+            self.assertEqual(client.post('/api/menu-items/import', data, format='json').status_code, 400)
+
+    def test_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as file:
+            file.write('title,price,stock,category_id\nPie,6.50,4,{0}\nCake,1,2,{0}\n'.format(self.category.id))
+        output, errors = StringIO(), StringIO()
+        with self.assertRaisesMessage(Exception, "No menu items imported, 1 of 2 rows have errors"):
+            call_command('import_menu_items', file.name, stdout=output, stderr=errors)
+        self.assertIn("row 2: price:", errors.getvalue())
+        call_command('import_menu_items', file.name, '--partial', stdout=output, stderr=errors)
+        self.assertIn("Created 1 and updated 0 menu items, skipped 1 rows with errors", output.getvalue())
+
+
+# Import of a large menu file in one request
+class MenuImportBenchmark(Benchmark, LittleLemonTestCase):
+    ROWS = 50000
+
+    def test_import(self):
+        self.create_menu_items(1000)
+        categories = [self.category] + Category.objects.bulk_create([
+            Category(slug='category-{0}'.format(index), title='Category {0}'.format(index)) for index in range(20)])
+        rows = [{'title': 'Item {0}'.format(index), 'price': '{0}.50'.format(2 + index % 50), 'stock': index % 100,
+                 'category_id': categories[index % len(categories)].id} for index in range(self.ROWS)]
+        with CaptureQueriesContext(connection) as context:
+            started = time.perf_counter()
+            result = importMenuItems(rows, chunk_size=getSetting('MENU_IMPORT_CHUNK_SIZE'))
+            duration = time.perf_counter() - started
+        self.assertEqual((result['created'], result['updated'], result['errors']), (self.ROWS - 1000, 1000, []))
+        self.report("menu import rows={0} time={1:.3f}s throughput={2:.0f} rows/s queries={3}".format(
+            self.ROWS, duration, self.ROWS / duration, len(context.captured_queries)))
+
+
+# Runs EXPLAIN on every query the hot endpoints issue against the app tables
+# and fails when one of them reads a whole table. MySQL picks plans from table
+# statistics, which tiny test tables do not represent, so this runs on SQLite.
+@skipUnless(connection.vendor == 'sqlite', "Query plans are checked with SQLite")
+class QueryPlanTests(LittleLemonTestCase):
+    TABLE_PREFIX = 'LittleLemonAPI_'
+    # Small lookup tables that are fine to read whole
+    LOOKUP_TABLES = ('LittleLemonAPI_category',)
+
+    def setUp(self):
+        super().setUp()
+        self.menu_items = self.create_menu_items(6)
+        self.create_orders(3, user=self.customer, delivery_crew=self.delivery_person)
+        self.order = Order.objects.first()
+
+    def full_scans(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            details = [row[-1] for row in cursor.fetchall()]
+        # A page walked in primary key order stops at its LIMIT
+        bounded = ' LIMIT ' in sql and re.search(r'ORDER BY "\w+"\."id" (ASC|DESC) LIMIT', sql)
+        return [
+            detail for detail in details
+            if detail.startswith('SCAN ' + self.TABLE_PREFIX) and 'USING' not in detail
+            and 'VIRTUAL TABLE' not in detail and detail.split()[1] not in self.LOOKUP_TABLES and not bounded
+        ]
+
+    def assert_no_full_scan(self, user, method, url, data=None):
+        client = self.client_for(user)
+        with CaptureQueriesContext(connection) as context:
+            response = getattr(client, method)(url, data, format='json')
+        self.assertLess(response.status_code, 400, response.data)
+        for query in context.captured_queries:
+            sql = query['sql']
+            if self.TABLE_PREFIX not in sql or not sql.startswith(('SELECT', 'UPDATE', 'DELETE')):
+                continue
+            with self.subTest(url=url, sql=sql):
+                self.assertEqual(self.full_scans(sql), [])
+
+    def test_menu_items(self):
+        category_filter = {'category': self.category.title}
+        for params in ({}, {'page': 3}, {'cursor': ''}, {'ordering': '-price'}, {'ordering': 'title'},
+                       {'ordering': 'inventory', 'cursor': ''}, {'to_price': 5}, category_filter,
+                       dict(category_filter, to_price=5), {'search': 'item'}):
+            menu_cache.bump_version()
+            self.assert_no_full_scan(self.customer, 'get', '/api/menu-items', params)
+        self.assert_no_full_scan(self.customer, 'get', '/api/menu-items/{0}'.format(self.menu_items[0].id))
+        self.assert_no_full_scan(self.customer, 'get', '/api/menu-items/top-rated')
+
+    def test_cart(self):
+        self.fill_cart(self.customer, self.menu_items[:2])
+        self.assert_no_full_scan(self.customer, 'get', '/api/cart/menu-items')
+        self.assert_no_full_scan(self.customer, 'post', '/api/cart/menu-items/batch', {'items': [
+            {'menuitem_id': self.menu_items[3].id, 'quantity': 1},
+            {'menuitem_id': self.menu_items[0].id, 'quantity': 0},
+        ]})
+        self.assert_no_full_scan(self.customer, 'post', '/api/orders')
+        self.fill_cart(self.customer, self.menu_items[:2])
+        self.assert_no_full_scan(self.customer, 'delete', '/api/cart/menu-items')
+
+    def test_orders(self):
+        for user in (self.customer, self.delivery_person, self.manager):
+            self.assert_no_full_scan(user, 'get', '/api/orders')
+        self.assert_no_full_scan(self.customer, 'get', '/api/orders/{0}'.format(self.order.id))
+        self.assert_no_full_scan(self.delivery_person, 'patch', '/api/orders/{0}'.format(self.order.id), {'status': 1})
@@ -1,7 +1,59 @@
-from rest_framework.throttling import UserRateThrottle, AnonRateThrottle
+from rest_framework import throttling
+
+from .utils.throttling import getThrottleStore
+
+
+# Sliding window counter throttle on the shared THROTTLE_STORE
+# Requests are counted per fixed window of the rate's duration; the count of
+# the previous window is weighted by how much of it still overlaps the sliding
+# window. A check is one atomic increment and one read, whatever the rate, and
+# because the store is shared every worker enforces the same limit.
+class SlidingWindowRateThrottle(throttling.SimpleRateThrottle):
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        store = getThrottleStore()
+        self.now = self.timer()
+        window, self.elapsed = divmod(self.now, self.duration)
+        current_key = "{0}:{1}".format(self.key, int(window))
+        self.count = store.incr(current_key, 1, self.duration * 2)
+        self.previous_count = store.get("{0}:{1}".format(self.key, int(window) - 1))
+        if self.get_estimate(self.count) > self.num_requests:
+            # Refused requests do not use up the budget
+            store.incr(current_key, -1, self.duration * 2)
+            self.count -= 1
+            return self.throttle_failure()
+        return self.throttle_success()
+
+    # Requests in the sliding window ending now
+    def get_estimate(self, count: int):
+        return self.previous_count * (1 - self.elapsed / self.duration) + count
+
+    def throttle_success(self):
+        return True
+
+    def wait(self):
+        remaining_duration = self.duration - self.elapsed
+        if self.count >= self.num_requests or not self.previous_count:
+            # Only the next window has room
+            return remaining_duration
+        # Until enough of the previous window has slid out for one more request
+        overlap = (self.num_requests - 1 - self.count) / self.previous_count
+        return max(0.0, min(remaining_duration, (1 - overlap) * self.duration - self.elapsed))
+
+
+class AnonRateThrottle(SlidingWindowRateThrottle, throttling.AnonRateThrottle):
+    pass
+
+
+class UserRateThrottle(SlidingWindowRateThrottle, throttling.UserRateThrottle):
+    pass
 
 
 class TenCallsPerMinute(UserRateThrottle):
     scope = 'ten'
-    
-
@@ -33,6 +33,11 @@ urlpatterns = [
     # Menu items endpoints
     path('menu-items', views.MenuItemList.as_view(), name=views.MenuItemList.menu_item_view_name),
     path('menu-items/<int:pk>', views.SingleMenuItemView.as_view()),
+    path('menu-items/top-rated', views.TopRatedMenuItemView.as_view()),
+    path('menu-items/import', views.MenuItemImportView.as_view()),
+
+    # Ratings
+    path('ratings', views.RatingsView.as_view()),
 
     # Manager
     path('groups/manager/users', views.ManagerListView.as_view()),
@@ -42,10 +47,24 @@ urlpatterns = [
 
     # Cart
     path('cart/menu-items', views.CartView.as_view()),
+    path('cart/menu-items/batch', views.CartBatchView.as_view()),
 
     # Order
     path('orders', views.OrderListView.as_view()),
+    path('orders/export', views.OrderExportView.as_view()),
+    path('orders/dispatch', views.OrderDispatchView.as_view()),
     path('orders/<int:pk>', views.SingleOrderView.as_view()),
 
+    # Reports
+    path('reports/sales', views.SalesReportView.as_view()),
+
+    # Monitoring
+    path('metrics', views.MetricsView.as_view()),
+    path('profiles', views.ProfileListView.as_view()),
+    path('profiles/token', views.ProfileTokenView.as_view()),
+    path('profiles/sampling', views.ProfileSamplingView.as_view()),
+    path('profiles/<str:capture_id>', views.SingleProfileView.as_view()),
+    path('profiles/<str:capture_id>/download', views.ProfileDownloadView.as_view()),
+
 
 ]
\ No newline at end of file
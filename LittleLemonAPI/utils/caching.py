@@ -0,0 +1,317 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.core.cache import caches
+from django.core.cache.backends.db import DatabaseCache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.db import transaction
+
+from LittleLemonAPI.utils.config import getSetting
+from LittleLemonAPI.utils.pagination import getCacheKey
+from LittleLemonAPI.utils.throttling import SQLiteStore
+
+
+# In-process cache with LRU eviction and per-entry expiry
+# Implements the part of the Django cache API used by the caches below.
+class LRUCache:
+    def __init__(self, max_entries: int, timeout: int = None):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self.entries[key]
+                return default
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout=-1):
+        timeout = self.timeout if timeout == -1 else timeout
+        expires_at = time.monotonic() + timeout if timeout is not None else None
+        with self.lock:
+            self.entries[key] = (value, expires_at)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def add(self, key, value, timeout=-1):
+        with self.lock:
+            if key in self.entries:
+                return False
+        self.set(key, value, timeout)
+        return True
+
+    def incr(self, key, delta=1):
+        with self.lock:
+            if key not in self.entries:
+                raise ValueError("Key '{0}' not found".format(key))
+            value, expires_at = self.entries[key]
+            self.entries[key] = (value + delta, expires_at)
+            return value + delta
+
+    def delete(self, key):
+        with self.lock:
+            return self.entries.pop(key, None) is not None
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+# Versions of the 'file' backend, in a SQLite file next to the cache files
+# FileBasedCache.incr reads the value and writes it back, so two workers
+# bumping at once could both write the same version and one bump would be
+# lost, leaving stale pages cached; here a bump is one UPDATE, atomic under
+# SQLite's write lock. Implements the part of the cache API used for versions.
+class SQLiteVersionStore(SQLiteStore):
+    TABLE = "version"
+    COLUMNS = "key TEXT PRIMARY KEY, value NOT NULL"
+
+    def get(self, key, default=None):
+        row = self.connection.execute(
+            'SELECT value FROM {0} WHERE key = ?'.format(SQLiteVersionStore.TABLE), (key,)).fetchone()
+        return row[0] if row else default
+
+    def add(self, key, value, timeout=None):
+        return self.connection.execute(
+            'INSERT OR IGNORE INTO {0} (key, value) VALUES (?, ?)'.format(SQLiteVersionStore.TABLE),
+            (key, value)).rowcount == 1
+
+    def set(self, key, value, timeout=None):
+        self.connection.execute(
+            'INSERT OR REPLACE INTO {0} (key, value) VALUES (?, ?)'.format(SQLiteVersionStore.TABLE), (key, value))
+
+    def incr(self, key, delta=1):
+        value = self.write_returning(
+            'UPDATE {0} SET value = value + ? WHERE key = ?'.format(SQLiteVersionStore.TABLE),
+            (delta, key), key, 'value')
+        if value is None:
+            raise ValueError("Key '{0}' not found".format(key))
+        return value
+
+    def clear(self):
+        self.connection.execute('DELETE FROM {0}'.format(SQLiteVersionStore.TABLE))
+
+
+# Read cache for the serialized menu catalogue
+# Every key embeds the catalogue version, so bumping the version invalidates
+# all menu entries at once and the old ones simply age out of the LRU.
+# BACKEND 'locmem' keeps everything in the worker process; 'file' or the
+# alias of a Django cache adds a shared tier that also holds the version,
+# which is what makes a write in one worker visible to all the others.
+# Bumps must be atomic across workers: 'file' keeps the versions in a SQLite
+# file, a cache alias must be one with an atomic incr (memcached, redis or
+# locmem), the file and database cache backends are refused.
+class MenuCache:
+    SETTING = 'MENU_CACHE'
+    VERSION_KEY = "menu:version"
+
+    def __init__(self):
+        self.local = None
+        self.shared = None
+        self.versions = None
+
+    def configure(self):
+        options = getSetting(self.SETTING)
+        self.local = LRUCache(options.get('MAX_ENTRIES', 1000), options.get('TIMEOUT', 300))
+        backend = options.get('BACKEND', 'locmem')
+        self.versions = None
+        if backend == 'locmem':
+            self.shared = None
+        elif backend == 'file':
+            self.shared = FileBasedCache(str(options['LOCATION']), {
+                'TIMEOUT': options.get('TIMEOUT', 300),
+                'OPTIONS': {'MAX_ENTRIES': options.get('MAX_ENTRIES', 1000)},
+            })
+            self.versions = SQLiteVersionStore(os.path.join(str(options['LOCATION']), 'versions.sqlite3'))
+        else:
+            self.shared = caches[backend]
+            if isinstance(self.shared, (FileBasedCache, DatabaseCache)):
+                raise ImproperlyConfigured(
+                    "{0} BACKEND '{1}' has no atomic incr for the versions, use 'file' or a memcached or "
+                    "redis cache".format(self.SETTING, backend))
+
+    def reset(self):
+        self.local = None
+        self.shared = None
+        self.versions = None
+
+    # Drop every entry and version, for tests
+    def clear(self):
+        if self.local is None:
+            self.configure()
+        for store in (self.local, self.shared, self.versions):
+            if store is not None:
+                store.clear()
+
+    @property
+    def version_store(self):
+        if self.local is None:
+            self.configure()
+        if self.versions is not None:
+            return self.versions
+        return self.shared if self.shared is not None else self.local
+
+    # version_key selects one of the versions kept in the store, the catalogue
+    # version by default; other users such as the search index keep their own
+    def get_version(self, version_key=VERSION_KEY):
+        store = self.version_store
+        version = store.get(version_key)
+        if version is None:
+            # Start from the clock so a lost version never reuses old keys
+            store.add(version_key, int(time.time() * 1000), None)
+            version = store.get(version_key)
+        return version
+
+    def bump_version(self, version_key=VERSION_KEY):
+        store = self.version_store
+        store.set(version_key + ":modified", time.time(), None)
+        try:
+            return store.incr(version_key)
+        except ValueError:
+            self.get_version(version_key)
+            return store.incr(version_key)
+
+    # Unix time of the last bump of a version, None when not known
+    def get_modified(self, version_key=VERSION_KEY):
+        return self.version_store.get(version_key + ":modified")
+
+    # Bump the version once the current transaction commits, so a concurrent
+    # read can never cache rows that are about to change under the new version
+    def invalidate(self):
+        transaction.on_commit(self.bump_version)
+
+    def key(self, name: str, params, version=None):
+        return getCacheKey("menu:{0}:{1}".format(version or self.get_version(), name), params)
+
+    def get(self, key):
+        if self.local is None:
+            self.configure()
+        value = self.local.get(key)
+        if value is None and self.shared is not None:
+            value = self.shared.get(key)
+            if value is not None:
+                self.local.set(key, value)
+        return value
+
+    def set(self, key, value):
+        if self.local is None:
+            self.configure()
+        self.local.set(key, value)
+        if self.shared is not None:
+            self.shared.set(key, value)
+
+    # Async variants, only the shared tier is read or written in a thread
+    async def aget_version(self, version_key=VERSION_KEY):
+        if self.version_store is self.local:
+            return self.get_version(version_key)
+        return await sync_to_async(self.get_version)(version_key)
+
+    async def aget_modified(self, version_key=VERSION_KEY):
+        if self.version_store is self.local:
+            return self.get_modified(version_key)
+        return await sync_to_async(self.get_modified)(version_key)
+
+    async def aget(self, key):
+        if self.local is None:
+            self.configure()
+        value = self.local.get(key)
+        if value is None and self.shared is not None:
+            value = await sync_to_async(self.get)(key)
+        return value
+
+    async def aset(self, key, value):
+        if self.local is None:
+            self.configure()
+        self.local.set(key, value)
+        if self.shared is not None:
+            await sync_to_async(self.shared.set)(key, value)
+
+
+menu_cache = MenuCache()
+
+
+# Resolved API tokens, in the same two tiers as the menu cache
+# An entry holds the fields of the token's user that the views read (id,
+# username and the is_active, is_staff and is_superuser flags) and the user's
+# revocation version when it was cached, never the token itself or the
+# user's other fields and password hash. Deleting a token or changing a
+# user bumps the version of that user only, so a logout or deactivation in
+# one worker drops that user's entries in all of them while other users keep
+# theirs. Entries are keyed by the digest of the token, never the raw token.
+class TokenCache(MenuCache):
+    SETTING = 'TOKEN_CACHE'
+
+    def token_key(self, key: str):
+        return "auth:token:{0}".format(hashlib.sha256(key.encode()).hexdigest())
+
+    def user_version_key(self, user_id):
+        return "auth:user:{0}".format(user_id)
+
+    def get_user_version(self, user_id):
+        return self.get_version(self.user_version_key(user_id))
+
+    # Bump the user's version once the current transaction commits
+    def revoke(self, user_id):
+        transaction.on_commit(lambda: self.bump_version(self.user_version_key(user_id)))
+
+    # Group names of users, kept only in the shared tier: a membership change
+    # deletes them there and every worker sees it on its next request. With
+    # 'locmem' no tier is seen by all workers, so they are not cached at all.
+    def role_key(self, user_id):
+        return "roles:user:{0}".format(user_id)
+
+    def get_roles(self, user_id):
+        if self.local is None:
+            self.configure()
+        return self.shared.get(self.role_key(user_id)) if self.shared is not None else None
+
+    def set_roles(self, user_id, group_names, timeout: int):
+        if self.local is None:
+            self.configure()
+        if self.shared is not None:
+            self.shared.set(self.role_key(user_id), group_names, timeout)
+
+    def delete_roles(self, user_ids):
+        if self.local is None:
+            self.configure()
+        if self.shared is not None:
+            self.shared.delete_many([self.role_key(user_id) for user_id in user_ids])
+
+    async def aget_roles(self, user_id):
+        if self.local is None:
+            self.configure()
+        if self.shared is None:
+            return None
+        return await sync_to_async(self.shared.get)(self.role_key(user_id))
+
+    async def aset_roles(self, user_id, group_names, timeout: int):
+        if self.local is None:
+            self.configure()
+        if self.shared is not None:
+            await sync_to_async(self.shared.set)(self.role_key(user_id), group_names, timeout)
+
+
+token_cache = TokenCache()
+
+
+def resetMenuCache(setting, **kwargs):
+    if setting == 'LITTLE_LEMON':
+        menu_cache.reset()
+        token_cache.reset()
+
+
+setting_changed.connect(resetMenuCache)
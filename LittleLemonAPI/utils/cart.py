@@ -0,0 +1,29 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from LittleLemonAPI.models import Cart
+
+
+# Apply validated CartBatchSerializer lines to a user's cart in one transaction
+# Lines with a quantity are upserted with a single INSERT ... ON CONFLICT/
+# ON DUPLICATE KEY UPDATE, removed lines go away with a single DELETE.
+def applyCartBatch(user: User, lines, replace: bool = False):
+    upserts = [line for line in lines if line['quantity'] > 0]
+    with transaction.atomic():
+        if replace:
+            removed = Cart.objects.filter(user=user).exclude(menuitem_id__in=[line['menuitem_id'] for line in upserts])
+        else:
+            removed = Cart.objects.filter(user=user, menuitem_id__in=[
+                line['menuitem_id'] for line in lines if line['quantity'] == 0])
+        removed.delete()
+        if upserts:
+            Cart.objects.bulk_create(
+                [
+                    Cart(user=user, menuitem_id=line['menuitem_id'], quantity=line['quantity'],
+                         unit_price=line['unit_price'], price=line['unit_price'] * line['quantity'])
+                    for line in upserts
+                ],
+                update_conflicts=True,
+                unique_fields=['menuitem', 'user'],
+                update_fields=['quantity', 'unit_price', 'price'],
+            )
@@ -0,0 +1,95 @@
+from datetime import date
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+from django.utils import timezone
+
+from LittleLemonAPI.models import Cart, MenuItem, Order, OrderItem
+from LittleLemonAPI.utils.caching import menu_cache
+from LittleLemonAPI.utils.rollups import applyOrderToRollupsOnCommit
+
+
+class InsufficientInventory(Exception):
+    def __init__(self, errors):
+        super().__init__("Not enough stock")
+        # [{"menuitem_id", "requested", "available"}] for every short line
+        self.errors = errors
+
+
+class ReservationFailed(Exception):
+    pass
+
+
+# Take the ordered quantities out of MenuItem.inventory
+# One conditional UPDATE decrements every line whose stock covers it; it only
+# locks the rows of the ordered items, so checkouts of different items never
+# wait on each other. Raises ReservationFailed when any line was short.
+def reserveInventory(cart_items):
+    quantity = Case(*[When(pk=item['menuitem_id'], then=Value(item['quantity'])) for item in cart_items],
+                    output_field=IntegerField())
+    reserved = (MenuItem.objects.filter(pk__in=[item['menuitem_id'] for item in cart_items], inventory__gte=quantity)
+                .update(inventory=F('inventory') - quantity, updated_at=timezone.now()))
+    if reserved != len(cart_items):
+        raise ReservationFailed()
+
+
+# Get the cart lines that the current stock cannot cover
+def getShortLines(cart_items):
+    available = dict(MenuItem.objects.filter(pk__in=[item['menuitem_id'] for item in cart_items])
+                     .values_list('id', 'inventory'))
+    return [
+        {
+            "menuitem_id": item['menuitem_id'],
+            "requested": item['quantity'],
+            "available": max(available.get(item['menuitem_id'], 0), 0),
+        }
+        for item in cart_items
+        if available.get(item['menuitem_id'], 0) < item['quantity']
+    ]
+
+
+# Insert an order item for each of the cart lines with one bulk INSERT
+def copyCartLines(order: Order, cart_items):
+    OrderItem.objects.bulk_create([
+        OrderItem(order=order, menuitem_id=item['menuitem_id'], quantity=item['quantity'],
+                  unit_price=item['unit_price'], price=item['price'])
+        for item in cart_items
+    ])
+
+
+# Turn a user's cart into an order as one atomic unit
+# Costs the same number of queries for any cart size: lock the cart lines,
+# reserve their stock, total them with an aggregate, insert the order, copy
+# the lines into order items and clear exactly the ordered lines with one
+# DELETE. The sales rollups are updated once it commits, the menu cache only
+# when an item sold out.
+# Returns None when the cart is empty and raises InsufficientInventory when
+# some line cannot be covered, in which case nothing is written.
+def checkoutCart(user: User, attempts: int = 3):
+    for _ in range(attempts):
+        try:
+            with transaction.atomic():
+                cart_items = list(Cart.objects.select_for_update().filter(user=user)
+                                  .values('id', 'menuitem_id', 'quantity', 'unit_price', 'price'))
+                if not cart_items:
+                    return None
+                reserveInventory(cart_items)
+                ordered_lines = Cart.objects.filter(id__in=[item['id'] for item in cart_items])
+                total = ordered_lines.aggregate(total=Sum('price'))['total']
+                order = Order.objects.create(user=user, total=total, date=date.today())
+                copyCartLines(order, cart_items)
+                applyOrderToRollupsOnCommit(order.date, total, cart_items)
+                ordered_lines.delete()
+                # The cached menu pages keep their stock figures until they
+                # expire, only an item selling out invalidates them
+                if MenuItem.objects.filter(pk__in=[item['menuitem_id'] for item in cart_items], inventory=0).exists():
+                    menu_cache.invalidate()
+            return order
+        except ReservationFailed:
+            # Rolled back, so the stock read here is the committed one
+            errors = getShortLines(cart_items)
+            if errors:
+                raise InsufficientInventory(errors)
+            # The stock was released meanwhile, try again
+    raise InsufficientInventory(getShortLines(cart_items))
@@ -0,0 +1,40 @@
+import hashlib
+import json
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+
+# Version in the menu cache store bumped when orders are deleted, which
+# no remaining row's updated_at can reflect
+ORDERS_VERSION_KEY = "orders:version"
+
+
+# Strong ETag of the representation a request gets, built from the markers
+# its payload depends on (versions, updated_at) instead of the payload itself.
+# The full path and the negotiated media type are part of it, so every query
+# string and renderer has its own tag.
+def getETag(request, *markers):
+    raw = json.dumps([request.get_full_path(), getattr(request, 'accepted_media_type', None), markers],
+                     default=str)
+    return '"{0}"'.format(hashlib.md5(raw.encode()).hexdigest())
+
+
+# Add the ETag and Last-Modified headers to a response
+def setValidators(response, etag: str, last_modified=None):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+# Get a 304 response when the request's If-None-Match / If-Modified-Since
+# still match, None when the full response has to be built
+# last_modified is a Unix timestamp
+def getNotModifiedResponse(request, etag: str, last_modified=None):
+    if last_modified is not None:
+        last_modified = int(last_modified)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        return None
+    return setValidators(response, etag, last_modified)
@@ -0,0 +1,105 @@
+from django.conf import settings
+
+
+# Default values for the LITTLE_LEMON settings dict
+DEFAULTS = {
+    # Orders listing
+    'ORDERS_PAGE_SIZE': 20,
+    'ORDERS_MAX_PAGE_SIZE': 100,
+    # Seconds a per-role order count stays cached,
+    # 0 counts on every request and None leaves the count out
+    'ORDERS_COUNT_CACHE_TIMEOUT': 60,
+    # Orders read per query by the streaming export
+    'ORDERS_EXPORT_CHUNK_SIZE': 500,
+    # Automatic dispatch, orders written per UPDATE and the open orders a
+    # delivery person may hold before getting no more, None for no limit
+    'DISPATCH_BATCH_SIZE': 1000,
+    'DISPATCH_MAX_LOAD': None,
+    # Bulk menu import, rows per INSERT / UPDATE / IN query and the rows a
+    # request to /api/menu-items/import may send
+    'MENU_IMPORT_CHUNK_SIZE': 1000,
+    'MENU_IMPORT_MAX_ROWS': 50000,
+    # Menu items listing
+    'MENU_ITEMS_PAGE_SIZE': 2,
+    'MENU_ITEMS_MAX_PAGE_SIZE': 100,
+    # Seconds a filtered menu item count and page bookmarks stay cached
+    'MENU_ITEMS_COUNT_CACHE_TIMEOUT': 60,
+    'MENU_ITEMS_BOOKMARK_TIMEOUT': 300,
+    # Rows a numbered page may skip with OFFSET from the nearest bookmark or
+    # the first row; pages further away get a 400, cursor paging has no limit
+    'MENU_ITEMS_MAX_OFFSET': 1000,
+    # Menu search, 'auto' uses the database full-text index when the
+    # database has one and the in-process index otherwise ('memory');
+    # results in an explicit ordering are the SEARCH_MAX_RESULTS most
+    # relevant ones, the default relevance order pages through all of them
+    'SEARCH_BACKEND': 'auto',
+    'SEARCH_MAX_RESULTS': 1000,
+    # Top rated menu items, items need TOP_RATED_MIN_COUNT ratings to be listed
+    'TOP_RATED_PAGE_SIZE': 10,
+    'TOP_RATED_MAX_PAGE_SIZE': 100,
+    'TOP_RATED_MIN_COUNT': 1,
+    # Seconds a user's group names stay cached between requests, 0 disables it;
+    # they are kept in the shared tier of TOKEN_CACHE, which every worker reads
+    # and a membership change clears, so with its 'locmem' backend they are not
+    # cached
+    'ROLE_CACHE_TIMEOUT': 0,
+    # Store of the API throttle counters, BACKEND is 'sqlite' (with LOCATION)
+    # or the alias of a Django cache from CACHES; it must be shared by every
+    # worker for the DEFAULT_THROTTLE_RATES to hold across them
+    'THROTTLE_STORE': {
+        'BACKEND': 'default',
+    },
+    # Request metrics recorded by RequestMetricsMiddleware and served to
+    # managers by /api/metrics; SERVER_TIMING also adds a Server-Timing
+    # header with the database, serialization and total time to responses
+    'METRICS': {
+        'ENABLED': True,
+        'SERVER_TIMING': False,
+    },
+    # On demand request profiles kept by RequestProfilingMiddleware in the
+    # directory LOCATION (BASE_DIR/.cache/profiles when not given), at most
+    # MAX_CAPTURES of them; SAMPLE_RATE is the
+    # default fraction of requests profiled while a manager has sampling on
+    # and TOKEN_MAX_AGE the seconds an X-Profile header token stays valid
+    'PROFILING': {
+        'ENABLED': False,
+        'MAX_CAPTURES': 50,
+        'SAMPLE_RATE': 0.01,
+        'TOKEN_MAX_AGE': 3600,
+    },
+    # API mode: requests under PREFIX skip the session, CSRF, auth, messages
+    # and clickjacking middleware and the template based renderers, so they
+    # authenticate with tokens only; the browsable API is served with the
+    # full middleware under /browse/
+    'API_MODE': {
+        'ENABLED': False,
+        'PREFIX': '/api/',
+    },
+    # Menu read cache, BACKEND is 'locmem', 'file' (with LOCATION, the
+    # versions go to a SQLite file there) or the alias of a memcached or
+    # redis cache from CACHES, whose incr keeps version bumps atomic
+    'MENU_CACHE': {
+        'BACKEND': 'locmem',
+        'MAX_ENTRIES': 1000,
+        'TIMEOUT': 300,
+    },
+    # Resolved API tokens of CachedTokenAuthentication, same backends as
+    # MENU_CACHE; 'locmem' only revokes tokens in the worker that saw the
+    # logout or user change, a shared backend revokes them everywhere
+    'TOKEN_CACHE': {
+        'BACKEND': 'locmem',
+        'MAX_ENTRIES': 10000,
+        'TIMEOUT': 300,
+    },
+}
+
+
+# Get a LittleLemon API setting, falling back to its default value
+def getSetting(name: str):
+    return getattr(settings, 'LITTLE_LEMON', {}).get(name, DEFAULTS[name])
+
+
+# Path prefix of the requests served in API mode, None when API mode is off
+def getApiPrefix():
+    options = getSetting('API_MODE')
+    return options.get('PREFIX', '/api/') if options.get('ENABLED', False) else None
@@ -16,5 +16,9 @@ class GroupName:
         return "Delivery crew"
 
 
+# Fields menu items can be ordered by through the ordering query param
+MENU_ITEM_ORDERING_FIELDS = ('id', 'title', 'price', 'inventory')
+
+
 ONLY_CUSTOMER_RESPONSE = Response(
     {"message": "Only for customer"}, status=status.HTTP_403_FORBIDDEN)
@@ -0,0 +1,78 @@
+import heapq
+from collections import defaultdict
+
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.db.models import Case, Count, IntegerField, Value, When
+from django.utils import timezone
+
+from LittleLemonAPI.models import Order
+from LittleLemonAPI.utils.constants import GroupName
+
+
+# Assign open orders without a delivery person to the active delivery crew
+# The crew sit in a heap keyed by (open orders, id), loaded from one grouped
+# COUNT over Order(delivery_crew, status=False); orders are taken oldest
+# first and each goes to the least loaded person, whose load then grows by
+# one. Every batch of orders is written with a single UPDATE whose CASE
+# sets each order's delivery person, all inside one transaction, so the
+# query count does not depend on the number of orders.
+# max_load stops giving orders to people who already have that many open
+# and limit caps the orders assigned by this run. Orders are locked with
+# SKIP LOCKED where the database has it, so concurrent runs never take the
+# same order, and an order assigned by hand in the meantime is left alone.
+# Returns {"assigned", "unassigned" (open orders still without delivery
+# person), "crew": {delivery person id: orders assigned}}.
+def dispatchOrders(limit: int = None, max_load: int = None, batch_size: int = 1000):
+    with transaction.atomic():
+        crew_ids = list(User.objects.filter(groups__name=GroupName().DELIVERY_CREW, is_active=True)
+                        .values_list('id', flat=True))
+        loads = dict(Order.objects.filter(delivery_crew_id__in=crew_ids, status=False)
+                     .values_list('delivery_crew_id').annotate(Count('id')).order_by())
+        crew = [(loads.get(crew_id, 0), crew_id) for crew_id in crew_ids]
+        heapq.heapify(crew)
+
+        orders = Order.objects.filter(delivery_crew__isnull=True, status=False)
+        if connection.features.has_select_for_update:
+            orders = orders.select_for_update(skip_locked=connection.features.has_select_for_update_skip_locked)
+        order_ids = orders.order_by('date', 'id').values_list('id', flat=True)
+        if limit is not None:
+            order_ids = order_ids[:limit]
+        order_ids = list(order_ids)
+
+        assignments = []
+        for order_id in order_ids:
+            if not crew or (max_load is not None and crew[0][0] >= max_load):
+                break
+            load, crew_id = crew[0]
+            heapq.heapreplace(crew, (load + 1, crew_id))
+            assignments.append((order_id, crew_id))
+
+        assigned = defaultdict(int)
+        now = timezone.now()
+        for start in range(0, len(assignments), batch_size):
+            batch = defaultdict(list)
+            for order_id, crew_id in assignments[start:start + batch_size]:
+                batch[crew_id].append(order_id)
+            batch_orders = Order.objects.filter(
+                id__in=[order_id for order_id, _ in assignments[start:start + batch_size]])
+            updated = batch_orders.filter(delivery_crew__isnull=True).update(
+                delivery_crew_id=Case(
+                    *[When(id__in=batch_ids, then=Value(crew_id)) for crew_id, batch_ids in batch.items()],
+                    output_field=IntegerField()),
+                updated_at=now)
+            if updated == sum(len(batch_ids) for batch_ids in batch.values()):
+                for crew_id, batch_ids in batch.items():
+                    assigned[crew_id] += len(batch_ids)
+            else:
+                # Orders assigned by hand since they were read keep their delivery person
+                for crew_id, count in (batch_orders.filter(updated_at=now).values_list('delivery_crew_id')
+                                       .annotate(Count('id')).order_by()):
+                    assigned[crew_id] += count
+
+        unassigned = Order.objects.filter(delivery_crew__isnull=True, status=False).count()
+    return {
+        "assigned": sum(assigned.values()),
+        "unassigned": unassigned,
+        "crew": dict(sorted(assigned.items())),
+    }
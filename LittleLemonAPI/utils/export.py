@@ -0,0 +1,59 @@
+import csv
+
+from django.db.models import QuerySet
+
+from LittleLemonAPI.models import OrderItem
+from LittleLemonAPI.renderers import FastJSONRenderer
+from LittleLemonAPI.utils.functions import ORDER_VALUES, ORDER_ITEM_VALUES, getOrderJson, getOrderItemsWithJsonType
+from LittleLemonAPI.utils.pagination import KeysetPaginator
+
+
+CSV_HEADER = ('order_id', 'user_id', 'delivery_person_id', 'status', 'total', 'date',
+              'menuitem_id', 'quantity', 'unit_price', 'price')
+
+
+# Iterate over the orders of a queryset as json orders, oldest first
+# Orders are read in keyset chunks of chunk_size on the (date, id) index and
+# the items of each chunk with one IN query, so memory stays bounded by the
+# chunk size on every database; a plain .iterator() is fully buffered by the
+# MySQL client, and the item queries could not run while it is open anyway.
+def iterOrdersWithJsonType(orders: QuerySet, chunk_size: int):
+    paginator = KeysetPaginator(orders.values(*ORDER_VALUES), ordering=('date', 'id'), page_size=chunk_size)
+    cursor = None
+    while True:
+        rows, cursor, _ = paginator.paginate(cursor)
+        order_items = {row['id']: [] for row in rows}
+        if order_items:
+            for item in OrderItem.objects.filter(order_id__in=list(order_items)).values(*ORDER_ITEM_VALUES):
+                order_items[item['order_id']].append(item)
+        for row in rows:
+            yield getOrderJson(row, getOrderItemsWithJsonType(order_items[row['id']]))
+        if cursor is None:
+            return
+
+
+# One json order per line
+def iterOrdersNdjson(orders: QuerySet, chunk_size: int):
+    encoder = FastJSONRenderer.encoder
+    for order in iterOrdersWithJsonType(orders, chunk_size):
+        yield (encoder.encode(order) + '\n').encode()
+
+
+# Buffer for csv.writer that hands every written line back
+class Echo:
+    def write(self, value):
+        return value
+
+
+# One CSV row per order item, orders without items get one row of their own
+def iterOrdersCsv(orders: QuerySet, chunk_size: int):
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_HEADER).encode()
+    for order in iterOrdersWithJsonType(orders, chunk_size):
+        columns = [order['order_id'], order['user_id'], order['delivery_person_id'], int(order['status']),
+                   order['total'], order['date']]
+        if not order['order_items']:
+            yield writer.writerow(columns + [''] * 4).encode()
+        for item in order['order_items']:
+            yield writer.writerow(
+                columns + [item['menuitem_id'], item['quantity'], item['unit_price'], item['price']]).encode()
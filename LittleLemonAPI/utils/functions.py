@@ -1,24 +1,179 @@
-
 from django.http import HttpRequest
 
-
 from LittleLemonAPI.models import Order, OrderItem
-from LittleLemonAPI.serializers import OrderItemSerializer
+from LittleLemonAPI.serializers import calculatePriceAfterTax
+from LittleLemonAPI.utils.caching import token_cache
+from LittleLemonAPI.utils.config import getSetting
 from LittleLemonAPI.utils.constants import GroupName
 
+# Get the names of the groups the current user belongs to
+# Loaded with one query per request and kept on the request; when
+# ROLE_CACHE_TIMEOUT is set they are also cached between requests in the
+# shared tier of the token cache
+def getUserGroupNames(request: HttpRequest):
+    group_names = getattr(request, '_group_names', None)
+    if group_names is not None:
+        return group_names
+    user = request.user
+    if not user.is_authenticated:
+        group_names = frozenset()
+    else:
+        timeout = getSetting('ROLE_CACHE_TIMEOUT')
+        group_names = token_cache.get_roles(user.id) if timeout else None
+        if group_names is None:
+            group_names = frozenset(user.groups.values_list('name', flat=True))
+            if timeout:
+                token_cache.set_roles(user.id, group_names, timeout)
+    request._group_names = group_names
+    return group_names
+
+
+async def getUserGroupNamesAsync(request: HttpRequest):
+    group_names = getattr(request, '_group_names', None)
+    if group_names is not None:
+        return group_names
+    user = request.user
+    if not user.is_authenticated:
+        group_names = frozenset()
+    else:
+        timeout = getSetting('ROLE_CACHE_TIMEOUT')
+        group_names = await token_cache.aget_roles(user.id) if timeout else None
+        if group_names is None:
+            group_names = frozenset([name async for name in user.groups.values_list('name', flat=True)])
+            if timeout:
+                await token_cache.aset_roles(user.id, group_names, timeout)
+    request._group_names = group_names
+    return group_names
+
+
+# Drop the cached group names of users whose membership changed
+def invalidateUserGroupNames(user_ids):
+    token_cache.delete_roles(user_ids)
+
+
+# Check user belong to Manager group
+def isManager(request: HttpRequest):
+    return GroupName().MANAGER in getUserGroupNames(request)
+
+
+# Check user belong to Delivery crew group
+def isDeliveryCrew(request: HttpRequest):
+    return GroupName().DELIVERY_CREW in getUserGroupNames(request)
+
+
 # Check user belong to Customer group
 def isCustomer(request: HttpRequest):
-    return (request.user.groups.filter(name=GroupName().MANAGER).exists() == False) & (request.user.groups.filter(name=GroupName().DELIVERY_CREW).exists() == False)
+    group_names = getUserGroupNames(request)
+    return GroupName().MANAGER not in group_names and GroupName().DELIVERY_CREW not in group_names
+
+
+# Role checks of async views
+async def isManagerAsync(request: HttpRequest):
+    return GroupName().MANAGER in await getUserGroupNamesAsync(request)
+
+
+async def isDeliveryCrewAsync(request: HttpRequest):
+    return GroupName().DELIVERY_CREW in await getUserGroupNamesAsync(request)
+
+
+async def isCustomerAsync(request: HttpRequest):
+    group_names = await getUserGroupNamesAsync(request)
+    return GroupName().MANAGER not in group_names and GroupName().DELIVERY_CREW not in group_names
+
+
+# Check the include query param asks for the avg_rating of menu items
+def isRatingIncluded(request: HttpRequest):
+    return 'avg_rating' in request.GET.get('include', '').split(',')
+
+
+# Columns read by the flat menu item and order serializers below
+MENU_ITEM_VALUES = ('id', 'title', 'price', 'inventory', 'category_id')
+ORDER_VALUES = ('id', 'user_id', 'delivery_crew_id', 'status', 'total', 'date')
+ORDER_ITEM_VALUES = ('order_id', 'menuitem_id', 'quantity', 'unit_price', 'price')
+
+
+# Columns of a menu item .values() row, with the avg_rating join when included
+def getMenuItemValues(include_rating: bool = False):
+    if include_rating:
+        return MENU_ITEM_VALUES + ('rating_summary__average',)
+    return MENU_ITEM_VALUES
+
+
+# Format a 2 decimal places column like serializers.DecimalField does
+def formatDecimal(value):
+    return None if value is None else '{0:f}'.format(value)
+
+
+# Get json menu items from .values() rows
+# Produces exactly what MenuItemSerializer produces for the same items,
+# without building model instances or running DRF fields per item
+def getMenuItemsWithJsonType(rows, include_rating: bool = False):
+    menu_items = []
+    for row in rows:
+        menu_item = {
+            "id": row['id'],
+            "title": row['title'],
+            "price": formatDecimal(row['price']),
+            "stock": row['inventory'],
+            "price_after_tax": calculatePriceAfterTax(row['price']),
+            "category": row['category_id'],
+        }
+        if include_rating:
+            menu_item["avg_rating"] = formatDecimal(row['rating_summary__average'])
+        menu_items.append(menu_item)
+    return menu_items
+
+
+# Get json order items from .values() rows, as OrderItemSerializer does
+def getOrderItemsWithJsonType(rows):
+    return [
+        {
+            "order_id": row['order_id'],
+            "menuitem_id": row['menuitem_id'],
+            "quantity": row['quantity'],
+            "unit_price": formatDecimal(row['unit_price']),
+            "price": formatDecimal(row['price']),
+        }
+        for row in rows
+    ]
+
+
+def getOrderJson(row: dict, order_items):
+    return {
+        "order_id": row['id'],
+        "user_id": row['user_id'],
+        "delivery_person_id": row['delivery_crew_id'],
+        "status": row['status'],
+        "total": row['total'],
+        "date": row['date'],
+        "order_items": order_items
+    }
 
 
 # Get json order
+# Uses the foreign key ids directly so no user/crew row is loaded
 def getOrderWithJsonType(order: Order):
-    return {
-        "order_id": order.id,
-        "user_id": order.user.id,
-        "delivery_person_id": order.delivery_crew.id if order.delivery_crew else None,
-        "status": order.status,
-        "total": order.total,
-        "date": order.date,
-        "order_items": OrderItemSerializer(OrderItem.objects.all().filter(order_id=order.id), many=True).data
-    }
\ No newline at end of file
+    row = {field: getattr(order, field) for field in ORDER_VALUES}
+    return getOrderJson(row, getOrderItemsWithJsonType(order.orderitem_set.values(*ORDER_ITEM_VALUES)))
+
+
+# Get json orders in a fixed number of queries:
+# one for the orders and one for all of their order items
+# Takes orders as model instances or ORDER_VALUES rows
+def getOrdersWithJsonType(orders):
+    rows = [order if isinstance(order, dict) else {field: getattr(order, field) for field in ORDER_VALUES}
+            for order in orders]
+    order_items = {row['id']: [] for row in rows}
+    if order_items:
+        for item in OrderItem.objects.filter(order_id__in=list(order_items)).values(*ORDER_ITEM_VALUES):
+            order_items[item['order_id']].append(item)
+    return [getOrderJson(row, getOrderItemsWithJsonType(order_items[row['id']])) for row in rows]
+
+
+# Same as getOrdersWithJsonType for ORDER_VALUES rows, with the async ORM
+async def getOrdersWithJsonTypeAsync(rows):
+    order_items = {row['id']: [] for row in rows}
+    if order_items:
+        async for item in OrderItem.objects.filter(order_id__in=list(order_items)).values(*ORDER_ITEM_VALUES):
+            order_items[item['order_id']].append(item)
+    return [getOrderJson(row, getOrderItemsWithJsonType(order_items[row['id']])) for row in rows]
@@ -0,0 +1,161 @@
+from decimal import Decimal, InvalidOperation
+
+from asgiref.sync import sync_to_async
+from django.http import HttpRequest
+
+from LittleLemonAPI.models import Category, MenuItem
+from LittleLemonAPI.utils.config import getSetting
+from LittleLemonAPI.utils.constants import MENU_ITEM_ORDERING_FIELDS
+from LittleLemonAPI.utils.functions import getMenuItemsWithJsonType, getMenuItemValues, isRatingIncluded
+from LittleLemonAPI.utils.pagination import KeysetPaginator, PageTooDeep, getCacheKey, getCachedCount, getCachedCountAsync, getCursorLinks, getNumberedPage, getNumberedPageAsync, getPageLinks, getPageSize
+from LittleLemonAPI.utils.search import getRankedPage, getRankedPageAsync, searchMenuItems
+
+
+class InvalidMenuQuery(Exception):
+    pass
+
+
+PAGE_TOO_DEEP = "Page too far from the pages served before, follow the next links or page with a cursor"
+
+
+# Query params of a menu item list request, checked before anything is read
+# Raises InvalidMenuQuery for an ordering field outside
+# MENU_ITEM_ORDERING_FIELDS, a page that is not a positive number or a
+# to_price that is not a finite number.
+def getMenuItemQuery(request: HttpRequest):
+    ordering = request.GET.get('ordering')
+    # Only whitelisted fields, always ending with a unique id for keyset paging
+    ordering_fields = ordering.split(',') if ordering else []
+    for field in ordering_fields:
+        if field.lstrip('-') not in MENU_ITEM_ORDERING_FIELDS:
+            raise InvalidMenuQuery("Invalid ordering field: " + field)
+    if not any(field.lstrip('-') == 'id' for field in ordering_fields):
+        ordering_fields.append('id')
+    try:
+        page = int(request.GET.get('page', '1'))
+    except ValueError:
+        raise InvalidMenuQuery("Invalid page")
+    if page < 1:
+        raise InvalidMenuQuery("Invalid page")
+    to_price = request.GET.get('to_price')
+    if to_price:
+        try:
+            to_price = Decimal(to_price)
+        except InvalidOperation:
+            raise InvalidMenuQuery("Invalid to_price")
+        if not to_price.is_finite():
+            raise InvalidMenuQuery("Invalid to_price")
+    return {
+        "category": request.GET.get('category'),
+        "to_price": to_price,
+        "search": request.GET.get('search'),
+        "ordering": ordering,
+        "ordering_fields": ordering_fields,
+        "cursor": request.GET.get('cursor'),
+        "page": page,
+        "perpage": getPageSize(request, getSetting('MENU_ITEMS_PAGE_SIZE'), getSetting('MENU_ITEMS_MAX_PAGE_SIZE')),
+        "include_rating": isRatingIncluded(request),
+    }
+
+
+# Ids of the categories matching the query's category, None without one
+# The few matching categories are resolved first so items are filtered on
+# the indexed category_id
+def getCategoryIds(query: dict):
+    if not query['category']:
+        return None
+    return Category.objects.filter(title__contains=query['category']).values_list('id', flat=True)
+
+
+# .values() rows of the menu items matching the query's filters, serialized
+# flat; the search is applied by the caller
+def getMenuItemRows(query: dict, category_ids):
+    menu_items = MenuItem.objects.all()
+    if category_ids is not None:
+        menu_items = menu_items.filter(category_id__in=category_ids)
+    if query['to_price']:
+        menu_items = menu_items.filter(price__lte=query['to_price'])
+    return menu_items.values(*getMenuItemValues(query['include_rating']))
+
+
+# Count and page bookmarks are cached per filter combination
+def getMenuItemFilters(query: dict, version):
+    return {"category": query['category'], "to_price": query['to_price'], "search": query['search'],
+            "version": version}
+
+
+def getBookmarkKey(query: dict, version):
+    return getCacheKey("menu-items:bookmark", dict(getMenuItemFilters(query, version),
+                                                   ordering=query['ordering_fields'], perpage=query['perpage']))
+
+
+def getCountKey(query: dict, version):
+    return getCacheKey("menu-items:count", getMenuItemFilters(query, version))
+
+
+def getMenuItemListJson(query: dict, rows, count: int, links):
+    return {
+        "count": count,
+        "previous": links[0],
+        "next": links[1],
+        "result": getMenuItemsWithJsonType(rows, query['include_rating'])
+    }
+
+
+# Get the payload of a menu item list request
+# Search results without an ordering come most relevant first, paged by
+# number; in another order they are the SEARCH_MAX_RESULTS most relevant.
+# An empty cursor param starts keyset paging from the first page; other
+# pages are numbered and seek from their cached bookmarks.
+# Raises InvalidCursor for a cursor that does not decode and InvalidMenuQuery
+# for a numbered page more than MENU_ITEMS_MAX_OFFSET rows from any bookmark.
+def getMenuItemList(request: HttpRequest, query: dict, version):
+    category_ids = getCategoryIds(query)
+    if category_ids is not None:
+        category_ids = list(category_ids)
+    rows = getMenuItemRows(query, category_ids)
+    if query['search'] and not query['ordering']:
+        page, count, has_next = getRankedPage(rows, query['search'], query['page'], query['perpage'])
+        return getMenuItemListJson(query, page, count, getPageLinks(request, query['page'], has_next))
+    if query['search']:
+        rows = rows.filter(pk__in=searchMenuItems(query['search'], rows))
+    paginator = KeysetPaginator(rows, ordering=query['ordering_fields'], page_size=query['perpage'])
+    if query['cursor'] is not None:
+        page, next_cursor, previous_cursor = paginator.paginate(query['cursor'])
+        links = getCursorLinks(request, next_cursor, previous_cursor)
+    else:
+        try:
+            page, has_next = getNumberedPage(paginator, query['page'], getBookmarkKey(query, version),
+                                             getSetting('MENU_ITEMS_BOOKMARK_TIMEOUT'),
+                                             getSetting('MENU_ITEMS_MAX_OFFSET'))
+        except PageTooDeep:
+            raise InvalidMenuQuery(PAGE_TOO_DEEP)
+        links = getPageLinks(request, query['page'], has_next)
+    count = getCachedCount(rows, getCountKey(query, version), getSetting('MENU_ITEMS_COUNT_CACHE_TIMEOUT'))
+    return getMenuItemListJson(query, page, count, links)
+
+
+async def getMenuItemListAsync(request: HttpRequest, query: dict, version):
+    category_ids = getCategoryIds(query)
+    if category_ids is not None:
+        category_ids = [category_id async for category_id in category_ids]
+    rows = getMenuItemRows(query, category_ids)
+    if query['search'] and not query['ordering']:
+        page, count, has_next = await getRankedPageAsync(rows, query['search'], query['page'], query['perpage'])
+        return getMenuItemListJson(query, page, count, getPageLinks(request, query['page'], has_next))
+    if query['search']:
+        rows = rows.filter(pk__in=await sync_to_async(searchMenuItems)(query['search'], rows))
+    paginator = KeysetPaginator(rows, ordering=query['ordering_fields'], page_size=query['perpage'])
+    if query['cursor'] is not None:
+        page, next_cursor, previous_cursor = await paginator.apaginate(query['cursor'])
+        links = getCursorLinks(request, next_cursor, previous_cursor)
+    else:
+        try:
+            page, has_next = await getNumberedPageAsync(paginator, query['page'], getBookmarkKey(query, version),
+                                                        getSetting('MENU_ITEMS_BOOKMARK_TIMEOUT'),
+                                                        getSetting('MENU_ITEMS_MAX_OFFSET'))
+        except PageTooDeep:
+            raise InvalidMenuQuery(PAGE_TOO_DEEP)
+        links = getPageLinks(request, query['page'], has_next)
+    count = await getCachedCountAsync(rows, getCountKey(query, version), getSetting('MENU_ITEMS_COUNT_CACHE_TIMEOUT'))
+    return getMenuItemListJson(query, page, count, links)
@@ -0,0 +1,131 @@
+import csv
+import io
+import json
+import re
+
+from bleach.sanitizer import Cleaner
+from django.db import connection, transaction
+from rest_framework import serializers
+
+from LittleLemonAPI.models import Category, MenuItem
+from LittleLemonAPI.serializers import MenuItemImportSerializer
+from LittleLemonAPI.utils.caching import menu_cache
+from LittleLemonAPI.utils.search import InvertedIndex
+
+
+TITLE_MAX_LENGTH = MenuItem._meta.get_field('title').max_length
+# Titles of only these characters come out of bleach unchanged, so they skip
+# its html5lib parse, the bulk of the time of a plain menu
+PLAIN_TITLE = re.compile(r"""[\w \-.,'’"!?()/+%:;#*@$€£]*""")
+
+
+# Rows of a CSV menu with the header title,price,stock,category_id
+def readCsvRows(text: str):
+    if text.startswith('\ufeff'):
+        text = text[1:]
+    return list(csv.DictReader(io.StringIO(text)))
+
+
+# Rows of a menu file, format is 'json' (a list of objects) or 'csv'
+def readMenuItemRows(text: str, format: str):
+    if format == 'csv':
+        return readCsvRows(text)
+    rows = json.loads(text)
+    if not isinstance(rows, list):
+        raise ValueError("Expected a JSON list of menu items")
+    return rows
+
+
+# Values of field for the rows whose value is in values, one IN query per chunk
+def getExisting(queryset, field: str, values, chunk_size: int):
+    values = list(values)
+    for start in range(0, len(values), chunk_size):
+        yield from queryset.filter(**{field + '__in': values[start:start + chunk_size]}).values_list(field, 'id')
+
+
+# Create and update menu items from rows of MenuItemImportSerializer fields
+# Each row is checked on its own without queries, then the batch as a whole:
+# the titles are sanitized with one bleach Cleaner, each distinct title with
+# markup characters once, the category ids are looked up and the titles
+# matched against the existing items with one IN query per chunk, and
+# titles repeated in the batch are rejected.
+# Rows whose title exists update that item (price, stock and category)
+# unless update_existing is False, which rejects them like the title
+# UniqueValidator; the others create items. Both are upserted together,
+# chunk_size rows per INSERT ... ON CONFLICT (id) DO UPDATE, all in one
+# transaction with the matched items locked. Rows with errors write nothing
+# unless partial is set, in which case the valid rows are still imported.
+# bulk_create sends no signals, so the menu cache and search index versions
+# are bumped here.
+# Returns {"created", "updated", "errors": [{"row" (1 for the first row),
+# "errors": {field: messages}}]}.
+def importMenuItems(rows, update_existing: bool = True, partial: bool = False, chunk_size: int = 1000):
+    row_serializer = MenuItemImportSerializer()
+    items, errors = [], {}
+    for row_number, row in enumerate(rows, start=1):
+        try:
+            items.append((row_number, row_serializer.to_internal_value(row)))
+        except serializers.ValidationError as error:
+            errors[row_number] = error.detail
+
+    cleaner = Cleaner()
+    titles = {}
+    for row_number, item in items:
+        title = item['title']
+        if title not in titles:
+            titles[title] = title if PLAIN_TITLE.fullmatch(title) else cleaner.clean(title)
+        item['title'] = titles[title]
+        if len(item['title']) > TITLE_MAX_LENGTH:
+            errors[row_number] = {'title': ["Ensure this field has no more than {0} characters once sanitized.".format(
+                TITLE_MAX_LENGTH)]}
+
+    with transaction.atomic():
+        category_ids = {item['category_id'] for _, item in items}
+        category_ids = {category_id for category_id, _ in getExisting(Category.objects, 'id', category_ids, chunk_size)}
+        existing = {}
+        for title, item_id in getExisting(MenuItem.objects.select_for_update(), 'title', {item['title'] for _, item in items}, chunk_size):
+            existing.setdefault(title, []).append(item_id)
+
+        first_rows = {}
+        for row_number, item in items:
+            if row_number in errors:
+                continue
+            row_errors = {}
+            if item['category_id'] not in category_ids:
+                row_errors['category_id'] = ["Invalid category id"]
+            if item['title'] in first_rows:
+                row_errors['title'] = ["Same title as row {0}".format(first_rows[item['title']])]
+            elif item['title'] in existing and not update_existing:
+                row_errors['title'] = ["menu item with this title already exists."]
+            else:
+                first_rows[item['title']] = row_number
+            if row_errors:
+                errors[row_number] = row_errors
+
+        report = [{"row": row_number, "errors": errors[row_number]} for row_number in sorted(errors)]
+        if errors and not partial:
+            return {"created": 0, "updated": 0, "errors": report}
+
+        new_items, changed_items = [], []
+        for row_number, item in items:
+            if row_number in errors:
+                continue
+            values = {'title': item['title'], 'price': item['price'], 'inventory': item['stock'],
+                      'category_id': item['category_id']}
+            if item['title'] in existing:
+                changed_items.extend(MenuItem(id=item_id, **values) for item_id in existing[item['title']])
+            else:
+                new_items.append(MenuItem(**values))
+
+        # updated_at is set by its auto_now for every row; MySQL takes no
+        # conflict target and updates on the duplicate primary key by itself
+        unique_fields = ['id'] if connection.features.supports_update_conflicts_with_target else None
+        MenuItem.objects.bulk_create(changed_items + new_items, batch_size=chunk_size, update_conflicts=True,
+                                     unique_fields=unique_fields,
+                                     update_fields=['price', 'inventory', 'category', 'updated_at'])
+        if new_items or changed_items:
+            menu_cache.invalidate()
+        if new_items:
+            # Only new items change the titles known to the search index
+            transaction.on_commit(lambda: menu_cache.bump_version(InvertedIndex.VERSION_KEY))
+    return {"created": len(new_items), "updated": len(changed_items), "errors": report}
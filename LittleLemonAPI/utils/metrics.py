@@ -0,0 +1,139 @@
+import bisect
+import contextvars
+import threading
+import time
+
+from django.db.backends.signals import connection_created
+
+
+# Upper bounds of the histogram buckets
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+# Measurements of the request running in the current thread or task
+class RequestStats:
+    __slots__ = ('started', 'queries', 'db_time', 'render_time')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.render_time = 0.0
+
+
+request_stats = contextvars.ContextVar('request_stats', default=None)
+
+
+# Database execute wrapper timing the queries of the current request
+# Installed on every connection; outside a measured request it costs one
+# context variable lookup.
+def timeQuery(execute, sql, params, many, context):
+    stats = request_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.db_time += time.perf_counter() - started
+
+
+def addQueryTimer(sender, connection, **kwargs):
+    if timeQuery not in connection.execute_wrappers:
+        connection.execute_wrappers.append(timeQuery)
+
+
+connection_created.connect(addQueryTimer)
+
+
+# Cumulative histogram in the Prometheus sense, observations are counted in
+# the first bucket whose upper bound they do not exceed
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def get_samples(self):
+        total = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            yield bound, total
+
+
+# Per view histograms of the request measurements, kept in the process
+# Every worker process exports the requests it served itself.
+class RequestMetrics:
+    # name, help, buckets
+    METRICS = (
+        ('littlelemon_request_duration_seconds', "Wall time of the request", DURATION_BUCKETS),
+        ('littlelemon_request_db_seconds', "Time spent in database queries", DURATION_BUCKETS),
+        ('littlelemon_request_serialization_seconds', "Time spent rendering the response", DURATION_BUCKETS),
+        ('littlelemon_request_queries', "Database queries run", QUERY_BUCKETS),
+    )
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.series = {}
+
+    def observe(self, view: str, method: str, stats: RequestStats, duration: float):
+        values = (duration, stats.db_time, stats.render_time, stats.queries)
+        with self.lock:
+            histograms = self.series.get((view, method))
+            if histograms is None:
+                histograms = self.series[(view, method)] = [
+                    Histogram(buckets) for _, _, buckets in RequestMetrics.METRICS]
+            for histogram, value in zip(histograms, values):
+                histogram.observe(value)
+
+    def clear(self):
+        with self.lock:
+            self.series.clear()
+
+    # Prometheus text exposition format 0.0.4
+    def render(self):
+        lines = []
+        with self.lock:
+            series = sorted(self.series.items())
+            for index, (name, help_text, _) in enumerate(RequestMetrics.METRICS):
+                lines.append('# HELP {0} {1}'.format(name, help_text))
+                lines.append('# TYPE {0} histogram'.format(name))
+                for (view, method), histograms in series:
+                    labels = 'view="{0}",method="{1}"'.format(escapeLabel(view), escapeLabel(method))
+                    histogram = histograms[index]
+                    for bound, count in histogram.get_samples():
+                        lines.append('{0}_bucket{{{1},le="{2}"}} {3}'.format(name, labels, bound, count))
+                    lines.append('{0}_sum{{{1}}} {2}'.format(name, labels, histogram.sum))
+                    lines.append('{0}_count{{{1}}} {2}'.format(name, labels, sum(histogram.counts)))
+        return '\n'.join(lines) + '\n'
+
+
+def escapeLabel(value: str):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+request_metrics = RequestMetrics()
+
+
+# Label of the view a request was resolved to, its URL pattern
+def getViewLabel(request):
+    resolver_match = getattr(request, 'resolver_match', None)
+    if resolver_match is None:
+        return 'unmatched'
+    return '/' + resolver_match.route
+
+
+# Server-Timing header value of a request, durations in milliseconds
+def getServerTiming(stats: RequestStats, duration: float):
+    return 'db;dur={0:.2f};desc="{1} queries", serialize;dur={2:.2f}, total;dur={3:.2f}'.format(
+        stats.db_time * 1000, stats.queries, stats.render_time * 1000, duration * 1000)
@@ -0,0 +1,146 @@
+from collections import defaultdict
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Max
+from django.http import HttpRequest
+from django.utils import timezone
+
+from LittleLemonAPI.models import Order
+from LittleLemonAPI.utils.caching import menu_cache
+from LittleLemonAPI.utils.conditional import ORDERS_VERSION_KEY, getETag
+from LittleLemonAPI.utils.config import getSetting
+from LittleLemonAPI.utils.constants import GroupName
+from LittleLemonAPI.utils.functions import getOrdersWithJsonType, getOrdersWithJsonTypeAsync, ORDER_VALUES
+from LittleLemonAPI.utils.pagination import KeysetPaginator, getCachedCount, getCachedCountAsync, getCursorLinks, getPageSize
+
+
+# Why a validated order change may not be applied, None when it may
+# delivery_person is the acting delivery crew member, None for a manager
+def getOrderChangeError(change, order, delivery_person: User, crew_ids):
+    if order is None:
+        return "Not found."
+    if delivery_person is not None:
+        if 'delivery_crew' in change:
+            return "Only a manager can assign orders"
+        if order['delivery_crew_id'] != delivery_person.id:
+            return "The order is not assigned to you"
+        return None
+    if 'delivery_crew' in change:
+        if change['delivery_crew'] not in crew_ids:
+            return "Must belong to Delivery crew"
+        if order['delivery_crew_id'] not in (None, change['delivery_crew']):
+            return "Order already assigned to another delivery person"
+    return None
+
+
+# Apply validated OrderBatchSerializer changes in one transaction
+# One query reads and locks every order, which is all the authorization
+# needs, and one more checks the delivery crew ids. The orders are then
+# grouped by their new (status, delivery_crew) and each group is a single
+# UPDATE, so every order is written once and a whole delivery run marked
+# delivered is one statement. delivery_person is the acting delivery crew
+# member, who may only change the status of their own orders; None acts
+# as a manager.
+# Returns {"id", "result": "updated"} or {"id", "result": "error",
+# "message"} for every change, in the order given.
+def updateOrders(changes, delivery_person: User = None):
+    with transaction.atomic():
+        orders = {
+            order['id']: order
+            for order in Order.objects.select_for_update()
+            .filter(id__in=[change['id'] for change in changes])
+            .values('id', 'status', 'delivery_crew_id')
+        }
+        crew_ids = {change['delivery_crew'] for change in changes if 'delivery_crew' in change}
+        if crew_ids and delivery_person is None:
+            crew_ids = set(User.objects.filter(id__in=crew_ids, groups__name=GroupName().DELIVERY_CREW)
+                           .values_list('id', flat=True))
+
+        results = []
+        groups = defaultdict(list)
+        for change in changes:
+            order = orders.get(change['id'])
+            error = getOrderChangeError(change, order, delivery_person, crew_ids)
+            if error is not None:
+                results.append({"id": change['id'], "result": "error", "message": error})
+                continue
+            groups[(change.get('status', order['status']),
+                    change.get('delivery_crew', order['delivery_crew_id']))].append(change['id'])
+            results.append({"id": change['id'], "result": "updated"})
+
+        now = timezone.now()
+        for (order_status, delivery_crew_id), order_ids in groups.items():
+            Order.objects.filter(id__in=order_ids).update(
+                status=order_status, delivery_crew_id=delivery_crew_id, updated_at=now)
+    return results
+
+
+# Orders of the order list and the key their count is cached under: every
+# order for a manager, the assigned ones for delivery crew and their own
+# for a customer
+def getOrderListScope(user: User, is_manager: bool, is_delivery_crew: bool):
+    if is_manager:
+        return Order.objects.all(), "orders:count:all"
+    if is_delivery_crew:
+        return Order.objects.all().filter(delivery_crew=user), "orders:count:delivery-crew:{0}".format(user.id)
+    return Order.objects.all().filter(user=user), "orders:count:user:{0}".format(user.id)
+
+
+def getOrderListEtag(request: HttpRequest, count_key: str, last_updated, version, orders_modified):
+    etag = getETag(request, count_key, last_updated, version)
+    last_modified = max([timestamp for timestamp in (
+        last_updated.timestamp() if last_updated else None,
+        orders_modified) if timestamp is not None], default=None)
+    return etag, last_modified
+
+
+# ETag and Last-Modified of an order list
+# Validated against the latest change in the scope's orders and the
+# version bumped by deletions, with one aggregate on updated_at
+def getOrderListValidators(request: HttpRequest, orders, count_key: str):
+    last_updated = orders.aggregate(last_updated=Max('updated_at'))['last_updated']
+    return getOrderListEtag(request, count_key, last_updated, menu_cache.get_version(ORDERS_VERSION_KEY),
+                            menu_cache.get_modified(ORDERS_VERSION_KEY))
+
+
+async def getOrderListValidatorsAsync(request: HttpRequest, orders, count_key: str):
+    last_updated = (await orders.aaggregate(last_updated=Max('updated_at')))['last_updated']
+    return getOrderListEtag(request, count_key, last_updated, await menu_cache.aget_version(ORDERS_VERSION_KEY),
+                            await menu_cache.aget_modified(ORDERS_VERSION_KEY))
+
+
+# Newest first, paged with a (date, id) cursor
+def getOrderPaginator(request: HttpRequest, orders):
+    return KeysetPaginator(
+        orders.values(*ORDER_VALUES),
+        ordering=('-date', '-id'),
+        page_size=getPageSize(request, getSetting('ORDERS_PAGE_SIZE'), getSetting('ORDERS_MAX_PAGE_SIZE')))
+
+
+def getOrderListJson(request: HttpRequest, count, next_cursor, previous_cursor, result):
+    previous_url, next_url = getCursorLinks(request, next_cursor, previous_cursor)
+    return {
+        "count": count,
+        "previous": previous_url,
+        "next": next_url,
+        "result": result
+    }
+
+
+# Get the payload of an order list request, the count is left out (None)
+# when ORDERS_COUNT_CACHE_TIMEOUT is None
+# Raises InvalidCursor for a cursor that does not decode.
+def getOrderList(request: HttpRequest, orders, count_key: str):
+    orders_page, next_cursor, previous_cursor = getOrderPaginator(request, orders).paginate(request.GET.get('cursor'))
+    count_timeout = getSetting('ORDERS_COUNT_CACHE_TIMEOUT')
+    count = getCachedCount(orders, count_key, count_timeout) if count_timeout is not None else None
+    return getOrderListJson(request, count, next_cursor, previous_cursor, getOrdersWithJsonType(orders_page))
+
+
+async def getOrderListAsync(request: HttpRequest, orders, count_key: str):
+    orders_page, next_cursor, previous_cursor = await getOrderPaginator(request, orders).apaginate(
+        request.GET.get('cursor'))
+    count_timeout = getSetting('ORDERS_COUNT_CACHE_TIMEOUT')
+    count = await getCachedCountAsync(orders, count_key, count_timeout) if count_timeout is not None else None
+    return getOrderListJson(request, count, next_cursor, previous_cursor, await getOrdersWithJsonTypeAsync(orders_page))
@@ -0,0 +1,284 @@
+import base64
+import hashlib
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from urllib.parse import urlencode
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db.models import Q, QuerySet
+from django.http import HttpRequest
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class PageTooDeep(Exception):
+    pass
+
+
+# Keyset (seek) paginator
+# Pages are located with a WHERE on the ordering columns instead of OFFSET,
+# so every page costs the same index range scan no matter how deep it is.
+# The last ordering field must be unique (usually 'id' or '-id').
+# Works on model querysets and on .values() querysets that include the
+# ordering fields.
+class KeysetPaginator:
+    def __init__(self, queryset: QuerySet, ordering, page_size: int):
+        self.queryset = queryset
+        self.ordering = tuple(ordering)
+        self.page_size = page_size
+
+    @staticmethod
+    def field_name(field: str):
+        return field.lstrip('-')
+
+    def encode_cursor(self, item, reverse: bool):
+        position = []
+        for field in self.ordering:
+            name = KeysetPaginator.field_name(field)
+            value = item[name] if isinstance(item, dict) else getattr(item, name)
+            if isinstance(value, (date, datetime)):
+                value = value.isoformat()
+            elif isinstance(value, Decimal):
+                value = str(value)
+            position.append(value)
+        raw = json.dumps({"p": position, "r": reverse}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor: str):
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            data = json.loads(raw)
+            position, reverse = data['p'], bool(data['r'])
+        except (ValueError, TypeError, KeyError):
+            raise InvalidCursor()
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise InvalidCursor()
+        return position, reverse
+
+    # Rows strictly after position in the given direction, e.g. for ('-date', '-id'):
+    # date < d OR (date = d AND id < i)
+    def seek_filter(self, position, reverse: bool):
+        condition = Q()
+        for index, field in enumerate(self.ordering):
+            descending = field.startswith('-')
+            lookup = 'gt' if descending == reverse else 'lt'
+            clause = Q(**{'{0}__{1}'.format(KeysetPaginator.field_name(field), lookup): position[index]})
+            for previous_field, previous_value in zip(self.ordering[:index], position[:index]):
+                clause &= Q(**{KeysetPaginator.field_name(previous_field): previous_value})
+            condition |= clause
+        return condition
+
+    # Get (ordered queryset of the rows after a cursor, position, reverse)
+    def get_ordered_queryset(self, cursor: str = None):
+        position, reverse = (None, False) if not cursor else self.decode_cursor(cursor)
+        ordering = self.ordering
+        if reverse:
+            ordering = tuple(field[1:] if field.startswith('-') else '-' + field for field in ordering)
+        queryset = self.queryset.order_by(*ordering)
+        try:
+            if position is not None:
+                queryset = queryset.filter(self.seek_filter(position, reverse))
+        except (ValidationError, ValueError, TypeError):
+            raise InvalidCursor()
+        return queryset, position, reverse
+
+    # Get (queryset of the page plus one row, position, reverse) for a cursor
+    def get_page_queryset(self, cursor: str = None):
+        queryset, position, reverse = self.get_ordered_queryset(cursor)
+        return queryset[:self.page_size + 1], position, reverse
+
+    # Returns (items, next_cursor, previous_cursor)
+    def paginate(self, cursor: str = None):
+        queryset, position, reverse = self.get_page_queryset(cursor)
+        try:
+            items = list(queryset)
+        except (ValidationError, ValueError, TypeError):
+            # Position values that cannot be converted to the column type
+            raise InvalidCursor()
+        return self.get_page(items, position, reverse)
+
+    async def apaginate(self, cursor: str = None):
+        queryset, position, reverse = self.get_page_queryset(cursor)
+        try:
+            items = [item async for item in queryset]
+        except (ValidationError, ValueError, TypeError):
+            raise InvalidCursor()
+        return self.get_page(items, position, reverse)
+
+    def get_page(self, items, position, reverse: bool):
+        has_more = len(items) > self.page_size
+        items = items[:self.page_size]
+        if reverse:
+            items.reverse()
+
+        next_cursor = previous_cursor = None
+        if items:
+            if has_more or reverse:
+                next_cursor = self.encode_cursor(items[-1], reverse=False)
+            if (has_more and reverse) or (position is not None and not reverse):
+                previous_cursor = self.encode_cursor(items[0], reverse=True)
+        return items, next_cursor, previous_cursor
+
+
+# Get page size from the perpage query param, bounded by max_size
+def getPageSize(request: HttpRequest, default: int, max_size: int):
+    try:
+        page_size = int(request.GET.get('perpage', default))
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(page_size, max_size))
+
+
+# Build the absolute url of the current request with one query param replaced
+def getUrlWithParam(request: HttpRequest, key: str, value):
+    query_params = request.GET.copy()
+    query_params.pop(key, None)
+    if value is not None:
+        query_params[key] = value
+    url = request.build_absolute_uri(request.path)
+    if not query_params:
+        return url
+    return "{0}?{1}".format(url, urlencode(list(query_params.items())))
+
+
+# Urls of the previous and next numbered pages, None where there is none
+def getPageLinks(request: HttpRequest, page_number: int, has_next: bool):
+    previous_url = None
+    if page_number > 1:
+        previous_url = getUrlWithParam(request, 'page', page_number - 1 if page_number > 2 else None)
+    next_url = getUrlWithParam(request, 'page', page_number + 1) if has_next else None
+    return previous_url, next_url
+
+
+# Urls of the previous and next keyset pages, None where there is none
+def getCursorLinks(request: HttpRequest, next_cursor, previous_cursor):
+    previous_url = getUrlWithParam(request, 'cursor', previous_cursor) if previous_cursor else None
+    next_url = getUrlWithParam(request, 'cursor', next_cursor) if next_cursor else None
+    return previous_url, next_url
+
+
+# COUNT(*) a queryset, caching the result under cache_key for timeout seconds
+def getCachedCount(queryset: QuerySet, cache_key: str, timeout: int):
+    if not timeout:
+        return queryset.count()
+    count = cache.get(cache_key)
+    if count is None:
+        count = queryset.count()
+        cache.set(cache_key, count, timeout)
+    return count
+
+
+async def getCachedCountAsync(queryset: QuerySet, cache_key: str, timeout: int):
+    if not timeout:
+        return await queryset.acount()
+    count = await cache.aget(cache_key)
+    if count is None:
+        count = await queryset.acount()
+        await cache.aset(cache_key, count, timeout)
+    return count
+
+
+# Get a numbered page (1-based) of a keyset paginator, returns (items, has_next)
+# The cursor ending every served page is bookmarked in the cache, so walking
+# page by page seeks from the bookmark instead of counting rows with OFFSET.
+# A page without a bookmark before it seeks from the nearest bookmark at
+# most max_offset rows back, or starts from the first row when it is that
+# close to it, and offsets over the primary key only the rest of the way
+# before fetching the page rows by pk. Raises PageTooDeep for a page further
+# than max_offset rows from any bookmark, so no request scans further.
+def getNumberedPage(paginator: KeysetPaginator, page_number: int, bookmark_key: str, timeout: int,
+                    max_offset: int):
+    keys = getBookmarkKeys(bookmark_key, page_number, paginator.page_size, max_offset)
+    # Walking page by page only reads the bookmark of the previous page
+    bookmarks = {keys[0]: cache.get(keys[0])} if keys else {}
+    if keys and bookmarks[keys[0]] is None:
+        bookmarks.update(cache.get_many(keys[1:]))
+    cursor, offset = getPageStart(page_number, paginator.page_size, keys, bookmarks, max_offset)
+    if offset == 0:
+        items, next_cursor, _ = paginator.paginate(cursor)
+        has_next = next_cursor is not None
+    else:
+        ids = list(getOffsetPageIds(paginator, cursor, offset))
+        has_next = len(ids) > paginator.page_size
+        ids = ids[:paginator.page_size]
+        rows = getRowsByPk(paginator.queryset, ids)
+        items = [rows[pk] for pk in ids if pk in rows]
+    if items and has_next:
+        cache.set("{0}:{1}".format(bookmark_key, page_number),
+                  paginator.encode_cursor(items[-1], reverse=False), timeout)
+    return items, has_next
+
+
+async def getNumberedPageAsync(paginator: KeysetPaginator, page_number: int, bookmark_key: str, timeout: int,
+                               max_offset: int):
+    keys = getBookmarkKeys(bookmark_key, page_number, paginator.page_size, max_offset)
+    bookmarks = {keys[0]: await cache.aget(keys[0])} if keys else {}
+    if keys and bookmarks[keys[0]] is None:
+        bookmarks.update(await cache.aget_many(keys[1:]))
+    cursor, offset = getPageStart(page_number, paginator.page_size, keys, bookmarks, max_offset)
+    if offset == 0:
+        items, next_cursor, _ = await paginator.apaginate(cursor)
+        has_next = next_cursor is not None
+    else:
+        ids = [pk async for pk in getOffsetPageIds(paginator, cursor, offset)]
+        has_next = len(ids) > paginator.page_size
+        ids = ids[:paginator.page_size]
+        rows = await getRowsByPkAsync(paginator.queryset, ids)
+        items = [rows[pk] for pk in ids if pk in rows]
+    if items and has_next:
+        await cache.aset("{0}:{1}".format(bookmark_key, page_number),
+                         paginator.encode_cursor(items[-1], reverse=False), timeout)
+    return items, has_next
+
+
+# Keys of the bookmarks a numbered page can start from, nearest page first
+def getBookmarkKeys(bookmark_key: str, page_number: int, page_size: int, max_offset: int):
+    first_page = max(page_number - 1 - max_offset // page_size, 1)
+    return ["{0}:{1}".format(bookmark_key, number) for number in range(page_number - 1, first_page - 1, -1)]
+
+
+# Get (cursor, rows to offset after it) a numbered page starts from: the
+# nearest of the bookmarks under keys, else the first row
+def getPageStart(page_number: int, page_size: int, keys, bookmarks: dict, max_offset: int):
+    for pages_back, key in enumerate(keys):
+        if bookmarks.get(key) is not None:
+            return bookmarks[key], pages_back * page_size
+    offset = (page_number - 1) * page_size
+    if offset > max_offset:
+        raise PageTooDeep()
+    return None, offset
+
+
+# Primary keys of a numbered page plus one, offset rows after a cursor over
+# the primary key only
+def getOffsetPageIds(paginator: KeysetPaginator, cursor, offset: int):
+    queryset, _, _ = paginator.get_ordered_queryset(cursor)
+    return queryset.values_list('pk', flat=True)[offset:offset + paginator.page_size + 1]
+
+
+# Get the rows of a queryset with the given primary keys by pk
+# Like in_bulk(), which .values() querysets do not support
+def getRowsByPk(queryset: QuerySet, ids):
+    pk_name = queryset.model._meta.pk.attname
+    return {
+        row[pk_name] if isinstance(row, dict) else row.pk: row
+        for row in queryset.filter(pk__in=ids)
+    }
+
+
+async def getRowsByPkAsync(queryset: QuerySet, ids):
+    pk_name = queryset.model._meta.pk.attname
+    return {
+        row[pk_name] if isinstance(row, dict) else row.pk: row
+        async for row in queryset.filter(pk__in=ids)
+    }
+
+
+# Build a cache key that is safe for every cache backend from a dict of params
+def getCacheKey(prefix: str, params: dict):
+    raw = json.dumps(params, sort_keys=True, default=str)
+    return "{0}:{1}".format(prefix, hashlib.md5(raw.encode()).hexdigest())
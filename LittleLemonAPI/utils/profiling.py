@@ -0,0 +1,226 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import re
+import secrets
+import threading
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core import signing
+from django.core.signals import setting_changed
+from django.db import connections
+from django.utils import timezone
+
+from LittleLemonAPI.utils.config import getSetting
+
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+PROFILE_TOKEN_SALT = 'LittleLemonAPI.profiling'
+CAPTURE_ID_PATTERN = re.compile(r'\d{8}T\d{12}-[0-9a-f]{8}')
+SAMPLING_FILE = 'sampling.json'
+# Seconds a worker keeps the sampling flag before reading the file again
+SAMPLING_REFRESH = 1
+# Functions listed in the summary of a capture
+SUMMARY_LINES = 40
+
+
+# Signed value of the X-Profile header, valid for PROFILING['TOKEN_MAX_AGE'] seconds
+def getProfileToken(user):
+    return signing.dumps({'user': user.id}, salt=PROFILE_TOKEN_SALT)
+
+
+def isValidProfileToken(token: str):
+    try:
+        signing.loads(token, salt=PROFILE_TOKEN_SALT, max_age=getSetting('PROFILING').get('TOKEN_MAX_AGE', 3600))
+    except signing.BadSignature:
+        return False
+    return True
+
+
+# SQL log of one request, filled by a database execute wrapper
+# Only the statements are kept, never their parameters, so tokens and other
+# values sent by the client do not end up in the captures.
+class QueryLog:
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                "alias": context['connection'].alias,
+                "sql": sql,
+                "many": many,
+                "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+            })
+
+
+# Run a view under cProfile with the SQL of every database connection logged;
+# DRF responses are rendered inside the profile too, so serialization shows up
+def profileView(view, request, *args, **kwargs):
+    query_log = QueryLog()
+    profiler = cProfile.Profile()
+    started = time.perf_counter()
+    with ExitStack() as stack:
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(query_log))
+        profiler.enable()
+        try:
+            response = view(request, *args, **kwargs)
+            if hasattr(response, 'render') and callable(response.render):
+                response = response.render()
+        finally:
+            profiler.disable()
+    return response, profiler, query_log.queries, time.perf_counter() - started
+
+
+# Bounded ring buffer of profile captures in a directory
+# A capture is a pstats file (<id>.prof) and its metadata and SQL log
+# (<id>.json), written last so only complete captures are listed. Ids sort
+# by creation time and the oldest captures are removed beyond max_captures.
+# The directory also holds the sampling flag, so every worker on the host
+# shares it.
+class ProfileStore:
+    def __init__(self, location, max_captures: int):
+        self.location = str(location)
+        self.max_captures = max_captures
+        self.lock = threading.Lock()
+        self.sampling = None
+        self.sampling_read = None
+
+    def get_path(self, capture_id: str, extension: str):
+        return os.path.join(self.location, capture_id + extension)
+
+    def write_json(self, path: str, data):
+        temporary = '{0}.{1}.tmp'.format(path, secrets.token_hex(4))
+        with open(temporary, 'w') as file:
+            json.dump(data, file)
+        os.replace(temporary, path)
+
+    def read_json(self, path: str):
+        try:
+            with open(path) as file:
+                return json.load(file)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def get_ids(self):
+        try:
+            names = os.listdir(self.location)
+        except FileNotFoundError:
+            return []
+        return sorted(name[:-5] for name in names
+                      if name.endswith('.json') and CAPTURE_ID_PATTERN.fullmatch(name[:-5]))
+
+    def save(self, metadata: dict, profiler, queries):
+        os.makedirs(self.location, exist_ok=True)
+        capture_id = '{0}-{1}'.format(timezone.now().strftime('%Y%m%dT%H%M%S%f'), secrets.token_hex(4))
+        profiler.dump_stats(self.get_path(capture_id, '.prof'))
+
+        summary = io.StringIO()
+        pstats.Stats(profiler, stream=summary).sort_stats('cumulative').print_stats(SUMMARY_LINES)
+        capture = dict(metadata, id=capture_id, created=timezone.now().isoformat(),
+                       query_count=len(queries), db_time_ms=round(sum(query['duration_ms'] for query in queries), 3))
+        self.write_json(self.get_path(capture_id, '.json'),
+                        dict(capture, queries=queries, summary=summary.getvalue()))
+        self.prune()
+        return capture
+
+    # Remove the oldest captures beyond max_captures
+    def prune(self):
+        with self.lock:
+            capture_ids = self.get_ids()
+            for capture_id in capture_ids[:max(len(capture_ids) - self.max_captures, 0)]:
+                for extension in ('.json', '.prof'):
+                    try:
+                        os.remove(self.get_path(capture_id, extension))
+                    except FileNotFoundError:
+                        # Removed by another worker
+                        pass
+
+    # Captures newest first, without their SQL log and summary
+    def list(self):
+        captures = []
+        for capture_id in reversed(self.get_ids()):
+            capture = self.read_json(self.get_path(capture_id, '.json'))
+            if capture is not None:
+                capture.pop('queries', None)
+                capture.pop('summary', None)
+                captures.append(capture)
+        return captures
+
+    def get(self, capture_id: str):
+        if not CAPTURE_ID_PATTERN.fullmatch(capture_id):
+            return None
+        return self.read_json(self.get_path(capture_id, '.json'))
+
+    def get_profile_path(self, capture_id: str):
+        if not CAPTURE_ID_PATTERN.fullmatch(capture_id):
+            return None
+        path = self.get_path(capture_id, '.prof')
+        return path if os.path.exists(path) else None
+
+    def clear(self):
+        for capture_id in self.get_ids():
+            for extension in ('.json', '.prof'):
+                try:
+                    os.remove(self.get_path(capture_id, extension))
+                except FileNotFoundError:
+                    pass
+
+    # Sampling flag set by a manager: {"view": route or None for every view,
+    # "rate": fraction of the requests profiled, "expires": unix time}
+    # The file is read at most once every SAMPLING_REFRESH seconds, the
+    # requests in between only compare two numbers
+    def get_sampling(self):
+        now = time.monotonic()
+        if self.sampling_read is None or now - self.sampling_read >= SAMPLING_REFRESH:
+            self.sampling = self.read_json(os.path.join(self.location, SAMPLING_FILE))
+            self.sampling_read = now
+        sampling = self.sampling
+        if sampling is None or sampling['expires'] <= time.time():
+            return None
+        return sampling
+
+    def set_sampling(self, view, rate: float, seconds: int):
+        os.makedirs(self.location, exist_ok=True)
+        sampling = {"view": view, "rate": rate, "expires": time.time() + seconds}
+        self.write_json(os.path.join(self.location, SAMPLING_FILE), sampling)
+        self.sampling, self.sampling_read = sampling, time.monotonic()
+        return sampling
+
+    def clear_sampling(self):
+        try:
+            os.remove(os.path.join(self.location, SAMPLING_FILE))
+        except FileNotFoundError:
+            pass
+        self.sampling, self.sampling_read = None, time.monotonic()
+
+
+profile_store = None
+
+
+# Get the capture store configured by the PROFILING setting, kept under
+# BASE_DIR/.cache/profiles when no LOCATION is given
+def getProfileStore():
+    global profile_store
+    if profile_store is None:
+        options = getSetting('PROFILING')
+        location = options.get('LOCATION') or os.path.join(settings.BASE_DIR, '.cache', 'profiles')
+        profile_store = ProfileStore(location, options.get('MAX_CAPTURES', 50))
+    return profile_store
+
+
+def resetProfileStore(setting, **kwargs):
+    global profile_store
+    if setting == 'LITTLE_LEMON':
+        profile_store = None
+
+
+setting_changed.connect(resetProfileStore)
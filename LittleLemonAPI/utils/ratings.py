@@ -0,0 +1,81 @@
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, FloatField, Q, Sum
+from django.db.models.functions import Cast, Coalesce, NullIf
+
+from LittleLemonAPI.models import MenuItem, MenuItemRating, Rating
+
+
+RATING_VALUES = range(0, 6)
+AGGREGATE_FIELDS = ['count', 'total', 'average'] + ['rating_{0}'.format(value) for value in RATING_VALUES]
+
+
+# Average of total over count as a database expression, 0 without ratings
+def getAverageExpression(total, count):
+    return Coalesce(Cast(total, FloatField()) / NullIf(count, 0), 0, output_field=FloatField())
+
+
+# Add (delta 1) or remove (delta -1) one rating from its menu item aggregate
+# A single UPDATE with F() expressions, so concurrent ratings never lose a count.
+# The first rating of an item creates its row from the Rating table instead.
+def applyRating(menuitem_id: int, rating: int, delta: int = 1):
+    count = F('count') + delta
+    total = F('total') + rating * delta
+    updated = MenuItemRating.objects.filter(menuitem_id=menuitem_id).update(
+        # average goes first: MySQL reads columns already assigned by the same SET
+        average=getAverageExpression(total, count),
+        count=count,
+        total=total,
+        **{'rating_{0}'.format(rating): F('rating_{0}'.format(rating)) + delta}
+    )
+    if not updated and delta > 0:
+        rebuildRatingAggregates([menuitem_id])
+
+
+# Get the aggregate rows of the given menu items, or of every item, computed
+# from the Rating table with one grouped query
+def getRatingAggregates(menuitem_ids=None):
+    ratings = Rating.objects.all()
+    if menuitem_ids is not None:
+        ratings = ratings.filter(menuitem_id__in=menuitem_ids)
+    rows = list(ratings.values('menuitem_id')
+            .annotate(count=Count('id'), total=Sum('rating'),
+                      **{'rating_{0}'.format(value): Count('id', filter=Q(rating=value)) for value in RATING_VALUES})
+            .order_by())
+    # Rating.menuitem_id is not a foreign key, drop rows of deleted items
+    menu_items = MenuItem.objects.all()
+    if menuitem_ids is not None:
+        menu_items = menu_items.filter(pk__in=menuitem_ids)
+    existing_ids = set(menu_items.values_list('id', flat=True))
+    return [
+        MenuItemRating(average=(Decimal(row['total']) / row['count']).quantize(Decimal('0.01')), **row)
+        for row in rows
+        if row['menuitem_id'] in existing_ids
+    ]
+
+
+# Recompute the aggregates of some menu items, or of the whole table when
+# menuitem_ids is None, returns the number of rows written
+def rebuildRatingAggregates(menuitem_ids=None, batch_size: int = 1000):
+    aggregates = getRatingAggregates(menuitem_ids)
+    with transaction.atomic():
+        if menuitem_ids is None:
+            MenuItemRating.objects.all().delete()
+            MenuItemRating.objects.bulk_create(aggregates, batch_size=batch_size)
+        else:
+            rated_ids = [aggregate.menuitem_id for aggregate in aggregates]
+            MenuItemRating.objects.filter(menuitem_id__in=menuitem_ids).exclude(menuitem_id__in=rated_ids).delete()
+            MenuItemRating.objects.bulk_create(
+                aggregates, batch_size=batch_size, update_conflicts=True,
+                unique_fields=['menuitem'], update_fields=AGGREGATE_FIELDS)
+    return len(aggregates)
+
+
+# Get the best rated menu item aggregates with their menu items, served
+# from the (average, count) index of the aggregate table
+def getTopRated(limit: int, min_count: int = 1):
+    return list(MenuItemRating.objects
+                .filter(count__gte=min_count)
+                .select_related('menuitem')
+                .order_by('-average', '-count', '-menuitem_id')[:limit])
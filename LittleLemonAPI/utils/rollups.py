@@ -0,0 +1,128 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Count, Sum
+
+from LittleLemonAPI.models import DailyMenuItemSales, DailySales, Order, OrderItem
+
+
+ROLLUP_VALUES = ('order_count', 'quantity', 'revenue')
+CENTS = Decimal('0.01')
+
+
+# Add rows of (key values..., order_count, quantity, revenue) to a rollup
+# table with a single INSERT ... ON CONFLICT / ON DUPLICATE KEY statement
+# that sums into existing rows, so concurrent checkouts never lose an update
+# and the statement count does not depend on the number of rows.
+def addToRollup(model, key_fields, rows):
+    if not rows:
+        return
+    quote_name = connection.ops.quote_name
+    fields = [model._meta.get_field(name) for name in tuple(key_fields) + ROLLUP_VALUES]
+    columns = [quote_name(field.column) for field in fields]
+    value_columns = columns[len(key_fields):]
+    table = quote_name(model._meta.db_table)
+    if connection.vendor == 'mysql':
+        conflict = 'ON DUPLICATE KEY UPDATE ' + ', '.join(
+            '{0} = {0} + VALUES({0})'.format(column) for column in value_columns)
+    else:
+        conflict = 'ON CONFLICT ({0}) DO UPDATE SET {1}'.format(
+            ', '.join(columns[:len(key_fields)]),
+            ', '.join('{0} = {1}.{0} + excluded.{0}'.format(column, table) for column in value_columns))
+    placeholders = '({0})'.format(', '.join(['%s'] * len(columns)))
+    # The connection itself, not the proxy that looks it up on every access
+    prepare_connection = transaction.get_connection()
+    params = [field.get_db_prep_save(value, prepare_connection) for row in rows for field, value in zip(fields, row)]
+    with connection.cursor() as cursor:
+        cursor.execute('INSERT INTO {0} ({1}) VALUES {2} {3}'.format(
+            table, ', '.join(columns), ', '.join([placeholders] * len(rows)), conflict), params)
+
+
+# Add (sign 1) or remove (sign -1) one order in the rollups
+# order_items are dicts with menuitem_id, quantity and price
+def applyOrderToRollups(order_date, total, order_items, sign: int = 1):
+    quantity = sum(item['quantity'] for item in order_items)
+    addToRollup(DailySales, ('date',), [(order_date, sign, sign * quantity, sign * total)])
+    addToRollup(DailyMenuItemSales, ('date', 'menuitem'), [
+        (order_date, item['menuitem_id'], sign, sign * item['quantity'], sign * item['price'])
+        for item in order_items
+    ])
+
+
+# Apply an order to the rollups once the current transaction commits
+# Every order of a day adds to the same DailySales row, so its lock is taken
+# in a short transaction of its own after the commit rather than held until
+# the checkout or delete commits, which would queue them all on that row.
+# A failure there is logged and leaves the order out of the rollups until
+# manage.py rebuild_sales_rollups runs.
+def applyOrderToRollupsOnCommit(order_date, total, order_items, sign: int = 1):
+    def apply():
+        with transaction.atomic():
+            applyOrderToRollups(order_date, total, order_items, sign)
+    transaction.on_commit(apply, robust=True)
+
+
+# Recompute the rollups of a date range, or of all dates, from the order
+# tables with grouped queries; returns the number of days written
+# Migration 0006 backfills with a frozen copy of this grouping.
+def rebuildSalesRollups(start_date=None, end_date=None, batch_size: int = 1000):
+    orders = Order.objects.all()
+    order_items = OrderItem.objects.all()
+    if start_date:
+        orders, order_items = orders.filter(date__gte=start_date), order_items.filter(order__date__gte=start_date)
+    if end_date:
+        orders, order_items = orders.filter(date__lte=end_date), order_items.filter(order__date__lte=end_date)
+
+    days = {
+        row['date']: DailySales(date=row['date'], order_count=row['order_count'], revenue=row['revenue'] or Decimal(0))
+        for row in orders.values('date').annotate(order_count=Count('id'), revenue=Sum('total')).order_by()
+    }
+    quantities = defaultdict(int)
+    menu_item_days = []
+    for row in (order_items.values('order__date', 'menuitem_id')
+                .annotate(order_count=Count('id'), quantity=Sum('quantity'), revenue=Sum('price'))
+                .order_by().iterator(chunk_size=batch_size)):
+        quantities[row['order__date']] += row['quantity']
+        menu_item_days.append(DailyMenuItemSales(
+            date=row['order__date'], menuitem_id=row['menuitem_id'], order_count=row['order_count'],
+            quantity=row['quantity'], revenue=row['revenue']))
+    for day in days.values():
+        day.quantity = quantities[day.date]
+
+    with transaction.atomic():
+        for model in (DailySales, DailyMenuItemSales):
+            rollups = model.objects.all()
+            if start_date:
+                rollups = rollups.filter(date__gte=start_date)
+            if end_date:
+                rollups = rollups.filter(date__lte=end_date)
+            rollups.delete()
+        DailySales.objects.bulk_create(days.values(), batch_size=batch_size)
+        DailyMenuItemSales.objects.bulk_create(menu_item_days, batch_size=batch_size)
+    return len(days)
+
+
+# Get the sales of a date range from the rollups:
+# (totals, one row per day, one row per menu item best selling first)
+def getSalesReport(start_date=None, end_date=None):
+    days = DailySales.objects.all()
+    menu_item_days = DailyMenuItemSales.objects.all()
+    if start_date:
+        days, menu_item_days = days.filter(date__gte=start_date), menu_item_days.filter(date__gte=start_date)
+    if end_date:
+        days, menu_item_days = days.filter(date__lte=end_date), menu_item_days.filter(date__lte=end_date)
+    days = list(days.filter(order_count__gt=0).order_by('date').values('date', *ROLLUP_VALUES))
+    totals = {
+        "order_count": sum(day['order_count'] for day in days),
+        "quantity": sum(day['quantity'] for day in days),
+        "revenue": sum((day['revenue'] for day in days), Decimal('0.00')).quantize(CENTS),
+    }
+    menu_items = list(menu_item_days.values('menuitem_id', 'menuitem__title')
+                      .annotate(order_count=Sum('order_count'), quantity=Sum('quantity'), revenue=Sum('revenue'))
+                      .filter(order_count__gt=0)
+                      .order_by('-revenue', 'menuitem_id'))
+    # SQLite sums decimals as floats
+    for menu_item in menu_items:
+        menu_item['revenue'] = menu_item['revenue'].quantize(CENTS)
+    return totals, days, menu_items
@@ -0,0 +1,283 @@
+import bisect
+import re
+import threading
+
+from asgiref.sync import sync_to_async
+from django.core.signals import setting_changed
+from django.db import connection, transaction
+
+from LittleLemonAPI.models import MenuItem
+from LittleLemonAPI.utils.caching import menu_cache
+from LittleLemonAPI.utils.config import getSetting
+from LittleLemonAPI.utils.pagination import getRowsByPk, getRowsByPkAsync
+
+
+# Name of the SQLite FTS5 table created by migration 0002
+FTS_TABLE = "LittleLemonAPI_menuitem_fts"
+
+
+# Split text into lowercase word tokens
+def getSearchTokens(text: str):
+    return re.findall(r'\w+', text.lower())
+
+
+# In-process inverted index over menu item titles
+# Word tokens are kept sorted so a query term matches every token it is a
+# prefix of with one bisect; a trigram index additionally finds terms in the
+# middle of a word, which keeps the old title__contains behaviour.
+# The index is rebuilt when the search version in the menu cache store moves,
+# and changes made in this process are applied incrementally.
+class InvertedIndex:
+    VERSION_KEY = "menu:search-version"
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.version = None
+        self.titles = {}
+        self.postings = {}
+        self.trigrams = {}
+        self.sorted_tokens = []
+
+    @staticmethod
+    def get_trigrams(text: str):
+        return {text[i:i + 3] for i in range(len(text) - 2)}
+
+    # A rebuild passes keep_sorted=False and sorts the tokens once at the end
+    def add(self, item_id, title: str, keep_sorted: bool = True):
+        title = title.lower()
+        self.titles[item_id] = title
+        for token in set(getSearchTokens(title)):
+            if token not in self.postings:
+                self.postings[token] = set()
+                if keep_sorted:
+                    bisect.insort(self.sorted_tokens, token)
+                else:
+                    self.sorted_tokens.append(token)
+            self.postings[token].add(item_id)
+        for trigram in InvertedIndex.get_trigrams(title):
+            self.trigrams.setdefault(trigram, set()).add(item_id)
+
+    def remove(self, item_id):
+        title = self.titles.pop(item_id, None)
+        if title is None:
+            return
+        for token in set(getSearchTokens(title)):
+            ids = self.postings.get(token)
+            if ids is not None:
+                ids.discard(item_id)
+                if not ids:
+                    del self.postings[token]
+                    del self.sorted_tokens[bisect.bisect_left(self.sorted_tokens, token)]
+        for trigram in InvertedIndex.get_trigrams(title):
+            ids = self.trigrams.get(trigram)
+            if ids is not None:
+                ids.discard(item_id)
+                if not ids:
+                    del self.trigrams[trigram]
+
+    def rebuild(self, version):
+        with self.lock:
+            self.titles, self.postings, self.trigrams, self.sorted_tokens = {}, {}, {}, []
+            for item_id, title in MenuItem.objects.values_list('id', 'title').iterator(chunk_size=2000):
+                self.add(item_id, title, keep_sorted=False)
+            self.sorted_tokens.sort()
+            self.version = version
+
+    def ensure_current(self):
+        version = menu_cache.get_version(InvertedIndex.VERSION_KEY)
+        if version != self.version:
+            self.rebuild(version)
+
+    # Apply a committed change of one item, title None meaning it was deleted
+    def apply(self, item_id, title):
+        with self.lock:
+            in_sync = self.version is not None and self.version == menu_cache.get_version(InvertedIndex.VERSION_KEY)
+            if in_sync and self.titles.get(item_id) == (title.lower() if title is not None else None):
+                # Saved without a title change, every index is still current
+                return
+            self.remove(item_id)
+            if title is not None:
+                self.add(item_id, title)
+            version = menu_cache.bump_version(InvertedIndex.VERSION_KEY)
+            # Other processes rebuild on the new version, this one is already up to date
+            if in_sync:
+                self.version = version
+
+    # Score of every item matching all terms: 3 per exact word, 2 per word prefix, 1 per infix
+    def score(self, terms):
+        scores = None
+        for term in terms:
+            term_scores = {}
+            index = bisect.bisect_left(self.sorted_tokens, term)
+            while index < len(self.sorted_tokens) and self.sorted_tokens[index].startswith(term):
+                token = self.sorted_tokens[index]
+                for item_id in self.postings[token]:
+                    term_scores[item_id] = max(term_scores.get(item_id, 0), 3 if token == term else 2)
+                index += 1
+            if len(term) >= 3:
+                candidates = None
+                for trigram in InvertedIndex.get_trigrams(term):
+                    ids = self.trigrams.get(trigram, set())
+                    candidates = set(ids) if candidates is None else candidates & ids
+                for item_id in candidates or ():
+                    if item_id not in term_scores and term in self.titles[item_id]:
+                        term_scores[item_id] = 1
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {item_id: score + term_scores[item_id]
+                          for item_id, score in scores.items() if item_id in term_scores}
+            if not scores:
+                break
+        return scores or {}
+
+    # Ids of the items matching every term, most relevant first, only those
+    # of queryset when it is filtered
+    def rank(self, terms, queryset=None):
+        self.ensure_current()
+        with self.lock:
+            scores = self.score(terms)
+            ranked = sorted(scores, key=lambda item_id: (-scores[item_id], len(self.titles[item_id]), item_id))
+        if ranked and queryset is not None and queryset.query.has_filters():
+            item_ids = set(queryset.values_list('pk', flat=True))
+            ranked = [item_id for item_id in ranked if item_id in item_ids]
+        return ranked
+
+    def search(self, terms, queryset, offset: int, limit: int):
+        return self.rank(terms, queryset)[offset:offset + limit]
+
+    def count(self, terms, queryset):
+        return len(self.rank(terms, queryset))
+
+
+# Full-text index of the database, limited to the items of a queryset with
+# a subquery, so the other filters apply before any limit
+# The index only matches whole words and word prefixes; when no word
+# matches, the terms are looked for anywhere in the titles by the trigram
+# index of the in-process index, e.g. 'ake' for 'Cake'.
+class DatabaseSearchBackend:
+    TABLE = None
+    ID_COLUMN = None
+
+    # (condition, its params, ORDER BY most relevant first, its params)
+    def get_match(self, terms):
+        raise NotImplementedError
+
+    def get_condition(self, terms, queryset):
+        condition, params, order, order_params = self.get_match(terms)
+        if queryset is not None and queryset.query.has_filters():
+            subquery, subquery_params = queryset.order_by().values('pk').query.sql_with_params()
+            condition = '{0} AND {1} IN ({2})'.format(condition, self.ID_COLUMN, subquery)
+            params = params + list(subquery_params)
+        return condition, params, order, order_params
+
+    def count_words(self, terms, queryset):
+        condition, params, _, _ = self.get_condition(terms, queryset)
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM {0} WHERE {1}'.format(self.TABLE, condition), params)
+            return cursor.fetchone()[0]
+
+    def search(self, terms, queryset, offset: int, limit: int):
+        condition, params, order, order_params = self.get_condition(terms, queryset)
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT {0} FROM {1} WHERE {2} ORDER BY {3} LIMIT %s OFFSET %s'.format(
+                self.ID_COLUMN, self.TABLE, condition, order), params + order_params + [limit, offset])
+            ids = [row[0] for row in cursor.fetchall()]
+        # An empty page past the first is past the last word match, or there is none
+        if ids or (offset and self.count_words(terms, queryset)):
+            return ids
+        return search_index.search(terms, queryset, offset, limit)
+
+    def count(self, terms, queryset):
+        return self.count_words(terms, queryset) or search_index.count(terms, queryset)
+
+
+# SQLite FTS5 table kept in sync with MenuItem by triggers, ranked by bm25
+class SQLiteFTSBackend(DatabaseSearchBackend):
+    TABLE = '"{0}"'.format(FTS_TABLE)
+    ID_COLUMN = 'rowid'
+
+    def get_match(self, terms):
+        # Every term as a word prefix, with exact words counted twice so they rank first
+        match = ' AND '.join('("{0}" OR "{0}"*)'.format(term) for term in terms)
+        return '{0} MATCH %s'.format(self.TABLE), [match], 'rank', []
+
+
+# MySQL FULLTEXT index on MenuItem.title in boolean mode
+# Terms shorter than innodb_ft_min_token_size and stopwords are not indexed.
+class MySQLFullTextBackend(DatabaseSearchBackend):
+    TABLE = '`{0}`'.format(MenuItem._meta.db_table)
+    ID_COLUMN = 'id'
+
+    def get_match(self, terms):
+        # Every term required as a word prefix, exact words weigh more
+        match = ' '.join('+({0} {0}*)'.format(term) for term in terms)
+        return ('MATCH(title) AGAINST (%s IN BOOLEAN MODE)', [match],
+                'MATCH(title) AGAINST (%s IN BOOLEAN MODE) DESC, id', [match])
+
+
+search_index = InvertedIndex()
+search_backend = None
+
+
+# Pick the backend from the SEARCH_BACKEND setting:
+# 'memory', 'database' or 'auto' (database when its index exists)
+def getSearchBackend():
+    global search_backend
+    if search_backend is None:
+        name = getSetting('SEARCH_BACKEND')
+        search_backend = search_index
+        if name in ('auto', 'database'):
+            if connection.vendor == 'sqlite' and FTS_TABLE in connection.introspection.table_names():
+                search_backend = SQLiteFTSBackend()
+            elif connection.vendor == 'mysql':
+                search_backend = MySQLFullTextBackend()
+    return search_backend
+
+
+# Get the ids of the menu items of queryset matching every word of query,
+# most relevant first, from offset on and at most limit (SEARCH_MAX_RESULTS
+# by default) of them
+def searchMenuItems(query: str, queryset=None, offset: int = 0, limit: int = None):
+    terms = getSearchTokens(query)
+    if not terms:
+        return []
+    return getSearchBackend().search(terms, queryset, offset, limit or getSetting('SEARCH_MAX_RESULTS'))
+
+
+# Count the menu items of queryset matching every word of query, without a limit
+def countMenuItemMatches(query: str, queryset=None):
+    terms = getSearchTokens(query)
+    return getSearchBackend().count(terms, queryset) if terms else 0
+
+
+# Keep the in-process index in step with a committed MenuItem change
+def updateSearchIndex(item_id, title=None):
+    transaction.on_commit(lambda: search_index.apply(item_id, title))
+
+
+# Get one numbered page of the search results among the items of a
+# queryset, most relevant first, returns (items, count, has_next)
+# The page is searched for with the queryset's filters, so the count and
+# every page hold all the matches.
+def getRankedPage(queryset, query: str, page: int, page_size: int):
+    page_ids = searchMenuItems(query, queryset, (page - 1) * page_size, page_size + 1)
+    rows = getRowsByPk(queryset, page_ids[:page_size])
+    items = [rows[item_id] for item_id in page_ids[:page_size] if item_id in rows]
+    return items, countMenuItemMatches(query, queryset), len(page_ids) > page_size
+
+
+async def getRankedPageAsync(queryset, query: str, page: int, page_size: int):
+    page_ids = await sync_to_async(searchMenuItems)(query, queryset, (page - 1) * page_size, page_size + 1)
+    rows = await getRowsByPkAsync(queryset, page_ids[:page_size])
+    items = [rows[item_id] for item_id in page_ids[:page_size] if item_id in rows]
+    return items, await sync_to_async(countMenuItemMatches)(query, queryset), len(page_ids) > page_size
+
+
+def resetSearchBackend(setting, **kwargs):
+    global search_backend
+    if setting == 'LITTLE_LEMON':
+        search_backend = None
+
+
+setting_changed.connect(resetSearchBackend)
@@ -0,0 +1,171 @@
+import os
+import sqlite3
+import threading
+import time
+
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+
+from LittleLemonAPI.utils.config import getSetting
+
+
+# RETURNING came with SQLite 3.35, older libraries read the row back inside
+# an immediate transaction, which holds the write lock over both statements
+HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+
+# Key value table in a SQLite file shared by every worker process on the host
+# Each thread has its own connection, in WAL mode so readers do not block
+# on writers.
+class SQLiteStore:
+    TABLE = None
+    COLUMNS = None
+
+    def __init__(self, location):
+        self.location = str(location)
+        self.local = threading.local()
+
+    @property
+    def connection(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            directory = os.path.dirname(self.location)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.location, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS {0} ({1})'.format(self.TABLE, self.COLUMNS))
+            self.local.connection = connection
+        return connection
+
+    # Run a statement writing the row of key and return the new value of
+    # column, None when it wrote no row
+    def write_returning(self, sql: str, params, key, column: str):
+        connection = self.connection
+        if HAS_RETURNING:
+            row = connection.execute('{0} RETURNING {1}'.format(sql, column), params).fetchone()
+            return row[0] if row else None
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = None
+            if connection.execute(sql, params).rowcount:
+                row = connection.execute(
+                    'SELECT {0} FROM {1} WHERE key = ?'.format(column, self.TABLE), (key,)).fetchone()
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        return row[0] if row else None
+
+
+# Counter store in a SQLite file shared by every worker process on the host
+# Each increment is one upsert statement, which SQLite applies atomically
+# under its write lock.
+class SQLiteThrottleStore(SQLiteStore):
+    TABLE = "throttle"
+    COLUMNS = "key TEXT PRIMARY KEY, count INTEGER NOT NULL, expires REAL NOT NULL"
+    # Expired counters are purged once every this many increments
+    PURGE_INTERVAL = 1000
+
+    def __init__(self, location):
+        if sqlite3.sqlite_version_info < (3, 24, 0):
+            raise ImproperlyConfigured(
+                "THROTTLE_STORE 'sqlite' needs SQLite 3.24 or later for upserts, this Python has {0}".format(
+                    sqlite3.sqlite_version))
+        super().__init__(location)
+        self.increments = 0
+
+    def get(self, key):
+        row = self.connection.execute(
+            'SELECT count FROM {0} WHERE key = ? AND expires > ?'.format(SQLiteThrottleStore.TABLE),
+            (key, time.time())).fetchone()
+        return row[0] if row else 0
+
+    # Add delta to the counter of key and return its new value; a missing or
+    # expired counter starts from 0 and lives for timeout seconds
+    def incr(self, key, delta: int, timeout: int):
+        now = time.time()
+        self.increments += 1
+        if self.increments % SQLiteThrottleStore.PURGE_INTERVAL == 0:
+            self.connection.execute(
+                'DELETE FROM {0} WHERE expires <= ?'.format(SQLiteThrottleStore.TABLE), (now,))
+        return self.write_returning(
+            'INSERT INTO {0} (key, count, expires) VALUES (?, ?, ?) '
+            'ON CONFLICT (key) DO UPDATE SET '
+            'count = CASE WHEN expires > ? THEN count + excluded.count ELSE excluded.count END, '
+            'expires = CASE WHEN expires > ? THEN expires ELSE excluded.expires END'.format(SQLiteThrottleStore.TABLE),
+            (key, delta, now + timeout, now, now), key, 'count')
+
+    def clear(self):
+        self.connection.execute('DELETE FROM {0}'.format(SQLiteThrottleStore.TABLE))
+
+
+# Counter store on a Django cache
+# incr is atomic on the memcached, redis and locmem backends; the file and
+# database backends read and rewrite the value, so they can undercount.
+# Counters are keyed under a generation kept in the cache, so clear() drops
+# them by moving to the next generation without touching the other entries
+# of a cache the store may share with the rest of the site; the counters of
+# old generations expire on their own.
+class CacheThrottleStore:
+    GENERATION_KEY = "throttle:generation"
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def get_generation(self):
+        generation = self.cache.get(CacheThrottleStore.GENERATION_KEY)
+        if generation is None:
+            # Start from the clock so a lost generation never revives old counters
+            self.cache.add(CacheThrottleStore.GENERATION_KEY, int(time.time() * 1000), None)
+            generation = self.cache.get(CacheThrottleStore.GENERATION_KEY)
+        return generation
+
+    def make_key(self, key):
+        return "throttle:{0}:{1}".format(self.get_generation(), key)
+
+    def get(self, key):
+        return self.cache.get(self.make_key(key), 0)
+
+    def incr(self, key, delta: int, timeout: int):
+        key = self.make_key(key)
+        try:
+            return self.cache.incr(key, delta)
+        except ValueError:
+            # add is atomic too, so only one of two racing first requests creates the counter
+            self.cache.add(key, 0, timeout)
+            return self.cache.incr(key, delta)
+
+    def clear(self):
+        try:
+            self.cache.incr(CacheThrottleStore.GENERATION_KEY)
+        except ValueError:
+            self.get_generation()
+
+
+throttle_store = None
+
+
+# Get the counter store configured by the THROTTLE_STORE setting:
+# BACKEND 'sqlite' (with LOCATION) or the alias of a Django cache
+def getThrottleStore():
+    global throttle_store
+    if throttle_store is None:
+        options = getSetting('THROTTLE_STORE')
+        backend = options.get('BACKEND', 'default')
+        if backend == 'sqlite':
+            throttle_store = SQLiteThrottleStore(options['LOCATION'])
+        else:
+            throttle_store = CacheThrottleStore(caches[backend])
+    return throttle_store
+
+
+def resetThrottleStore(setting, **kwargs):
+    global throttle_store
+    if setting == 'LITTLE_LEMON':
+        throttle_store = None
+
+
+setting_changed.connect(resetThrottleStore)
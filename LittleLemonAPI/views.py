@@ -1,22 +1,38 @@
-from django.http import HttpRequest
+from django.http import FileResponse, Http404, HttpRequest, HttpResponse, StreamingHttpResponse
 from django.shortcuts import render, get_object_or_404
 from django.forms.models import model_to_dict
 from django.urls import reverse
 import json
 from rest_framework import generics, status, views, viewsets
 from .models import MenuItem, Category, Rating, Cart, Order, OrderItem
-from .serializers import MenuItemSerializer, CategorySerializer, RatingSerializer, UserSerializer, CartSerializer, OrderItemSerializer, OrderSerializer
-from rest_framework.decorators import api_view, permission_classes, throttle_classes
+from .serializers import MenuItemSerializer, MenuItemRatingSerializer, CategorySerializer, RatingSerializer, UserSerializer, CartSerializer, CartBatchSerializer, OrderBatchSerializer, OrderItemSerializer, OrderSerializer
+from rest_framework.decorators import api_view, parser_classes, permission_classes, throttle_classes
+from rest_framework.parsers import JSONParser
 from rest_framework.response import Response
 from django.core.paginator import EmptyPage, Paginator
 import bleach
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
-from rest_framework.throttling import AnonRateThrottle, UserRateThrottle
-from .throttles import TenCallsPerMinute
+from .throttles import AnonRateThrottle, UserRateThrottle, TenCallsPerMinute
+from .parsers import CSVParser
 from django.contrib.auth.models import User, Group
 from djoser.views import UserViewSet
 from .utils.constants import GroupName, ONLY_CUSTOMER_RESPONSE
-from .utils.functions import getOrderWithJsonType, isCustomer
+from .utils.functions import getOrderWithJsonType, isCustomer, isManager, isDeliveryCrew, isRatingIncluded, formatDecimal
+from .utils.pagination import InvalidCursor, getPageSize
+from .utils.config import getSetting
+from .utils.caching import menu_cache
+from .utils.cart import applyCartBatch
+from .utils.checkout import checkoutCart, InsufficientInventory
+from .utils.menu import getMenuItemList, getMenuItemQuery, InvalidMenuQuery
+from .utils.ratings import getTopRated
+from .utils.export import iterOrdersCsv, iterOrdersNdjson
+from .utils.dispatch import dispatchOrders
+from .utils.orders import updateOrders, getOrderList, getOrderListScope, getOrderListValidators
+from .utils.menu_import import importMenuItems
+from .utils.rollups import getSalesReport
+from .utils.conditional import getETag, getNotModifiedResponse, setValidators
+from .utils.metrics import PROMETHEUS_CONTENT_TYPE, request_metrics
+from .utils.profiling import getProfileStore, getProfileToken
 from datetime import date
 # Create your views here.
 
@@ -30,63 +46,33 @@ class MenuItemList(views.APIView):
     menu_item_view_name = 'menu-item-view'
     # Get menuitems list for Customer, Delivery crew, Manager
     def get(self, request: HttpRequest):
-        menu_items_list = MenuItem.objects.all()
-        menu_items_list_length = 0
+        # The catalogue version validates the page before anything is read
+        version = menu_cache.get_version()
+        etag = getETag(request, version)
+        last_modified = menu_cache.get_modified()
+        not_modified = getNotModifiedResponse(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        # Serve the whole page from the menu cache when possible
+        cache_key = menu_cache.key('list', request.build_absolute_uri(), version)
+        response_data = menu_cache.get(cache_key)
+        if response_data is not None:
+            return setValidators(Response(response_data, status=status.HTTP_200_OK), etag, last_modified)
 
-        # Query
-        category_name = request.query_params.get('category')
-        to_price = request.query_params.get('to_price')
-        search = request.query_params.get('search')
-        ordering = request.query_params.get('ordering')
-        perpage = request.query_params.get('perpage', default=2)
-        page = request.query_params.get('page', default=1)
-
-
-        if category_name:
-            menu_items_list = menu_items_list.filter(category__title__contains=category_name)
-        if to_price:
-            menu_items_list = menu_items_list.filter(price__lte=to_price)
-        if search:
-            search = bleach.clean(search)
-            menu_items_list = menu_items_list.filter(title__contains=search)
-        if ordering:
-            ordering_fields = ordering.split(',')
-            menu_items_list = menu_items_list.order_by(*ordering_fields)
-        # get size
-        menu_items_list_length = len(menu_items_list)
-
-        # Paginator
-        paginator = Paginator(menu_items_list, per_page=perpage)
         try:
-            menu_items_list = paginator.page(number=page)
-        except EmptyPage:
-            menu_items_list = []
-        
-        # Get another response value
-        query_params=request.GET.copy()
-        query_params.pop('page', None)
-        url = request.build_absolute_uri(reverse(MenuItemList.menu_item_view_name))
-        url_with_params = f"{url}?{'&'.join([f'{k}={v}' for k, v in query_params.items()])}" 
-        previous = None
-        if page == "1":
-            previous = None
-        elif page == "2":
-            previous = url_with_params
-        elif int(page) > 2:
-            previous = url_with_params + "&page={0}".format(int(page) - 1)
-    
-        serializer_items = MenuItemSerializer(menu_items_list, many=True)
-        response_data = {
-            "count": menu_items_list_length,
-            "previous": previous,
-            "next": url_with_params + "&page={0}".format(int(page) + 1),
-            "result": serializer_items.data
-        }
-        return Response(response_data, status=status.HTTP_200_OK)
+            query = getMenuItemQuery(request)
+            response_data = getMenuItemList(request, query, version)
+        except InvalidMenuQuery as e:
+            return Response({"message": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except InvalidCursor:
+            return Response({"message": "Invalid cursor"}, status=status.HTTP_400_BAD_REQUEST)
+        menu_cache.set(cache_key, response_data)
+        return setValidators(Response(response_data, status=status.HTTP_200_OK), etag, last_modified)
 
     # Create new menu item for Manager
     def post(self, request: HttpRequest):
-        if request.user.groups.filter(name=GroupName().MANAGER).exists():
+        if isManager(request=request):
             serializer_item = MenuItemSerializer(data=request.data)
             serializer_item.is_valid(raise_exception=True)
             serializer_item.save()
@@ -108,6 +94,61 @@ class MenuItemList(views.APIView):
         return Response(status=status.HTTP_403_FORBIDDEN)
 
 
+# Bulk create and update of menu items for Manager
+# The body is a JSON list of {"title", "price", "stock", "category_id"} or
+# CSV with that header; rows whose title exists update the item unless
+# ?update=false. Any invalid row fails the whole import with the per-row
+# errors, ?partial=true imports the valid rows anyway.
+@throttle_classes([UserRateThrottle, AnonRateThrottle])
+@permission_classes([IsAuthenticated])
+@parser_classes([JSONParser, CSVParser])
+class MenuItemImportView(views.APIView):
+    def post(self, request: HttpRequest):
+        if isManager(request=request) == False:
+            return Response({"message": "Area for only manager"}, status=status.HTTP_403_FORBIDDEN)
+        rows = request.data
+        if not isinstance(rows, list) or not rows:
+            return Response({"message": "Expected a non-empty list of menu items"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        max_rows = getSetting('MENU_IMPORT_MAX_ROWS')
+        if len(rows) > max_rows:
+            return Response({"message": "At most {0} menu items per import".format(max_rows)},
+                            status=status.HTTP_400_BAD_REQUEST)
+        result = importMenuItems(rows,
+                                 update_existing=request.query_params.get('update', 'true').lower() != 'false',
+                                 partial=request.query_params.get('partial', 'false').lower() == 'true',
+                                 chunk_size=getSetting('MENU_IMPORT_CHUNK_SIZE'))
+        if result['created'] == 0 and result['updated'] == 0 and result['errors']:
+            return Response({"message": "No menu items imported, see errors", **result},
+                            status=status.HTTP_400_BAD_REQUEST)
+        response_data = {
+            "message": "Created {0} and updated {1} menu items".format(result['created'], result['updated']),
+            **result
+        }
+        return Response(response_data, status=status.HTTP_200_OK)
+
+# Menu items with the best average rating, from the rating aggregates
+@throttle_classes([UserRateThrottle, AnonRateThrottle])
+@permission_classes([IsAuthenticated])
+class TopRatedMenuItemView(views.APIView):
+    def get(self, request: HttpRequest):
+        perpage = getPageSize(request, getSetting('TOP_RATED_PAGE_SIZE'), getSetting('TOP_RATED_MAX_PAGE_SIZE'))
+        try:
+            min_count = max(1, int(request.query_params.get('min_count', getSetting('TOP_RATED_MIN_COUNT'))))
+        except ValueError:
+            return Response({"message": "Invalid min_count"}, status=status.HTTP_400_BAD_REQUEST)
+        cache_key = menu_cache.key('top-rated', {"perpage": perpage, "min_count": min_count})
+        response_data = menu_cache.get(cache_key)
+        if response_data is None:
+            serializer_items = MenuItemRatingSerializer(getTopRated(perpage, min_count), many=True)
+            response_data = {
+                "count": len(serializer_items.data),
+                "result": serializer_items.data
+            }
+            menu_cache.set(cache_key, response_data)
+        return Response(response_data, status=status.HTTP_200_OK)
+
+
 # Single menuitem endpoint with generic view
 @throttle_classes([UserRateThrottle, AnonRateThrottle])
 @permission_classes([IsAuthenticated])
@@ -121,26 +162,47 @@ class SingleMenuItemView(generics.RetrieveUpdateDestroyAPIView):
             "result": response.data
         }
 
+    def get_queryset(self):
+        if self.request.method == 'GET' and isRatingIncluded(self.request):
+            return MenuItem.objects.select_related('rating_summary')
+        return MenuItem.objects.all()
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['include_rating'] = self.request.method == 'GET' and isRatingIncluded(self.request)
+        return context
+
     def get(self, request, *args, **kwargs):
-        response = super().get(request, *args, **kwargs)
-        response.data = {
-            "result": response.data
-        }
-        return response
+        version = menu_cache.get_version()
+        etag = getETag(request, version)
+        last_modified = menu_cache.get_modified()
+        not_modified = getNotModifiedResponse(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        cache_key = menu_cache.key('item', {"pk": kwargs['pk'], "include_rating": isRatingIncluded(request)}, version)
+        response_data = menu_cache.get(cache_key)
+        if response_data is None:
+            response = super().get(request, *args, **kwargs)
+            response_data = {
+                "result": response.data
+            }
+            menu_cache.set(cache_key, response_data)
+        return setValidators(Response(response_data, status=status.HTTP_200_OK), etag, last_modified)
 
     def post(self, request, *args, **kwargs):
         return Response(status=status.HTTP_403_FORBIDDEN)
 
     # Updates single menu item for Manager
     def put(self, request, *args, **kwargs):
-        if request.user.groups.filter(name=GroupName().MANAGER).exists() == False:
+        if isManager(request=request) == False:
             return Response({"message": "Area for only manager"}, status=status.HTTP_403_FORBIDDEN)
         response = super().patch(request, *args, **kwargs)
         SingleMenuItemView.update_menu_item(response)
         return response
 
     def patch(self, request, *args, **kwargs):
-        if request.user.groups.filter(name=GroupName().MANAGER).exists() == False:
+        if isManager(request=request) == False:
             return Response({"message": "Area for only manager"}, status=status.HTTP_403_FORBIDDEN)
         response = super().patch(request, *args, **kwargs)
         SingleMenuItemView.update_menu_item(response)
@@ -148,7 +210,7 @@ class SingleMenuItemView(generics.RetrieveUpdateDestroyAPIView):
 
     # Delete single menu item for Manager
     def delete(self, request, *args, **kwargs):
-        if request.user.groups.filter(name=GroupName().MANAGER).exists() == False:
+        if isManager(request=request) == False:
             return Response({"message": "Area for only manager"}, status=status.HTTP_403_FORBIDDEN)
         response = super().delete(request, *args, **kwargs)
         response.data = {'message': 'Deleted menu item'}
@@ -160,7 +222,7 @@ class SingleMenuItemView(generics.RetrieveUpdateDestroyAPIView):
 @permission_classes([IsAuthenticated])
 class ManagerListView(views.APIView):
     def get(self, request: HttpRequest):
-        if request.user.groups.filter(name=GroupName().MANAGER).exists() == False:
+        if isManager(request=request) == False:
             return Response({"message": "Area for only manager"}, status=status.HTTP_403_FORBIDDEN)
         manager_list = User.objects.all()
         manager_list = manager_list.filter(groups__name=GroupName().MANAGER)
@@ -169,11 +231,10 @@ class ManagerListView(views.APIView):
             "count": len(manager_list),
             "result": serializer_items.data
         }
-        response_data.add()
         return Response(response_data, status=status.HTTP_200_OK)
 
     def post(self, request: HttpRequest):
-        if request.user.groups.filter(name=GroupName().MANAGER).exists() == False:
+        if isManager(request=request) == False:
             return Response({"message": "Area for only manager"}, status=status.HTTP_403_FORBIDDEN)
         try:
             username = request.data['username']
@@ -191,7 +252,7 @@ class ManagerListView(views.APIView):
 @permission_classes([IsAuthenticated])
 class SingleManagerView(views.APIView):
     def delete(self, request: HttpRequest, pk):
-        if request.user.groups.filter(name=GroupName().MANAGER).exists() == False:
+        if isManager(request=request) == False:
             return Response({"message": "Area for only manager"}, status=status.HTTP_403_FORBIDDEN)
         user = get_object_or_404(User, pk=pk)
         if user.groups.filter(name=GroupName().MANAGER).exists() == False:
@@ -206,7 +267,7 @@ class SingleManagerView(views.APIView):
 @permission_classes([IsAuthenticated])
 class DeliveryCrewView(views.APIView):
     def get(self, request: HttpRequest):
-        if request.user.groups.filter(name=GroupName().MANAGER).exists() == False:
+        if isManager(request=request) == False:
             return Response({"message": "Area for only manager"}, status=status.HTTP_403_FORBIDDEN)
         delivery_crew = User.objects.all()
         delivery_crew = delivery_crew.filter(
@@ -219,7 +280,7 @@ class DeliveryCrewView(views.APIView):
         return Response(response_data, status=status.HTTP_200_OK)
 
     def post(self, request: HttpRequest):
-        if request.user.groups.filter(name=GroupName().MANAGER).exists() == False:
+        if isManager(request=request) == False:
             return Response({"message": "Area for only manager"}, status=status.HTTP_403_FORBIDDEN)
         try:
             username = request.data['username']
@@ -237,7 +298,7 @@ class DeliveryCrewView(views.APIView):
 @permission_classes([IsAuthenticated])
 class SingleDeliveryPersonView(views.APIView):
     def delete(self, request: HttpRequest, pk):
-        if request.user.groups.filter(name=GroupName().MANAGER).exists() == False:
+        if isManager(request=request) == False:
             return Response({"message": "Area for only manager"}, status=status.HTTP_403_FORBIDDEN)
         user = get_object_or_404(User, pk=pk)
         if user.groups.filter(name=GroupName().DELIVERY_CREW).exists() == False:
@@ -276,9 +337,7 @@ class CartView(generics.ListCreateAPIView):
         if isCustomer(request=request) == False:
             return ONLY_CUSTOMER_RESPONSE
         user = request.user
-        cart_items = Cart.objects.all().filter(user=user)
-        for item in cart_items:
-            item.delete()
+        Cart.objects.all().filter(user=user).delete()
         return Response({"message": "Remove all {0}'s cart items".format(user.username)}, status=status.HTTP_204_NO_CONTENT)
 
     def get_queryset(self):
@@ -286,60 +345,296 @@ class CartView(generics.ListCreateAPIView):
         return super().get_queryset().filter(user=user)
 
 
+# Add, update or remove many cart lines in one call
+@throttle_classes([UserRateThrottle, AnonRateThrottle])
+@permission_classes([IsAuthenticated])
+class CartBatchView(views.APIView):
+    def post(self, request: HttpRequest):
+        if isCustomer(request=request) == False:
+            return ONLY_CUSTOMER_RESPONSE
+        serializer = CartBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        applyCartBatch(request.user, serializer.validated_data['items'], serializer.validated_data['replace'])
+        cart_items = Cart.objects.all().filter(user=request.user)
+        serializer_items = CartSerializer(cart_items, many=True)
+        response_data = {
+            "message": "Updated cart successfully",
+            "count": len(serializer_items.data),
+            "result": serializer_items.data
+        }
+        return Response(response_data, status=status.HTTP_200_OK)
+
+
 # Order management endpoints
 @throttle_classes([UserRateThrottle, AnonRateThrottle])
 @permission_classes([IsAuthenticated])
 class OrderListView(views.APIView):
     def get(self, request: HttpRequest):
-        order = None
         # Manager get all orders
         # Customer get his orders
         # Get all orders with order items assigned to the delivery crew
-        if request.user.groups.filter(name=GroupName().MANAGER).exists():
-            orders = Order.objects.all()
-        elif request.user.groups.filter(name=GroupName().DELIVERY_CREW).exists():
-            orders = Order.objects.all().filter(delivery_crew=request.user)
-        else:
-            orders = Order.objects.all().filter(user=request.user)
-        response_data = '{}'
-        response_data = json.loads(response_data)
-        response_data['count'] = len(orders)
-        orders_value = []
-        for order in orders:
-            orders_value.append(getOrderWithJsonType(order))
-        response_data['result'] = orders_value
-        return Response(response_data, status=status.HTTP_200_OK)
+        orders, count_key = getOrderListScope(request.user, isManager(request=request), isDeliveryCrew(request=request))
+        etag, last_modified = getOrderListValidators(request, orders, count_key)
+        not_modified = getNotModifiedResponse(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        try:
+            response_data = getOrderList(request, orders, count_key)
+        except InvalidCursor:
+            return Response({"message": "Invalid cursor"}, status=status.HTTP_400_BAD_REQUEST)
+        return setValidators(Response(response_data, status=status.HTTP_200_OK), etag, last_modified)
 
     # Post
     def post(self, request: HttpRequest):
         if isCustomer(request=request) == False:
             return ONLY_CUSTOMER_RESPONSE
         current_user = request.user
-        current_user_cart_items = Cart.objects.all().filter(user=current_user)
-        if len(current_user_cart_items) == 0:
+        try:
+            order = checkoutCart(current_user)
+        except InsufficientInventory as e:
+            return Response({"message": "Not enough stock for some menu items", "errors": e.errors}, status=status.HTTP_409_CONFLICT)
+        if order is None:
             return Response({"message": "No menu item on {0}'s cart to order processing".format(current_user.username)}, status=status.HTTP_400_BAD_REQUEST)
-        # Get total price
-        total = 0
-        for item in current_user_cart_items:
-            total += item.price
-        # Create order
-        order = Order.objects.create(
-            user_id=current_user.id, total=total, date=date.today())
-        # Create order items
-        order_items = []
-        for item in current_user_cart_items:
-            order_item = OrderItem.objects.create(
-                order=order, menuitem=item.menuitem, quantity=item.quantity,  unit_price=item.unit_price,  price=item.price)
-            order_items.append(order_item)
-
-        # Clear cart items
-        for item in current_user_cart_items:
-            item.delete()
-        # print(len(current_user_cart_items))
-        # for item in current_user_cart_items:
-        #     print(item)
         return Response({"message": "Created order for user successfully"}, status=status.HTTP_201_CREATED)
 
+    # Change the status or delivery person of many orders at once
+    # {"orders": [{"id", "status", "delivery_crew"}]}; delivery crew may only
+    # change the status of their own orders. Answers with a result per order.
+    def patch(self, request: HttpRequest):
+        if isManager(request=request):
+            delivery_person = None
+        elif isDeliveryCrew(request=request):
+            delivery_person = request.user
+        else:
+            return Response({"message": "Area for only manager, delivery crew"}, status=status.HTTP_403_FORBIDDEN)
+        serializer = OrderBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = updateOrders(serializer.validated_data['orders'], delivery_person)
+        updated = sum(1 for result in results if result['result'] == 'updated')
+        response_data = {
+            "message": "Updated {0} of {1} orders".format(updated, len(results)),
+            "updated": updated,
+            "failed": len(results) - updated,
+            "results": results
+        }
+        return Response(response_data, status=status.HTTP_200_OK)
+
+
+# Assign the open orders without a delivery person to the least loaded delivery crew, for Manager
+# Optional {"limit": orders to assign, "max_load": open orders per delivery person}
+@throttle_classes([UserRateThrottle, AnonRateThrottle])
+@permission_classes([IsAuthenticated])
+class OrderDispatchView(views.APIView):
+    def post(self, request: HttpRequest):
+        if isManager(request=request) == False:
+            return Response({"message": "Area for only manager"}, status=status.HTTP_403_FORBIDDEN)
+        options = {'limit': None, 'max_load': getSetting('DISPATCH_MAX_LOAD')}
+        for name in options:
+            if request.data.get(name) is None:
+                continue
+            try:
+                options[name] = int(request.data[name])
+            except (TypeError, ValueError):
+                options[name] = 0
+            if options[name] < 1:
+                return Response({"message": "{0} must be a positive integer".format(name)},
+                                status=status.HTTP_400_BAD_REQUEST)
+        result = dispatchOrders(options['limit'], options['max_load'], getSetting('DISPATCH_BATCH_SIZE'))
+        return Response(result, status=status.HTTP_200_OK)
+
+
+# Streaming export of the order history for Manager
+# ?output=ndjson (default) or csv, optionally limited to ?start_date= / ?end_date=
+@throttle_classes([UserRateThrottle, AnonRateThrottle])
+@permission_classes([IsAuthenticated])
+class OrderExportView(views.APIView):
+    exports = {
+        'ndjson': (iterOrdersNdjson, 'application/x-ndjson'),
+        'csv': (iterOrdersCsv, 'text/csv'),
+    }
+
+    # The export is not rendered by DRF, so never refuse it for the Accept header
+    def perform_content_negotiation(self, request, force=False):
+        return super().perform_content_negotiation(request, force=True)
+
+    def get(self, request: HttpRequest):
+        if isManager(request=request) == False:
+            return Response({"message": "Area for only manager"}, status=status.HTTP_403_FORBIDDEN)
+        output = request.query_params.get('output', 'ndjson')
+        if output not in OrderExportView.exports:
+            return Response({"message": "Invalid output, use ndjson or csv"}, status=status.HTTP_400_BAD_REQUEST)
+        orders = Order.objects.all()
+        try:
+            start_date = request.query_params.get('start_date')
+            if start_date:
+                orders = orders.filter(date__gte=date.fromisoformat(start_date))
+            end_date = request.query_params.get('end_date')
+            if end_date:
+                orders = orders.filter(date__lte=date.fromisoformat(end_date))
+        except ValueError:
+            return Response({"message": "Invalid date, use YYYY-MM-DD"}, status=status.HTTP_400_BAD_REQUEST)
+
+        iter_rows, content_type = OrderExportView.exports[output]
+        response = StreamingHttpResponse(
+            iter_rows(orders, getSetting('ORDERS_EXPORT_CHUNK_SIZE')), content_type=content_type)
+        response['Content-Disposition'] = 'attachment; filename="orders-{0}-{1}.{2}"'.format(
+            start_date or 'start', end_date or 'end', output)
+        return response
+
+
+# Sales of a date range for Manager, answered from the daily rollups
+@throttle_classes([UserRateThrottle, AnonRateThrottle])
+@permission_classes([IsAuthenticated])
+class SalesReportView(views.APIView):
+    def get(self, request: HttpRequest):
+        if isManager(request=request) == False:
+            return Response({"message": "Area for only manager"}, status=status.HTTP_403_FORBIDDEN)
+        try:
+            start_date = request.query_params.get('start_date')
+            start_date = date.fromisoformat(start_date) if start_date else None
+            end_date = request.query_params.get('end_date')
+            end_date = date.fromisoformat(end_date) if end_date else None
+        except ValueError:
+            return Response({"message": "Invalid date, use YYYY-MM-DD"}, status=status.HTTP_400_BAD_REQUEST)
+
+        totals, days, menu_items = getSalesReport(start_date, end_date)
+        response_data = {
+            "start_date": start_date,
+            "end_date": end_date,
+            "totals": dict(totals, revenue=formatDecimal(totals['revenue'])),
+            "days": [dict(day, revenue=formatDecimal(day['revenue'])) for day in days],
+            "menu_items": [
+                {
+                    "menuitem_id": item['menuitem_id'],
+                    "title": item['menuitem__title'],
+                    "order_count": item['order_count'],
+                    "quantity": item['quantity'],
+                    "revenue": formatDecimal(item['revenue']),
+                }
+                for item in menu_items
+            ]
+        }
+        return Response(response_data, status=status.HTTP_200_OK)
+
+
+# Request metrics histograms of this worker in the Prometheus text format, for Manager
+@throttle_classes([UserRateThrottle, AnonRateThrottle])
+@permission_classes([IsAuthenticated])
+class MetricsView(views.APIView):
+    def get(self, request: HttpRequest):
+        if isManager(request=request) == False:
+            return Response({"message": "Area for only manager"}, status=status.HTTP_403_FORBIDDEN)
+        return HttpResponse(request_metrics.render(), content_type=PROMETHEUS_CONTENT_TYPE)
+
+
+# Profile captures of single requests, for Manager
+# Listed newest first; see RequestProfilingMiddleware for what is profiled
+@throttle_classes([UserRateThrottle, AnonRateThrottle])
+@permission_classes([IsAuthenticated])
+class ProfileListView(views.APIView):
+    def get(self, request: HttpRequest):
+        if isManager(request=request) == False:
+            return Response({"message": "Area for only manager"}, status=status.HTTP_403_FORBIDDEN)
+        if not getSetting('PROFILING').get('ENABLED', False):
+            raise Http404
+        return Response(getProfileStore().list(), status=status.HTTP_200_OK)
+
+
+# Signed value of the X-Profile header, for Manager
+# Any request sending it is profiled until the token expires.
+@throttle_classes([UserRateThrottle, AnonRateThrottle])
+@permission_classes([IsAuthenticated])
+class ProfileTokenView(views.APIView):
+    def post(self, request: HttpRequest):
+        if isManager(request=request) == False:
+            return Response({"message": "Area for only manager"}, status=status.HTTP_403_FORBIDDEN)
+        if not getSetting('PROFILING').get('ENABLED', False):
+            raise Http404
+        return Response({
+            "header": "X-Profile",
+            "token": getProfileToken(request.user),
+            "max_age": getSetting('PROFILING').get('TOKEN_MAX_AGE', 3600),
+        }, status=status.HTTP_201_CREATED)
+
+
+# Profile sampling flag, for Manager
+# PUT {"view": "/api/orders", "rate": 0.05, "minutes": 30} profiles that share
+# of the requests to the view (every view without "view") until it expires,
+# DELETE turns it off
+@throttle_classes([UserRateThrottle, AnonRateThrottle])
+@permission_classes([IsAuthenticated])
+class ProfileSamplingView(views.APIView):
+    def get(self, request: HttpRequest):
+        if isManager(request=request) == False:
+            return Response({"message": "Area for only manager"}, status=status.HTTP_403_FORBIDDEN)
+        if not getSetting('PROFILING').get('ENABLED', False):
+            raise Http404
+        return Response({"sampling": getProfileStore().get_sampling()}, status=status.HTTP_200_OK)
+
+    def put(self, request: HttpRequest):
+        if isManager(request=request) == False:
+            return Response({"message": "Area for only manager"}, status=status.HTTP_403_FORBIDDEN)
+        if not getSetting('PROFILING').get('ENABLED', False):
+            raise Http404
+        view = request.data.get('view') or None
+        try:
+            rate = float(request.data.get('rate', getSetting('PROFILING').get('SAMPLE_RATE', 0.01)))
+            minutes = int(request.data.get('minutes', 10))
+        except (TypeError, ValueError):
+            return Response({"message": "rate must be a number and minutes an integer"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if not 0 < rate <= 1:
+            return Response({"message": "rate must be above 0 and at most 1"}, status=status.HTTP_400_BAD_REQUEST)
+        if not 0 < minutes <= 24 * 60:
+            return Response({"message": "minutes must be between 1 and 1440"}, status=status.HTTP_400_BAD_REQUEST)
+        sampling = getProfileStore().set_sampling(view, rate, minutes * 60)
+        return Response({"sampling": sampling}, status=status.HTTP_200_OK)
+
+    def delete(self, request: HttpRequest):
+        if isManager(request=request) == False:
+            return Response({"message": "Area for only manager"}, status=status.HTTP_403_FORBIDDEN)
+        if not getSetting('PROFILING').get('ENABLED', False):
+            raise Http404
+        getProfileStore().clear_sampling()
+        return Response({"message": "Stopped profile sampling"}, status=status.HTTP_200_OK)
+
+
+# Single profile capture with its SQL log and the top functions by cumulative time, for Manager
+@throttle_classes([UserRateThrottle, AnonRateThrottle])
+@permission_classes([IsAuthenticated])
+class SingleProfileView(views.APIView):
+    def get(self, request: HttpRequest, capture_id: str):
+        if isManager(request=request) == False:
+            return Response({"message": "Area for only manager"}, status=status.HTTP_403_FORBIDDEN)
+        if not getSetting('PROFILING').get('ENABLED', False):
+            raise Http404
+        capture = getProfileStore().get(capture_id)
+        if capture is None:
+            raise Http404
+        return Response(capture, status=status.HTTP_200_OK)
+
+
+# Download the pstats file of a capture, for Manager
+# Load it with python -m pstats or a viewer such as snakeviz.
+@throttle_classes([UserRateThrottle, AnonRateThrottle])
+@permission_classes([IsAuthenticated])
+class ProfileDownloadView(views.APIView):
+    # The file is not rendered by DRF, so never refuse it for the Accept header
+    def perform_content_negotiation(self, request, force=False):
+        return super().perform_content_negotiation(request, force=True)
+
+    def get(self, request: HttpRequest, capture_id: str):
+        if isManager(request=request) == False:
+            return Response({"message": "Area for only manager"}, status=status.HTTP_403_FORBIDDEN)
+        if not getSetting('PROFILING').get('ENABLED', False):
+            raise Http404
+        path = getProfileStore().get_profile_path(capture_id)
+        if path is None:
+            raise Http404
+        return FileResponse(open(path, 'rb'), as_attachment=True, filename=capture_id + '.prof',
+                            content_type='application/octet-stream')
+
 
 # Single order
 @throttle_classes([UserRateThrottle, AnonRateThrottle])
@@ -376,16 +671,22 @@ class SingleOrderView(views.APIView):
     def get(self, request: HttpRequest, pk):
         if isCustomer(request=request):
             order = get_object_or_404(Order, pk=pk)
-            if order.user.id != request.user.id:
+            if order.user_id != request.user.id:
                 return Response({"message": "The order does not belong to you"}, status=status.HTTP_406_NOT_ACCEPTABLE)
+            # Order items never change after checkout, the order row validates them
+            etag = getETag(request, order.id, order.updated_at)
+            last_modified = order.updated_at.timestamp()
+            not_modified = getNotModifiedResponse(request, etag, last_modified)
+            if not_modified is not None:
+                return not_modified
             response = {
                 "result": getOrderWithJsonType(order)
             }
-            return Response(response, status=status.HTTP_200_OK)
+            return setValidators(Response(response, status=status.HTTP_200_OK), etag, last_modified)
         return Response(status=status.HTTP_403_FORBIDDEN)
 
     def put(self, request: HttpRequest, pk):
-        if request.user.groups.filter(name=GroupName().MANAGER).exists() == False:
+        if isManager(request=request) == False:
             return Response({"message": "Area for only manager"}, status=status.HTTP_403_FORBIDDEN)
         order = get_object_or_404(Order, pk=pk)
         SingleOrderView.update_order_status(request=request, order=order)
@@ -394,13 +695,13 @@ class SingleOrderView(views.APIView):
         return Response({"message": "Updated sucessfully"}, status=status.HTTP_200_OK)
 
     def patch(self, request: HttpRequest, pk):
-        if request.user.groups.filter(name=GroupName().MANAGER).exists():
+        if isManager(request=request):
             order = get_object_or_404(Order, pk=pk)
             SingleOrderView.update_order_status(request=request, order=order)
             SingleOrderView.update_order_delivery_crew(
                 request=request, order=order)
             return Response({"message": "Updated sucessfully"}, status=status.HTTP_200_OK)
-        elif request.user.groups.filter(name=GroupName().DELIVERY_CREW).exists():
+        elif isDeliveryCrew(request=request):
             order = get_object_or_404(Order, pk=pk)
             SingleOrderView.update_order_status(request=request, order=order)
             return Response({"message": "Updated sucessfully"}, status=status.HTTP_200_OK)
@@ -408,7 +709,7 @@ class SingleOrderView(views.APIView):
             return Response({"message": "Area for only manager, delivery crew"}, status=status.HTTP_403_FORBIDDEN)
 
     def delete(self, request:HttpRequest, pk):
-        if request.user.groups.filter(name=GroupName().MANAGER).exists() == False:
+        if isManager(request=request) == False:
             return Response({"message": "Area for only manager"}, status=status.HTTP_403_FORBIDDEN)
         order = get_object_or_404(Order, pk=pk)
         order.delete()
@@ -507,7 +808,7 @@ def secret(request):
 @api_view()
 @permission_classes([IsAuthenticated])
 def manager_view(request: HttpRequest):
-    if request.user.groups.filter(name='Manager').exists():
+    if isManager(request=request):
         return Response({"message": "Only manager should see this"})
     else:
         return Response({"message": "You are not authorized"}, 403)